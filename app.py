@@ -1,25 +1,104 @@
 ﻿from __future__ import annotations
 
+import atexit
+import bisect
+import contextvars
+import functools
+import hashlib
+import hmac
+import heapq
+import itertools
 import json
+import math
 import os
 import re
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout
 from datetime import datetime, timedelta
 from statistics import median
-from typing import Any, List, Optional, Tuple
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union
 
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 import firebase_admin
 from firebase_admin import credentials, db
 
+import metricas
+from historico_local import ArquivoHistorico
+from metricas import cronometrar
+from snapshot_compartilhado import LeitorSnapshot
+
 # ================= CONFIG =================
 DB_URL = os.getenv(
     "FIREBASE_DB_URL",
     "https://multiplicadores-online-default-rtdb.europe-west1.firebasedatabase.app",
 )
 SERVICE_ACCOUNT_JSON = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON", "")
+STREAM_HEARTBEAT_SEG = float(os.getenv("STREAM_HEARTBEAT_SEG", "15"))
+STREAM_INTERVALO_SEG = float(os.getenv("STREAM_INTERVALO_SEG", "2"))
+# Streams SSE abertos ao mesmo tempo neste processo pelo Flask (0 = sem limite). Cada um
+# prende uma thread do servidor; acima do limite a rota responde 503 e o painel volta ao
+# polling. Para muitos paineis abertos use asgi.py, que nao gasta thread por stream.
+STREAM_MAX_CONEXOES = int(os.getenv("STREAM_MAX_CONEXOES", "4"))
+# Resultado recem-calculado reaproveitado por requisicoes que chegam logo depois (0 = so em voo).
+COALESCER_JANELA_SEG = float(os.getenv("COALESCER_JANELA_SEG", "0"))
+# Header Server-Timing em toda resposta (senao so com ?timing=1 ou X-Server-Timing: 1).
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+HISTORICO_PATH = os.getenv("HISTORICO_PATH", "aviator/historico")
+# "listener": historico residente em memoria, atualizado por db.reference(...).listen().
+# "janela": consulta no servidor apenas os dias/rodadas mais recentes (orderByKey + limitToLast).
+# "completo": baixa o historico inteiro a cada requisicao (comportamento original).
+# "compartilhado": so le o snapshot publicado por snapshot_compartilhado.py (gunicorn multi-worker).
+HISTORICO_MODO = os.getenv("HISTORICO_MODO", "listener").strip().lower()
+JANELA_MAX_DIAS = int(os.getenv("JANELA_MAX_DIAS", "3"))
+CACHE_TIMEOUT_SEG = float(os.getenv("CACHE_TIMEOUT_SEG", "30"))
+# Copia local do historico parseado (modo listener); vazio desliga e volta a baixar a
+# arvore inteira no boot.
+HISTORICO_ARQUIVO = os.getenv("HISTORICO_ARQUIVO", os.path.join(tempfile.gettempdir(), "predit_historico"))
+HISTORICO_PERSISTIR_SEG = float(os.getenv("HISTORICO_PERSISTIR_SEG", "60"))
+HISTORICO_VIGIA_SEG = float(os.getenv("HISTORICO_VIGIA_SEG", "30"))
+# Sem nenhum evento por esse tempo, confere no banco se surgiu um dia mais novo.
+HISTORICO_SILENCIO_SEG = float(os.getenv("HISTORICO_SILENCIO_SEG", "300"))
+# Dias antigos compactados por compactacao.py (rodadas empacotadas + agregados por dia).
+ARQUIVO_PATH = os.getenv("ARQUIVO_PATH", "aviator/arquivo")
+# >0 liga a compactacao agendada no processo: mantem em HISTORICO_PATH so os ultimos N dias.
+COMPACTACAO_MANTER_DIAS = int(os.getenv("COMPACTACAO_MANTER_DIAS", "0"))
+COMPACTACAO_INTERVALO_SEG = float(os.getenv("COMPACTACAO_INTERVALO_SEG", "21600"))
+# Limites das rotas parametrizadas (/bet/<limiar>-plus e /bet/lote).
+ANALISE_JANELA_MAX = int(os.getenv("ANALISE_JANELA_MAX", "1000"))
+LOTE_MAX_COMBINACOES = int(os.getenv("LOTE_MAX_COMBINACOES", "32"))
+PREVISAO_CACHES_MAX = int(os.getenv("PREVISAO_CACHES_MAX", "64"))
+# Ingestao (POST /rodadas): desligada sem token. As rodadas aceitas vao para a memoria na
+# hora e para o Firebase em lotes (update multi-path) por uma thread de escrita.
+INGESTAO_TOKEN = os.getenv("INGESTAO_TOKEN", "")
+INGESTAO_REQUISICAO_MAX = int(os.getenv("INGESTAO_REQUISICAO_MAX", "1000"))
+INGESTAO_LOTE_MAX = int(os.getenv("INGESTAO_LOTE_MAX", "500"))
+INGESTAO_ESPERA_SEG = float(os.getenv("INGESTAO_ESPERA_SEG", "0.2"))
+INGESTAO_PENDENTES_MAX = int(os.getenv("INGESTAO_PENDENTES_MAX", "10000"))
+INGESTAO_TENTATIVAS = int(os.getenv("INGESTAO_TENTATIVAS", "8"))
+# Varios historicos no mesmo servico: "nome=caminho" separados por virgula, ex.
+# "aviator=aviator/historico,spaceman=spaceman/historico". Vazio: so o feed "principal" em
+# HISTORICO_PATH. O feed cujo caminho e HISTORICO_PATH divide memoria e cache com /bet/*.
+FEEDS = os.getenv("FEEDS", "")
+# Pool que carrega e analisa os feeds em paralelo (GET /bet/feeds) e o prazo por resposta.
+FEEDS_THREADS = int(os.getenv("FEEDS_THREADS", "4"))
+FEEDS_TIMEOUT_SEG = float(os.getenv("FEEDS_TIMEOUT_SEG", "10"))
 
 app = Flask(__name__)
 
+REGISTROS_LIDOS = metricas.REGISTRO.contador("predit_registros_lidos_total", "Linhas do historico lidas e parseadas.")
+FALHAS_PARSE = metricas.REGISTRO.contador("predit_falhas_parse_total", "Linhas do historico rejeitadas pelo parser.")
+REGRAS = metricas.REGISTRO.contador("predit_regra_total", "Previsoes servidas por regra escolhida.")
+# Zerados desde o boot: aparecem em /metrics antes da primeira carga.
+REGISTROS_LIDOS.incrementar(0)
+FALHAS_PARSE.incrementar(0)
+LATENCIA_ROTA = metricas.REGISTRO.histograma("predit_requisicao_duracao_segundos", "Duracao total por rota HTTP.")
+LATENCIA_FEED = metricas.REGISTRO.histograma("predit_feed_duracao_segundos", "Carga + analise de cada feed em /bet/feeds.")
+
 
 # ================= FIREBASE =================
 def init_firebase() -> None:
@@ -37,6 +116,20 @@ def init_firebase() -> None:
 
 
 # ================= DADOS =================
+# Horarios do historico sao "relogio de parede" do jogo (sem fuso): o epoch e contado
+# tratando o datetime ingenuo como UTC, o que o torna estavel e reversivel.
+_EPOCH = datetime(1970, 1, 1)
+_RE_LINHA = re.compile(r"([0-9.]+)x\s*-\s*(\d{2}:\d{2}:\d{2})")
+
+
+def para_epoch(dt: datetime) -> int:
+    return int((dt - _EPOCH).total_seconds())
+
+
+def de_epoch(ts: int) -> datetime:
+    return _EPOCH + timedelta(seconds=ts)
+
+
 class Registro:
     def __init__(self, dt: datetime, mult: float, raw: str):
         self.dt = dt
@@ -47,7 +140,7 @@ class Registro:
 def parse_linha(txt: str, data: str) -> Optional[Registro]:
     if not isinstance(txt, str):
         return None
-    m = re.match(r"([0-9.]+)x\s*-\s*(\d{2}:\d{2}:\d{2})", txt)
+    m = _RE_LINHA.match(txt)
     if not m:
         return None
     mult, hora = m.groups()
@@ -55,22 +148,606 @@ def parse_linha(txt: str, data: str) -> Optional[Registro]:
     return Registro(dt, float(mult), txt)
 
 
-def carregar_registros(limite: int = 60) -> List[Registro]:
-    ref = db.reference("aviator/historico").get()
-    if not isinstance(ref, dict):
-        return []
+def _base_epoch_dia(data: str) -> int:
+    return para_epoch(datetime.strptime(data, "%Y-%m-%d"))
 
-    regs: List[Registro] = []
-    for data, itens in ref.items():
-        if not isinstance(itens, dict):
+
+# Versao em lote de parse_linha para um dia inteiro: mesma gramatica e mesmos erros
+# (None para linha invalida, ValueError para hora/data fora do calendario), mas com o
+# epoch base do dia calculado uma vez e HH:MM:SS convertido por aritmetica.
+def parse_dia(itens: Dict[str, Any], data: str) -> List[Optional[Tuple[int, float, str]]]:
+    match = _RE_LINHA.match
+    base: Optional[int] = None
+    linhas: List[Optional[Tuple[int, float, str]]] = []
+    for txt in itens.values():
+        m = match(txt) if isinstance(txt, str) else None
+        if not m:
+            linhas.append(None)
             continue
+        mult, hora = m.groups()
+        h, mi, s = int(hora[0:2]), int(hora[3:5]), int(hora[6:8])
+        if h > 23 or mi > 59 or s > 59:
+            raise ValueError(f"hora invalida: {hora!r}")
+        if base is None:
+            base = _base_epoch_dia(data)
+        linhas.append((base + h * 3600 + mi * 60 + s, float(mult), txt))
+    return linhas
+
+
+# Historico em colunas: epoch (int64) e multiplicador (float64) em arrays contiguos.
+# A string "12.34x - HH:MM:SS" so e montada quando pedida (raw/raws).
+class HistoricoColunar:
+    __slots__ = ("ts", "mult")
+
+    def __init__(self, ts: Optional[array] = None, mult: Optional[array] = None):
+        self.ts = ts if ts is not None else array("q")
+        self.mult = mult if mult is not None else array("d")
+
+    @classmethod
+    def de_registros(cls, registros: Iterable[Registro]) -> HistoricoColunar:
+        col = cls()
+        for r in registros:
+            col.anexar(para_epoch(r.dt), r.mult)
+        return col
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def __getitem__(self, i: int) -> Registro:
+        return Registro(self.dt(i), self.mult[i], self.raw(i))
+
+    def __iter__(self) -> Iterator[Registro]:
+        for i in range(len(self.ts)):
+            yield self[i]
+
+    def dt(self, i: int) -> datetime:
+        return de_epoch(self.ts[i])
+
+    def raw(self, i: int) -> str:
+        return f"{_fmt_mult(self.mult[i])}x - {self.dt(i).strftime('%H:%M:%S')}"
+
+    def raws(self) -> List[str]:
+        return [self.raw(i) for i in range(len(self.ts))]
+
+    def anexar(self, ts: int, mult: float) -> None:
+        self.ts.append(ts)
+        self.mult.append(mult)
+
+    def inserir(self, ts: int, mult: float) -> None:
+        if not self.ts or self.ts[-1] <= ts:
+            self.anexar(ts, mult)
+            return
+        i = bisect.bisect_right(self.ts, ts)
+        self.ts.insert(i, ts)
+        self.mult.insert(i, mult)
+
+    def anexar_linha(self, txt: Any, data: str) -> bool:
+        r = parse_linha(txt, data)
+        if r is None:
+            return False
+        self.anexar(para_epoch(r.dt), r.mult)
+        return True
+
+    def anexar_dia(self, itens: Dict[str, Any], data: str) -> int:
+        linhas = [x for x in parse_dia(itens, data) if x is not None]
+        self.ts.extend(x[0] for x in linhas)
+        self.mult.extend(x[1] for x in linhas)
+        return len(linhas)
+
+    def ordenar(self) -> None:
+        ts = self.ts
+        ordem = sorted(range(len(ts)), key=ts.__getitem__)
+        self.ts = array("q", (ts[i] for i in ordem))
+        self.mult = array("d", (self.mult[i] for i in ordem))
+
+    def ultimos(self, limite: int) -> HistoricoColunar:
+        return HistoricoColunar(self.ts[-limite:], self.mult[-limite:])
+
+
+def _fmt_mult(mult: float) -> str:
+    # Duas casas como no banco ("12.30x") so quando nao perde nada: 9.999 nao vira "10.00".
+    curto = f"{mult:.2f}"
+    return curto if float(curto) == mult else repr(mult)
+
+
+def _como_colunar(registros: Union[HistoricoColunar, Iterable[Registro]]) -> HistoricoColunar:
+    if isinstance(registros, HistoricoColunar):
+        return registros
+    return HistoricoColunar.de_registros(registros)
+
+
+def _contar_parse(linhas: int, validas: int) -> None:
+    REGISTROS_LIDOS.incrementar(linhas)
+    if linhas > validas:
+        FALHAS_PARSE.incrementar(linhas - validas)
+
+
+def carregar_registros(limite: int = 60, path: Optional[str] = None) -> HistoricoColunar:
+    with cronometrar("fetch"):
+        ref = db.reference(path or HISTORICO_PATH).get()
+    col = HistoricoColunar()
+    if not isinstance(ref, dict):
+        return col
+
+    linhas = 0
+    with cronometrar("parse"):
+        for data, itens in ref.items():
+            if not isinstance(itens, dict):
+                continue
+            linhas += len(itens)
+            col.anexar_dia(itens, data)
+    _contar_parse(linhas, len(col))
+
+    with cronometrar("sort"):
+        col.ordenar()
+    return col.ultimos(limite)
+
+
+def carregar_registros_janela(
+    limite: int = 60, max_dias: int = JANELA_MAX_DIAS, path: Optional[str] = None
+) -> HistoricoColunar:
+    ref = db.reference(path or HISTORICO_PATH)
+    col = HistoricoColunar()
+    # Leitura shallow: so as chaves de data (uma por dia), sem o conteudo dos dias.
+    with cronometrar("fetch"):
+        datas = ref.get(shallow=True)
+    if not isinstance(datas, dict):
+        return col
+
+    for data in sorted(datas, reverse=True)[: max(1, max_dias)]:
+        faltam = limite - len(col)
+        if faltam <= 0:
+            break
+        pedir = faltam
+        while True:
+            # Chaves push do Firebase sao cronologicas: as ultimas chaves sao as ultimas rodadas.
+            with cronometrar("fetch"):
+                itens = ref.child(data).order_by_key().limit_to_last(pedir).get()
+            if not isinstance(itens, dict):
+                itens = {}
+            dia = HistoricoColunar()
+            with cronometrar("parse"):
+                dia.anexar_dia(itens, data)
+            _contar_parse(len(itens), len(dia))
+            # Linhas invalidas no recorte: amplia a consulta no mesmo dia antes de recuar um dia.
+            if len(dia) >= faltam or len(itens) < pedir:
+                break
+            pedir += faltam - len(dia)
+        col.ts.extend(dia.ts)
+        col.mult.extend(dia.mult)
+
+    with cronometrar("sort"):
+        col.ordenar()
+    return col.ultimos(limite)
+
+
+# ================= CACHE EM MEMORIA =================
+# O primeiro evento do listen() traz a arvore inteira (carga unica); depois so chegam
+# os deltas (rodadas novas/alteradas), aplicados em memoria sem reler o banco.
+# Com HISTORICO_ARQUIVO o boot parte da copia local: le o arquivo, pede ao banco so os
+# dias a partir do high-water mark e escuta apenas o dia atual e o seguinte; os dias
+# anteriores ficam congelados em _base. Uma thread vigia troca o dia escutado na virada
+# e grava no arquivo as rodadas novas.
+class HistoricoCache:
+    def __init__(self, path: str = HISTORICO_PATH, arquivo: Optional[str] = HISTORICO_ARQUIVO):
+        self.path = path
+        self.versao = 0
+        self._lock = threading.Lock()
+        self._mudou = threading.Condition(self._lock)
+        self._iniciar_lock = threading.Lock()
+        self._pronto = threading.Event()
+        self._listener: Any = None
+        self._itens: Dict[str, Dict[str, Any]] = {}
+        self._base = HistoricoColunar()
+        self._historico = HistoricoColunar()
+        self._analisador = AnalisadorIncremental(60)
+        self._sujo = False
+        self._arquivo = ArquivoHistorico(arquivo) if arquivo else None
+        # Linhas do inicio de _historico que ja estao iguais no arquivo.
+        self._persistido = 0
+        self._persistir_lock = threading.Lock()
+        self._dia: Optional[str] = None
+        self._escutas: Dict[str, Any] = {}
+        self._vigia: Optional[threading.Thread] = None
+        self._parar_vigia = threading.Event()
+        self._ultimo_evento = time.monotonic()
+
+    @property
+    def pronto(self) -> bool:
+        return self._pronto.is_set()
+
+    def iniciar(self, timeout: float = CACHE_TIMEOUT_SEG) -> bool:
+        with self._iniciar_lock:
+            if self._arquivo is not None:
+                if self._vigia is None or not self._vigia.is_alive():
+                    self._parar_vigia = threading.Event()
+                    self._vigia = threading.Thread(
+                        target=self._vigiar, args=(self._parar_vigia,), name="historico-vigia", daemon=True
+                    )
+                    self._vigia.start()
+            elif not self._listener_ativo():
+                self._pronto.clear()
+                init_firebase()
+                self._listener = db.reference(self.path).listen(self._on_evento)
+        return self._pronto.wait(timeout)
+
+    def parar(self) -> None:
+        with self._iniciar_lock:
+            self._parar_vigia.set()
+            self._vigia = None
+            if self._listener is not None:
+                self._listener.close()
+                self._listener = None
+            for escuta in self._escutas.values():
+                escuta.close()
+            self._escutas = {}
+            if self._arquivo is not None:
+                self._arquivo.fechar()
+            self._pronto.clear()
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                "pronto": self.pronto,
+                "rodadas": len(self._historico),
+                "versao": self.versao,
+                "dia_escutado": self._dia,
+                "rodadas_no_arquivo": self._arquivo.linhas if self._arquivo is not None else None,
+            }
+
+    def registros(self, limite: int = 60) -> HistoricoColunar:
+        if not self.iniciar():
+            raise RuntimeError("Historico em memoria ainda nao foi carregado do Firebase.")
+        with self._lock:
+            if self._sujo:
+                self._reconstruir()
+            return self._historico.ultimos(limite)
+
+    def janela_avaliada(self, limite: int = 60) -> Tuple[HistoricoColunar, Avaliacao]:
+        janela, versao = self.janela(limite)
+        return janela, self.avaliar_janela(janela, versao, limite)
+
+    def janela(self, limite: int = 60) -> Tuple[HistoricoColunar, int]:
+        # A janela e a versao em que ela foi tirada: a avaliacao (avaliar_janela) pode vir
+        # depois, so quando o cache de previsao nao tem o resultado.
+        if not self.iniciar():
+            raise RuntimeError("Historico em memoria ainda nao foi carregado do Firebase.")
+        with self._lock:
+            if self._sujo:
+                self._reconstruir()
+            return self._historico.ultimos(limite), self.versao
+
+    def avaliar_janela(self, janela: HistoricoColunar, versao: int, limite: int = 60) -> Avaliacao:
+        # Na janela padrao, sem evento desde `versao`, o analisador incremental (alimentado
+        # a cada evento do stream) esta exatamente nessa janela; senao avalia a janela dada.
+        with self._lock:
+            if versao == self.versao and not self._sujo and limite == self._analisador.janela:
+                return self._analisador.avaliar()
+        return avaliar(janela)
+
+    def aguardar_mudanca(self, versao: int, timeout: float) -> int:
+        with self._mudou:
+            self._mudou.wait_for(lambda: self.versao != versao, timeout)
+            return self.versao
+
+    def aplicar_local(self, data: str, itens: Dict[str, str]) -> None:
+        # Rodadas aceitas pela ingestao entram na hora; quando o listener trouxer a mesma
+        # chave com o mesmo valor, _aplicar ignora o eco.
+        with self._lock:
+            if self.pronto:
+                congelado = self._dia is not None and data < self._dia
+                for chave, txt in itens.items():
+                    if congelado:
+                        self._inserir_congelado(txt, data)
+                    else:
+                        self._aplicar([data, chave], txt)
+            self.versao += 1
+            self._mudou.notify_all()
+
+    def persistir(self) -> int:
+        # Grava no arquivo o que mudou desde a ultima vez (corta o que foi reescrito em
+        # memoria e anexa o resto). Devolve quantas linhas foram gravadas.
+        if self._arquivo is None or not self.pronto:
+            return 0
+        with self._persistir_lock:
+            return self._persistir()
+
+    def _persistir(self) -> int:
+        with self._lock:
+            if self._sujo:
+                self._reconstruir()
+            inicio, hist = self._persistido, self._historico
+            if inicio == len(hist) == self._arquivo.linhas:
+                return 0
+            ts, mult = hist.ts[inicio:], hist.mult[inicio:]
+            # Otimista: insercoes atrasadas durante a gravacao baixam o valor de novo.
+            self._persistido = len(hist)
+        try:
+            with cronometrar("persistir"):
+                gravou = self._arquivo.gravar(inicio, ts, mult)
+        except Exception:
+            with self._lock:
+                self._persistido = 0 if self._arquivo.linhas < inicio else min(self._persistido, inicio)
+            raise
+        if not gravou:
+            with self._lock:
+                self._persistido = min(self._persistido, inicio)
+            return 0
+        return len(ts)
+
+    def _listener_ativo(self) -> bool:
+        # O SDK encerra a thread do stream em caso de erro; nesse caso reabrimos.
+        return self._escuta_ativa(self._listener)
+
+    @staticmethod
+    def _escuta_ativa(escuta: Any) -> bool:
+        thread = getattr(escuta, "_thread", None)
+        return thread is not None and thread.is_alive()
+
+    # ---------- boot pela copia local ----------
+    def _vigiar(self, parar: threading.Event) -> None:
+        persistido_em = time.monotonic()
+        while not parar.is_set():
+            versao = self.versao
+            try:
+                if not self.pronto:
+                    self._aquecer()
+                    persistido_em = 0.0
+                self._escutar_dias()
+                if time.monotonic() - persistido_em >= HISTORICO_PERSISTIR_SEG:
+                    self.persistir()
+                    persistido_em = time.monotonic()
+            except Exception as e:
+                app.logger.warning("historico: falha na vigia: %s", e)
+            self.aguardar_mudanca(versao, HISTORICO_VIGIA_SEG)
+
+    def _aquecer(self) -> None:
+        init_firebase()
+        ref = db.reference(self.path)
+        with cronometrar("arquivo_local"):
+            salvo = HistoricoColunar(*self._arquivo.carregar())
+        corte = 0
+        dia_salvo = None
+        with cronometrar("fetch"):
+            if len(salvo):
+                # O dia do high-water mark e relido inteiro (edicoes e rodadas no mesmo
+                # segundo ficam iguais ao banco); os dias seguintes sao todos novos.
+                dia_salvo = de_epoch(salvo.ts[-1]).strftime("%Y-%m-%d")
+                corte = bisect.bisect_left(salvo.ts, _base_epoch_dia(dia_salvo))
+                recentes = ref.order_by_key().start_at(dia_salvo).get()
+            else:
+                recentes = ref.get()
+        itens = {}
+        if isinstance(recentes, dict):
+            itens = {d: dict(v) for d, v in recentes.items() if isinstance(v, dict)}
+        dia = max(itens, default=None) or dia_salvo or datetime.now().strftime("%Y-%m-%d")
+
+        base = HistoricoColunar(salvo.ts[:corte], salvo.mult[:corte])
+        anteriores = HistoricoColunar()
+        with cronometrar("parse"):
+            for data in [d for d in itens if d < dia]:
+                _anexar_dia_seguro(anteriores, itens.pop(data), data)
+            anteriores.ordenar()
+        base.ts.extend(anteriores.ts)
+        base.mult.extend(anteriores.mult)
+
+        with self._lock:
+            self._base = base
+            self._itens = itens
+            self._dia = dia
+            self._persistido = min(corte, self._arquivo.linhas)
+            self._reconstruir()
+            self.versao += 1
+            self._mudou.notify_all()
+        self._ultimo_evento = time.monotonic()
+        # Escutas abertas antes de liberar as requisicoes: nada chega entre a carga e o stream.
+        self._escutar_dias()
+        self._pronto.set()
+
+    def _escutar_dias(self) -> None:
+        with self._lock:
+            dia = self._dia
+        seguinte = _dia_seguinte(dia)
+        if self._itens.get(seguinte):
+            self._virar_dia(seguinte)
+            dia, seguinte = seguinte, _dia_seguinte(seguinte)
+        elif time.monotonic() - self._ultimo_evento > HISTORICO_SILENCIO_SEG:
+            # Stream parado: pode ter havido um dia inteiro sem rodadas entre o escutado e o atual.
+            self._ultimo_evento = time.monotonic()
+            datas = db.reference(self.path).get(shallow=True)
+            ultimo = max(datas, default=dia) if isinstance(datas, dict) else dia
+            if ultimo > seguinte:
+                recentes = db.reference(self.path).order_by_key().start_at(seguinte).get()
+                with self._lock:
+                    for data, valor in (recentes or {}).items():
+                        self._aplicar([data], valor)
+                self._virar_dia(ultimo)
+                dia, seguinte = ultimo, _dia_seguinte(ultimo)
+
+        for data in (dia, seguinte):
+            if not self._escuta_ativa(self._escutas.get(data)):
+                # Escutar um dia que ainda nao existe e valido: o primeiro evento vem vazio.
+                self._escutas[data] = db.reference(f"{self.path}/{data}").listen(
+                    lambda evento, data=data: self._on_evento(evento, [data])
+                )
+        for data in [d for d in self._escutas if d not in (dia, seguinte)]:
+            self._escutas.pop(data).close()
+
+    def _virar_dia(self, dia: str) -> None:
+        # Congela em _base tudo que e anterior ao novo dia escutado.
+        with self._lock:
+            if self._sujo:
+                self._reconstruir()
+            hist = self._historico
+            corte = bisect.bisect_left(hist.ts, _base_epoch_dia(dia))
+            self._base = HistoricoColunar(hist.ts[:corte], hist.mult[:corte])
+            self._itens = {d: v for d, v in self._itens.items() if d >= dia}
+            self._dia = dia
+
+    # ---------- eventos do stream ----------
+    def _on_evento(self, evento: Any, prefixo: Optional[List[str]] = None) -> None:
+        partes = (prefixo or []) + [p for p in (evento.path or "/").split("/") if p]
+        with self._lock:
+            if evento.event_type == "put":
+                self._aplicar(partes, evento.data)
+            elif evento.event_type == "patch" and isinstance(evento.data, dict):
+                for chave, valor in evento.data.items():
+                    self._aplicar(partes + [p for p in chave.split("/") if p], valor)
+            else:
+                return
+            self.versao += 1
+            self._mudou.notify_all()
+        self._ultimo_evento = time.monotonic()
+        if not partes:
+            self._pronto.set()
+
+    def _aplicar(self, partes: List[str], valor: Any) -> None:
+        if not partes:
+            self._itens = {}
+            if isinstance(valor, dict):
+                self._itens = {d: dict(v) for d, v in valor.items() if isinstance(v, dict)}
+            self._sujo = True
+            return
+
+        data = partes[0]
+        if self._dia is not None and data < self._dia:
+            # Dia ja congelado em _base (evento atrasado de uma escuta que acabou de sair).
+            return
+        if len(partes) == 1:
+            # Primeiro evento de uma escuta por dia repete o que o boot ja carregou.
+            if self._itens.get(data) == valor:
+                return
+            anterior = self._itens.pop(data, None)
+            if not isinstance(valor, dict):
+                self._sujo = self._sujo or bool(anterior)
+                return
+            self._itens[data] = dict(valor)
+            if anterior:
+                self._sujo = True
+                return
+            for v in valor.values():
+                self._inserir(v, data)
+            return
+
+        if len(partes) != 2:
+            return
+        chave = partes[1]
+        dia = self._itens.get(data)
+        anterior = dia.get(chave) if dia is not None else None
+        if valor is None:
+            if anterior is not None:
+                del dia[chave]
+                self._sujo = True
+            return
+        if anterior == valor:
+            return
+        self._itens.setdefault(data, {})[chave] = valor
+        if anterior is not None:
+            self._sujo = True
+            return
+        self._inserir(valor, data)
+
+    def _inserir(self, txt: Any, data: str) -> None:
+        if self._sujo:
+            # _reconstruir vai parsear (e contar) o dia inteiro.
+            return
+        try:
+            r = parse_linha(txt, data)
+        except ValueError:
+            r = None
+        _contar_parse(1, int(r is not None))
+        if r is None:
+            return
+        ts = para_epoch(r.dt)
+        hist = self._historico
+        if not hist.ts or hist.ts[-1] <= ts:
+            hist.anexar(ts, r.mult)
+            self._analisador.adicionar(ts, r.mult)
+            return
+        hist.inserir(ts, r.mult)
+        pos = bisect.bisect_right(hist.ts, ts)
+        self._persistido = min(self._persistido, pos - 1)
+        # Rodada atrasada caindo dentro da janela analisada: refaz o analisador a partir dela.
+        if len(hist) - pos < self._analisador.janela:
+            self._analisador.recarregar(hist)
+
+    def _inserir_congelado(self, txt: str, data: str) -> None:
+        # Dia anterior ao escutado: ja esta em _base e nao recebe mais eventos do stream,
+        # entao a rodada ingerida entra direto na base (sobrevive a _reconstruir) e na janela.
+        r = parse_linha(txt, data)
+        if r is None:
+            return
+        self._base.inserir(para_epoch(r.dt), r.mult)
+        self._inserir(txt, data)
+
+    def _reconstruir(self) -> None:
+        col = HistoricoColunar()
+        for data, itens in self._itens.items():
+            _anexar_dia_seguro(col, itens, data)
+        col.ordenar()
+        base = self._base
+        if len(base):
+            col = HistoricoColunar(base.ts + col.ts, base.mult + col.mult)
+        self._historico = col
+        self._analisador.recarregar(col)
+        self._persistido = min(self._persistido, len(base))
+        self._sujo = False
+
+
+def _anexar_dia_tolerante(col: HistoricoColunar, itens: Dict[str, Any], data: str) -> None:
+    try:
+        col.anexar_dia(itens, data)
+    except ValueError:
+        # Dia com hora fora do calendario: descarta so as linhas problematicas.
         for v in itens.values():
-            r = parse_linha(v, data)
-            if r:
-                regs.append(r)
+            try:
+                col.anexar_linha(v, data)
+            except ValueError:
+                continue
+
+
+def _anexar_dia_seguro(col: HistoricoColunar, itens: Dict[str, Any], data: str) -> None:
+    # Carga do servidor: conta as linhas nos contadores do /metrics. Scripts offline
+    # (backtest) usam _anexar_dia_tolerante para nao mexer nos contadores do processo.
+    antes = len(col)
+    _anexar_dia_tolerante(col, itens, data)
+    _contar_parse(len(itens), len(col) - antes)
+
+
+def _dia_seguinte(data: str) -> str:
+    return (datetime.strptime(data, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def obter_registros(limite: int = 60) -> HistoricoColunar:
+    if HISTORICO_MODO == "listener":
+        try:
+            return historico_cache.registros(limite)
+        except RuntimeError:
+            # Stream ainda sem a carga inicial: atende esta requisicao pela leitura completa.
+            pass
+    elif HISTORICO_MODO == "compartilhado":
+        snap = leitor_snapshot.ler_recente()
+        if snap is not None and len(snap["ts"]) >= limite:
+            return HistoricoColunar(array("q", snap["ts"]), array("d", snap["mult"])).ultimos(limite)
+        # Publicador ainda nao gravou, parou de regravar (snapshot velho) ou a janela pedida
+        # e maior que a publicada.
+        init_firebase()
+        return carregar_registros_janela(limite)
+    elif HISTORICO_MODO == "janela":
+        return _com_pendentes(carregar_registros_janela(limite), limite)
+    return _com_pendentes(carregar_registros(limite), limite)
+
 
-    regs.sort(key=lambda x: x.dt)
-    return regs[-limite:]
+def _com_pendentes(col: HistoricoColunar, limite: int) -> HistoricoColunar:
+    # Rodadas ingeridas que ainda nao chegaram ao Firebase entram na janela lida do banco.
+    pendentes = escritor_historico.rodadas_pendentes()
+    if not pendentes:
+        return col
+    presentes = set(zip(col.ts, col.mult))
+    for ts, mult in pendentes:
+        if (ts, mult) not in presentes:
+            col.inserir(ts, mult)
+    return col.ultimos(limite)
 
 
 def garantir_hora_futura(dt_prev: datetime, referencia: datetime, passo_segundos: int = 30) -> datetime:
@@ -85,98 +762,242 @@ def garantir_hora_futura(dt_prev: datetime, referencia: datetime, passo_segundos
 
 
 # ================= ANALISE =================
-def analisar(registros: List[Registro]) -> dict:
-    agora = datetime.now()
-    referencia_tempo = agora
-    janela_espelho_seg = 150  # 2:30
+# Parametros das regras. O padrao reproduz a analise original: alvo 10+, espelho ate
+# 2:30, regras de 4 e 5 minutos e janela de 60 rodadas.
+class ParametrosAnalise(NamedTuple):
+    limiar: float = 10
+    janela: int = 60
+    espelho_seg: int = 150
+    curta_seg: int = 240
+    longa_seg: int = 300
 
-    if not registros:
-        return {
-            "decisao": "aguardar",
-            "regra": "estatistica_real",
-            "motivo_regra": "Sem registros para analise temporal.",
-        }
 
-    altos = [r for r in registros if r.mult >= 10]
-    if not altos:
-        return {
+PARAMETROS_PADRAO = ParametrosAnalise()
+
+
+# Resultado da analise junto com o instante em que ele deixa de valer caso nao chegue
+# rodada nova (expiracao do espelho, minuto 4/5 ou o proximo segundo na estatistica).
+class Avaliacao(NamedTuple):
+    resultado: dict
+    dt_prevista: Optional[datetime]
+    valido_ate: datetime
+    # Epoch das rodadas que a regra usou como base (altos do espelho, ultimo alto nas
+    # regras de minutos e na estatistica); vazio quando nao houve alto.
+    referencias: Tuple[int, ...] = ()
+
+
+def _fmt_mmss(segundos: int) -> str:
+    return f"{segundos // 60}:{segundos % 60:02d}"
+
+
+def _fmt_minutos(segundos: int) -> str:
+    if segundos % 60:
+        return _fmt_mmss(segundos)
+    return f"{segundos // 60} minuto" if segundos == 60 else f"{segundos // 60} minutos"
+
+
+def analisar(registros: Union[HistoricoColunar, Iterable[Registro]]) -> dict:
+    return avaliar(registros).resultado
+
+
+def _aguardar_sem_dados(motivo: str) -> Avaliacao:
+    return Avaliacao(
+        {
             "decisao": "aguardar",
             "regra": "estatistica_real",
-            "motivo_regra": "Sem multiplicador 10+ no recorte.",
-        }
+            "motivo_regra": motivo,
+        },
+        None,
+        datetime.max,
+    )
+
+
+def avaliar(
+    registros: Union[HistoricoColunar, Iterable[Registro]],
+    agora: Optional[datetime] = None,
+    parametros: Optional[ParametrosAnalise] = None,
+) -> Avaliacao:
+    # Sem parametros a analise usa todos os registros recebidos (a janela e de quem chama).
+    col = _como_colunar(registros)
+    if parametros is None:
+        parametros = ParametrosAnalise(janela=max(len(col), 1))
+    return avaliar_lote(col, [parametros], agora)[parametros]
+
+
+# Varios limiares e janelas numa unica passada (de tras para frente) sobre as ultimas
+# max(janela) rodadas, que coleta as posicoes dos altos de todos os limiares; gaps,
+# intervalos e baixos so sao calculados para as combinacoes que caem na estatistica.
+def avaliar_lote(
+    registros: Union[HistoricoColunar, Iterable[Registro]],
+    combinacoes: Iterable[ParametrosAnalise],
+    agora: Optional[datetime] = None,
+) -> Dict[ParametrosAnalise, Avaliacao]:
+    col = _como_colunar(registros)
+    combinacoes = list(dict.fromkeys(combinacoes))
+    if agora is None:
+        agora = datetime.now()
+
+    n = len(col)
+    if not n:
+        return {p: _aguardar_sem_dados("Sem registros para analise temporal.") for p in combinacoes}
+
+    ts, mult = col.ts, col.mult
+    inicio = max(0, n - max(p.janela for p in combinacoes))
+    limiares = sorted({p.limiar for p in combinacoes})
+    if len(limiares) == 1:
+        # Caso comum (um limiar so): a mesma passada como compreensao.
+        limiar = limiares[0]
+        altos = {limiar: [i for i in range(n - 1, inicio - 1, -1) if mult[i] >= limiar]}
+    else:
+        altos = {limiar: [] for limiar in limiares}
+        for i in range(n - 1, inicio - 1, -1):
+            x = mult[i]
+            for limiar in limiares:
+                if x < limiar:
+                    break
+                altos[limiar].append(i)
+
+    resultado: Dict[ParametrosAnalise, Avaliacao] = {}
+    for p in combinacoes:
+        comeco = max(0, n - p.janela)
+        altos_janela = list(itertools.takewhile(lambda i: i >= comeco, altos[p.limiar]))
+        if not altos_janela:
+            resultado[p] = _aguardar_sem_dados(f"Sem multiplicador {p.limiar:g}+ no recorte.")
+            continue
+        ultimo = altos_janela[0]
+        resultado[p] = _avaliar_regras(
+            agora,
+            ts[n - 1],
+            ts[ultimo],
+            ts[altos_janela[1]] if len(altos_janela) > 1 else None,
+            _estatistica_janela(col, comeco, altos_janela, p),
+            p,
+        )
+    return resultado
+
+
+def _estatistica_janela(
+    col: HistoricoColunar, comeco: int, altos_janela: List[int], p: ParametrosAnalise
+) -> Callable[[datetime], Avaliacao]:
+    def estatistica(referencia_tempo: datetime) -> Avaliacao:
+        # ================= ESTATISTICA REAL =================
+        ts, mult, n = col.ts, col.mult, len(col)
+        ultimo = altos_janela[0]
+        gaps = [a - b for a, b in zip(altos_janela, altos_janela[1:])]
+        deltas = [d for d in (ts[i + 1] - ts[i] for i in range(comeco, n - 1)) if d > 0]
+        baixos_fracos = 0
+        baixos_medios = 0
+        for i in range(ultimo + 1, n):
+            m = mult[i]
+            if m <= 1.3:
+                baixos_fracos += 1
+            elif m <= 5:
+                baixos_medios += 1
+        return _resultado_estatistico(
+            median(gaps) if gaps else 8,
+            (n - 1) - ultimo,
+            int(median(deltas)) if deltas else 20,
+            baixos_fracos,
+            baixos_medios,
+            max(n - ultimo - 1, 1),
+            referencia_tempo,
+            p,
+        )
+
+    return estatistica
+
+
+def _avaliar_regras(
+    agora: datetime,
+    ts_recente: int,
+    ts_ultimo_alto: int,
+    ts_penultimo_alto: Optional[int],
+    estatistica: Callable[[datetime], Avaliacao],
+    parametros: ParametrosAnalise = PARAMETROS_PADRAO,
+) -> Avaliacao:
+    janela_espelho_seg = parametros.espelho_seg
+    alvo = f"{parametros.limiar:g}+"
 
     # Alinha a referencia para evitar previsoes no passado em caso de diferenca de fuso/clock.
-    referencia_tempo = max(agora, registros[-1].dt)
+    referencia_tempo = max(agora, de_epoch(ts_recente))
 
-    ultimo = altos[-1]
+    ultimo_dt = de_epoch(ts_ultimo_alto)
     # ================= REGRA DO ESPELHO (somente se o ultimo alto veio ate 2:30 apos o penultimo) =================
-    if len(altos) >= 2:
-        penultimo = altos[-2]
-        intervalo_espelho = int((ultimo.dt - penultimo.dt).total_seconds())
+    if ts_penultimo_alto is not None:
+        intervalo_espelho = ts_ultimo_alto - ts_penultimo_alto
         if 1 <= intervalo_espelho <= janela_espelho_seg:
-            dt_espelho = ultimo.dt + timedelta(seconds=intervalo_espelho)
+            dt_espelho = ultimo_dt + timedelta(seconds=intervalo_espelho)
             # Espelho vale somente ate o horario previsto pelo proprio intervalo.
             if referencia_tempo < dt_espelho:
                 dt_prev = garantir_hora_futura(dt_espelho, referencia_tempo, 30)
-                return {
-                    "decisao": "aguardar",
-                    "regra": "espelho_intervalo_altos",
-                    "motivo_regra": "Dois altos em ate 2:30; projetando pelo intervalo entre eles.",
-                    "intervalo_usado_segundos": intervalo_espelho,
-                    "hora_prevista": dt_prev.strftime("%H:%M:%S"),
-                }
+                return Avaliacao(
+                    {
+                        "decisao": "aguardar",
+                        "regra": "espelho_intervalo_altos",
+                        "motivo_regra": f"Dois altos em ate {_fmt_mmss(janela_espelho_seg)}; projetando pelo intervalo entre eles.",
+                        "intervalo_usado_segundos": intervalo_espelho,
+                        "hora_prevista": dt_prev.strftime("%H:%M:%S"),
+                    },
+                    dt_prev,
+                    dt_espelho,
+                    (ts_penultimo_alto, ts_ultimo_alto),
+                )
 
     # ================= REGRA 4-5 MINUTOS (contagem continua desde o ultimo alto) =================
-    dt_4 = ultimo.dt + timedelta(seconds=240)
-    dt_5 = ultimo.dt + timedelta(seconds=300)
+    dt_4 = ultimo_dt + timedelta(seconds=parametros.curta_seg)
+    dt_5 = ultimo_dt + timedelta(seconds=parametros.longa_seg)
 
     # Antes de chegar no minuto 4: usa regra de 4 minutos.
     if referencia_tempo < dt_4:
         dt_prev = dt_4
         dt_prev = garantir_hora_futura(dt_prev, referencia_tempo, 30)
-        return {
-            "decisao": "aguardar",
-            "regra": "regra_4_minutos",
-            "motivo_regra": "Aguardando 4 minutos desde o ultimo multiplicador 10+.",
-            "hora_prevista": dt_prev.strftime("%H:%M:%S"),
-        }
+        return Avaliacao(
+            {
+                "decisao": "aguardar",
+                "regra": "regra_4_minutos",
+                "motivo_regra": f"Aguardando {_fmt_minutos(parametros.curta_seg)} desde o ultimo multiplicador {alvo}.",
+                "hora_prevista": dt_prev.strftime("%H:%M:%S"),
+            },
+            dt_prev,
+            dt_4,
+            (ts_ultimo_alto,),
+        )
 
     # Assim que chega/passou dos 4 minutos, troca para 5 minutos.
     if referencia_tempo < dt_5:
         dt_prev = dt_5
         dt_prev = garantir_hora_futura(dt_prev, referencia_tempo, 30)
-        return {
-            "decisao": "aguardar",
-            "regra": "regra_5_minutos",
-            "motivo_regra": "Janela de 4 minutos atingida; transicao para 5 minutos.",
-            "hora_prevista": dt_prev.strftime("%H:%M:%S"),
-        }
+        return Avaliacao(
+            {
+                "decisao": "aguardar",
+                "regra": "regra_5_minutos",
+                "motivo_regra": (
+                    f"Janela de {_fmt_minutos(parametros.curta_seg)} atingida; "
+                    f"transicao para {_fmt_minutos(parametros.longa_seg)}."
+                ),
+                "hora_prevista": dt_prev.strftime("%H:%M:%S"),
+            },
+            dt_prev,
+            dt_5,
+            (ts_ultimo_alto,),
+        )
 
     # Depois de 5 minutos sem novo alto, cai para estatistica real.
-    return _analise_estatistica_real(registros, referencia_tempo)
-
+    return estatistica(referencia_tempo)._replace(referencias=(ts_ultimo_alto,))
 
-def _analise_estatistica_real(registros: List[Registro], referencia_tempo: datetime) -> dict:
-    # ================= ESTATISTICA REAL =================
-    idx_altos = [i for i, r in enumerate(registros) if r.mult >= 10]
-    gaps = [idx_altos[i] - idx_altos[i - 1] for i in range(1, len(idx_altos))]
-    gap_medio = median(gaps) if gaps else 8
-    gap_atual = (len(registros) - 1) - idx_altos[-1]
-
-    deltas = []
-    for i in range(1, len(registros)):
-        s = int((registros[i].dt - registros[i - 1].dt).total_seconds())
-        if s > 0:
-            deltas.append(s)
-    intervalo_medio = int(median(deltas)) if deltas else 20
 
+def _resultado_estatistico(
+    gap_medio: float,
+    gap_atual: int,
+    intervalo_medio: int,
+    baixos_fracos: int,
+    baixos_medios: int,
+    total_baixos: int,
+    referencia_tempo: datetime,
+    parametros: ParametrosAnalise = PARAMETROS_PADRAO,
+) -> Avaliacao:
     pressao = gap_atual / max(gap_medio, 1)
 
-    baixos = registros[idx_altos[-1] + 1 :]
-    baixos_fracos = len([r for r in baixos if r.mult <= 1.3])
-    baixos_medios = len([r for r in baixos if 1.3 < r.mult <= 5])
-    total_baixos = max(len(baixos), 1)
-
     perfil_score = (baixos_fracos * 1.2 + baixos_medios * 0.6) / total_baixos
     score_final = round((pressao * 0.6 + perfil_score * 0.4), 2)
 
@@ -194,16 +1015,918 @@ def _analise_estatistica_real(registros: List[Registro], referencia_tempo: datet
     dt_prev = referencia_tempo + timedelta(seconds=segundos_estimados)
     dt_prev = garantir_hora_futura(dt_prev, referencia_tempo, 30)
 
-    return {
-        "decisao": "aguardar",
-        "regra": "estatistica_real",
-        "motivo_regra": "Nao houve alto nos ultimos 5 minutos; usando modelo estatistico.",
-        "nivel_pressao": nivel,
-        "score_probabilidade": score_final,
-        "gap_atual": gap_atual,
-        "gap_medio": gap_medio,
-        "hora_prevista": dt_prev.strftime("%H:%M:%S"),
+    # hora_prevista anda junto com o relogio: so muda quando a referencia troca de segundo.
+    return Avaliacao(
+        {
+            "decisao": "aguardar",
+            "regra": "estatistica_real",
+            "motivo_regra": f"Nao houve alto nos ultimos {_fmt_minutos(parametros.longa_seg)}; usando modelo estatistico.",
+            "nivel_pressao": nivel,
+            "score_probabilidade": score_final,
+            "gap_atual": gap_atual,
+            "gap_medio": gap_medio,
+            "hora_prevista": dt_prev.strftime("%H:%M:%S"),
+        },
+        dt_prev,
+        referencia_tempo.replace(microsecond=0) + timedelta(seconds=1),
+    )
+
+
+# ================= ANALISE INCREMENTAL =================
+# Mediana de uma janela deslizante: dois heaps (metade baixa como max-heap, metade alta
+# como min-heap) com remocao preguicosa; adicionar/remover custam O(log n) e a mediana
+# segue a mesma convencao de statistics.median (media dos dois centrais quando par).
+class MedianaDeslizante:
+    def __init__(self) -> None:
+        self._baixo: List[int] = []
+        self._alto: List[int] = []
+        self._n_baixo = 0
+        self._n_alto = 0
+        self._removidos: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._n_baixo + self._n_alto
+
+    def adicionar(self, x: int) -> None:
+        if not self._baixo or x <= -self._baixo[0]:
+            heapq.heappush(self._baixo, -x)
+            self._n_baixo += 1
+        else:
+            heapq.heappush(self._alto, x)
+            self._n_alto += 1
+        self._equilibrar()
+
+    def remover(self, x: int) -> None:
+        self._removidos[x] = self._removidos.get(x, 0) + 1
+        if x <= -self._baixo[0]:
+            self._n_baixo -= 1
+            if x == -self._baixo[0]:
+                self._podar(self._baixo, -1)
+        else:
+            self._n_alto -= 1
+            if self._alto and x == self._alto[0]:
+                self._podar(self._alto, 1)
+        self._equilibrar()
+
+    def mediana(self) -> float:
+        if self._n_baixo > self._n_alto:
+            return -self._baixo[0]
+        return (-self._baixo[0] + self._alto[0]) / 2
+
+    def _podar(self, heap: List[int], sinal: int) -> None:
+        while heap:
+            x = sinal * heap[0]
+            pendentes = self._removidos.get(x, 0)
+            if not pendentes:
+                return
+            if pendentes == 1:
+                del self._removidos[x]
+            else:
+                self._removidos[x] = pendentes - 1
+            heapq.heappop(heap)
+
+    def _equilibrar(self) -> None:
+        if self._n_baixo > self._n_alto + 1:
+            heapq.heappush(self._alto, -heapq.heappop(self._baixo))
+            self._n_baixo -= 1
+            self._n_alto += 1
+            self._podar(self._baixo, -1)
+        elif self._n_baixo < self._n_alto:
+            heapq.heappush(self._baixo, -heapq.heappop(self._alto))
+            self._n_alto -= 1
+            self._n_baixo += 1
+            self._podar(self._alto, 1)
+
+
+# Mesmo resultado de avaliar() sobre as ultimas `janela` rodadas, mas mantido rodada a
+# rodada: indices dos altos, medianas de gaps/intervalos e o perfil dos baixos desde o
+# ultimo alto sao atualizados em O(log n) por rodada, sem reprocessar a janela.
+class AnalisadorIncremental:
+    def __init__(self, janela: int = 60, parametros: ParametrosAnalise = PARAMETROS_PADRAO):
+        self.janela = janela
+        self.parametros = parametros._replace(janela=janela)
+        self._zerar()
+
+    def _zerar(self) -> None:
+        self._rodadas: Deque[Tuple[int, float]] = deque()
+        self._seq = 0
+        self._altos: Deque[int] = deque()
+        self._gaps = MedianaDeslizante()
+        self._deltas = MedianaDeslizante()
+        self._baixos_fracos = 0
+        self._baixos_medios = 0
+
+    def __len__(self) -> int:
+        return len(self._rodadas)
+
+    @property
+    def ultimo_ts(self) -> Optional[int]:
+        return self._rodadas[-1][0] if self._rodadas else None
+
+    def recarregar(self, registros: Union[HistoricoColunar, Iterable[Registro]]) -> None:
+        col = _como_colunar(registros).ultimos(self.janela)
+        self._zerar()
+        for ts, mult in zip(col.ts, col.mult):
+            self.adicionar(ts, mult)
+
+    def adicionar(self, ts: int, mult: float) -> None:
+        if self._rodadas:
+            ts_anterior = self._rodadas[-1][0]
+            if ts < ts_anterior:
+                raise ValueError("rodada fora de ordem; use recarregar() com o historico ordenado")
+            if ts > ts_anterior:
+                self._deltas.adicionar(ts - ts_anterior)
+
+        seq = self._seq
+        self._seq += 1
+        self._rodadas.append((ts, mult))
+        if mult >= self.parametros.limiar:
+            if self._altos:
+                self._gaps.adicionar(seq - self._altos[-1])
+            self._altos.append(seq)
+            self._baixos_fracos = 0
+            self._baixos_medios = 0
+        elif mult <= 1.3:
+            self._baixos_fracos += 1
+        elif mult <= 5:
+            self._baixos_medios += 1
+
+        if len(self._rodadas) > self.janela:
+            self._descartar_mais_antiga()
+
+    def _descartar_mais_antiga(self) -> None:
+        seq_antiga = self._seq - len(self._rodadas)
+        ts_antigo, _ = self._rodadas.popleft()
+        delta = self._rodadas[0][0] - ts_antigo
+        if delta > 0:
+            self._deltas.remover(delta)
+        if self._altos and self._altos[0] == seq_antiga:
+            self._altos.popleft()
+            if self._altos:
+                self._gaps.remover(self._altos[0] - seq_antiga)
+        # Os contadores de baixos so olham depois do ultimo alto; se ele saiu da janela a
+        # analise para em "sem 10+" e o proximo alto zera os contadores.
+
+    def avaliar(self, agora: Optional[datetime] = None) -> Avaliacao:
+        if agora is None:
+            agora = datetime.now()
+        if not self._rodadas:
+            return _aguardar_sem_dados("Sem registros para analise temporal.")
+        if not self._altos:
+            return _aguardar_sem_dados(f"Sem multiplicador {self.parametros.limiar:g}+ no recorte.")
+
+        inicio = self._seq - len(self._rodadas)
+        ts_ultimo = self._rodadas[self._altos[-1] - inicio][0]
+        ts_penultimo = self._rodadas[self._altos[-2] - inicio][0] if len(self._altos) >= 2 else None
+        return _avaliar_regras(
+            agora, self._rodadas[-1][0], ts_ultimo, ts_penultimo, self._estatistica, self.parametros
+        )
+
+    def _estatistica(self, referencia_tempo: datetime) -> Avaliacao:
+        gap_medio = self._gaps.mediana() if len(self._gaps) else 8
+        gap_atual = (self._seq - 1) - self._altos[-1]
+        intervalo_medio = int(self._deltas.mediana()) if len(self._deltas) else 20
+        return _resultado_estatistico(
+            gap_medio,
+            gap_atual,
+            intervalo_medio,
+            self._baixos_fracos,
+            self._baixos_medios,
+            max(gap_atual, 1),
+            referencia_tempo,
+            self.parametros,
+        )
+
+
+# ================= CACHE DE PREVISAO =================
+# A previsao so muda quando chega rodada nova (chave diferente) ou quando o relogio passa
+# do valido_ate da Avaliacao; entre esses eventos todas as requisicoes reaproveitam o calculo.
+class PrevisaoCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._chave: Optional[Hashable] = None
+        self._valor: Any = None
+        self._valido_ate = datetime.min
+        self.acertos = 0
+        self.calculos = 0
+
+    @property
+    def valido_ate(self) -> datetime:
+        return self._valido_ate
+
+    def obter(self, chave: Hashable, calcular: Callable[[], Tuple[Any, datetime]]) -> Any:
+        with self._lock:
+            if self._chave == chave and datetime.now() < self._valido_ate:
+                self.acertos += 1
+                return self._valor
+        valor, valido_ate = calcular()
+        with self._lock:
+            self._chave, self._valor, self._valido_ate = chave, valor, valido_ate
+            self.calculos += 1
+        return valor
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._chave = None
+            self._valido_ate = datetime.min
+
+
+# Um PrevisaoCache por conjunto de parametros (ou lote), com no maximo `limite` conjuntos
+# vivos: o menos usado recentemente sai primeiro.
+class CachesPrevisao:
+    def __init__(self, limite: int = PREVISAO_CACHES_MAX):
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._caches: OrderedDict[Hashable, PrevisaoCache] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._caches)
+
+    def de(self, chave: Hashable) -> PrevisaoCache:
+        with self._lock:
+            cache = self._caches.get(chave)
+            if cache is None:
+                cache = self._caches[chave] = PrevisaoCache()
+                while len(self._caches) > self.limite:
+                    self._caches.popitem(last=False)
+            else:
+                self._caches.move_to_end(chave)
+            return cache
+
+
+historico_cache = HistoricoCache()
+previsao_cache = PrevisaoCache()
+caches_previsao = CachesPrevisao()
+leitor_snapshot = LeitorSnapshot()
+
+
+# Previsao pronta para servir: o corpo, o epoch de cada rodada da janela (para respostas
+# delta por cursor) e o corpo ja serializado com seu ETag forte, calculados uma vez por
+# previsao e nao por requisicao. `campo` e a lista de multiplicadores crus do corpo.
+class Previsao(NamedTuple):
+    corpo: dict
+    ts: array
+    json: bytes
+    etag: str
+    campo: str = "ultimos_60_multiplicadores"
+
+
+def serializar(corpo: dict) -> Tuple[bytes, str]:
+    # Mesmo formato do jsonify (provider JSON do Flask) para o corpo nao mudar de bytes.
+    dados = f"{app.json.dumps(corpo, separators=(',', ':'))}\n".encode("utf-8")
+    return dados, hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+
+def _nova_previsao(corpo: dict, ts: array, campo: str = "ultimos_60_multiplicadores") -> Previsao:
+    return Previsao(corpo, ts, *serializar(corpo), campo)
+
+
+def _campo_multiplicadores(janela: int) -> str:
+    return f"ultimos_{janela}_multiplicadores"
+
+
+# Bloco tipado da janela, alinhado com a lista de strings: ts (epoch, mesma convencao de
+# para_epoch), mult, idx_altos (posicoes com mult >= limiar) e referencias (posicoes das
+# rodadas que a regra usou). O cliente le direto, sem parsear "12.34x - HH:MM:SS".
+def montar_serie(registros: HistoricoColunar, av: Optional[Avaliacao] = None, limiar: Optional[float] = None) -> dict:
+    serie: Dict[str, Any] = {"ts": registros.ts.tolist(), "mult": registros.mult.tolist()}
+    if limiar is not None:
+        serie["idx_altos"] = [i for i, m in enumerate(registros.mult) if m >= limiar]
+        if av is not None:
+            serie["referencias"] = _indices_referencias(registros, av, limiar)
+    return serie
+
+
+def _indices_referencias(registros: HistoricoColunar, av: Avaliacao, limiar: float) -> List[int]:
+    # Varias rodadas podem cair no mesmo segundo: a referencia e a ultima delas com
+    # mult >= limiar, a mesma que a regra viu.
+    indices = []
+    for ts in av.referencias:
+        i = bisect.bisect_right(registros.ts, ts) - 1
+        while i >= 0 and registros.ts[i] == ts and registros.mult[i] < limiar:
+            i -= 1
+        if i >= 0 and registros.ts[i] == ts:
+            indices.append(i)
+    return indices
+
+
+def _regras_padrao(parametros: ParametrosAnalise) -> bool:
+    # Mesmas regras da analise original, qualquer que seja a janela.
+    return parametros._replace(janela=PARAMETROS_PADRAO.janela) == PARAMETROS_PADRAO
+
+
+def montar_previsao(
+    registros: HistoricoColunar, av: Optional[Avaliacao] = None, parametros: ParametrosAnalise = PARAMETROS_PADRAO
+) -> Tuple[dict, datetime]:
+    if av is None:
+        with cronometrar("analisar"):
+            av = avaliar(registros, parametros=parametros)
+    analise = av.resultado
+    corpo = {
+        "mensagem": "Aguardar",
+        "decisao": analise["decisao"],
+        "regra": analise["regra"],
+        "analise_estatistica": analise,
+        _campo_multiplicadores(parametros.janela): registros.raws(),
+        # Epoch da ultima rodada da janela; volta como ?desde= para pedir so o que e novo.
+        "cursor": registros.ts[-1] if len(registros) else None,
+        "serie": montar_serie(registros, av, parametros.limiar),
     }
+    if parametros != PARAMETROS_PADRAO:
+        corpo["parametros"] = parametros._asdict()
+    return corpo, av.valido_ate
+
+
+_previsao_snapshot: Tuple[Optional[dict], Optional[Previsao]] = (None, None)
+
+
+def obter_previsao(limite: int = 60, parametros: Optional[ParametrosAnalise] = None) -> Previsao:
+    global _previsao_snapshot
+    if parametros is None:
+        parametros = ParametrosAnalise(janela=limite)
+    limite = parametros.janela
+    # Snapshot, analisador incremental e previsao_cache so conhecem as regras padrao.
+    padrao = _regras_padrao(parametros)
+    if HISTORICO_MODO == "compartilhado" and padrao:
+        with cronometrar("snapshot"):
+            snap = leitor_snapshot.ler_recente()
+        if snap is not None and snap["limite"] == limite:
+            valido_ate = snap["valido_ate"]
+            if valido_ate is None or (datetime.now() - _EPOCH).total_seconds() < valido_ate:
+                # O leitor devolve o mesmo objeto enquanto o snapshot nao muda.
+                anterior, previsao = _previsao_snapshot
+                if anterior is not snap or previsao is None:
+                    previsao = _nova_previsao(snap["previsao"], array("q", snap["ts"][-limite:]))
+                    _previsao_snapshot = (snap, previsao)
+                return previsao
+
+    avaliacao: Optional[Callable[[], Avaliacao]] = None
+    if HISTORICO_MODO == "listener" and historico_cache.pronto and padrao:
+        # Leitura da janela em memoria; a avaliacao (analisador incremental) so no calculo.
+        with cronometrar("cache_janela"):
+            registros, versao = historico_cache.janela(limite)
+        avaliacao = functools.partial(historico_cache.avaliar_janela, registros, versao, limite)
+    else:
+        registros = obter_registros(limite)
+    cache = previsao_cache if parametros == PARAMETROS_PADRAO else caches_previsao.de(parametros)
+    return _previsao_em_cache(cache, registros, avaliacao, parametros)
+
+
+def _previsao_em_cache(
+    cache: PrevisaoCache,
+    registros: HistoricoColunar,
+    avaliacao: Optional[Callable[[], Avaliacao]],
+    parametros: ParametrosAnalise,
+) -> Previsao:
+    # Copiar a janela e barato; a chave pelo conteudo vale para todos os modos de carga.
+    chave = (registros.ts.tobytes(), registros.mult.tobytes())
+
+    def calcular() -> Tuple[Previsao, datetime]:
+        av = None
+        if avaliacao is not None:
+            with cronometrar("analisar"):
+                av = avaliacao()
+        corpo, valido_ate = montar_previsao(registros, av, parametros)
+        with cronometrar("json"):
+            return _nova_previsao(corpo, registros.ts, _campo_multiplicadores(parametros.janela)), valido_ate
+
+    return cache.obter(chave, calcular)
+
+
+def obter_lote(combinacoes: Iterable[ParametrosAnalise]) -> Previsao:
+    # Uma carga (a maior janela pedida) e uma passada de avaliar_lote para todas as
+    # combinacoes; o resultado inteiro fica em cache pelo conjunto de combinacoes.
+    combinacoes = tuple(sorted(set(combinacoes)))
+    registros = obter_registros(max(p.janela for p in combinacoes))
+    chave = (registros.ts.tobytes(), registros.mult.tobytes())
+
+    def calcular() -> Tuple[Previsao, datetime]:
+        with cronometrar("analisar"):
+            avaliacoes = avaliar_lote(registros, combinacoes)
+        corpo = {
+            "previsoes": [
+                {
+                    "limiar": p.limiar,
+                    "janela": p.janela,
+                    "decisao": avaliacoes[p].resultado["decisao"],
+                    "regra": avaliacoes[p].resultado["regra"],
+                    "analise_estatistica": avaliacoes[p].resultado,
+                    "serie": {
+                        "idx_altos": [i for i, m in enumerate(registros.mult) if m >= p.limiar],
+                        "referencias": _indices_referencias(registros, avaliacoes[p], p.limiar),
+                    },
+                }
+                for p in combinacoes
+            ],
+            "ultimos_multiplicadores": registros.raws(),
+            "cursor": registros.ts[-1] if len(registros) else None,
+            "serie": montar_serie(registros),
+        }
+        valido_ate = min(av.valido_ate for av in avaliacoes.values())
+        with cronometrar("json"):
+            return _nova_previsao(corpo, registros.ts, "ultimos_multiplicadores"), valido_ate
+
+    return caches_previsao.de(("lote",) + combinacoes).obter(chave, calcular)
+
+
+# ================= COALESCENCIA (SINGLE-FLIGHT) =================
+class _Voo:
+    __slots__ = ("pronto", "valor", "erro")
+
+    def __init__(self) -> None:
+        self.pronto = threading.Event()
+        self.valor: Any = None
+        self.erro: Optional[BaseException] = None
+
+
+# Requisicoes simultaneas pela mesma chave esperam a carga+analise que ja esta em voo em
+# vez de disparar outra leitura no Firebase; o erro do lider e repassado a todas.
+class SingleFlight:
+    def __init__(self, janela_seg: float = COALESCER_JANELA_SEG):
+        self.janela_seg = janela_seg
+        self._lock = threading.Lock()
+        self._voos: Dict[Hashable, _Voo] = {}
+        # Em ordem de gravacao: os expirados ficam sempre no comeco.
+        self._recentes: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.chamadas = 0
+        self.execucoes = 0
+        self.coalescidas = 0
+        self.frescas = 0
+
+    def executar(self, chave: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.chamadas += 1
+            recente = self._recentes.get(chave)
+            if recente is not None and time.monotonic() - recente[0] < self.janela_seg:
+                self.frescas += 1
+                return recente[1]
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.valor
+
+        try:
+            voo.valor = fn()
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._voos[chave]
+                if voo.erro is None and self.janela_seg > 0:
+                    agora = time.monotonic()
+                    self._recentes[chave] = (agora, voo.valor)
+                    self._recentes.move_to_end(chave)
+                    # Chaves vem do cliente (parametros da analise): as vencidas saem aqui.
+                    while self._recentes:
+                        gravado_em, _ = next(iter(self._recentes.values()))
+                        if agora - gravado_em < self.janela_seg:
+                            break
+                        self._recentes.popitem(last=False)
+            voo.pronto.set()
+        return voo.valor
+
+
+coalescedor = SingleFlight()
+
+
+def _coalescer(chave: Hashable, fn: Callable[[], Previsao]) -> Previsao:
+    def carregar() -> Previsao:
+        if HISTORICO_MODO != "compartilhado":
+            with cronometrar("init_firebase"):
+                init_firebase()
+        return fn()
+
+    return coalescedor.executar(chave, carregar)
+
+
+def previsao_coalescida(limite: int = 60, parametros: Optional[ParametrosAnalise] = None) -> Previsao:
+    if parametros is None:
+        parametros = ParametrosAnalise(janela=limite)
+    return _coalescer(("previsao", parametros), lambda: obter_previsao(parametros=parametros))
+
+
+def lote_coalescido(combinacoes: Iterable[ParametrosAnalise]) -> Previsao:
+    chave = tuple(sorted(set(combinacoes)))
+    return _coalescer(("lote",) + chave, lambda: obter_lote(chave))
+
+
+# ================= FEEDS =================
+# Cada feed e um historico proprio no banco, com janela em memoria (HistoricoCache no modo
+# listener, com copia local em HISTORICO_ARQUIVO.<nome>) e cache de previsao proprios. O
+# feed de HISTORICO_PATH reaproveita historico_cache/previsao_cache (e o snapshot e a
+# ingestao, que so existem para ele).
+def _ler_feeds(config: str) -> Dict[str, str]:
+    feeds: Dict[str, str] = {}
+    for item in (x.strip() for x in config.split(",")):
+        if not item:
+            continue
+        nome, sep, path = (p.strip() for p in item.partition("="))
+        if not sep or not nome or not path.strip("/"):
+            raise ValueError(f"FEEDS: esperado nome=caminho, recebido {item!r}")
+        feeds[nome] = path.strip("/")
+    return feeds or {"principal": HISTORICO_PATH.strip("/")}
+
+
+class Feed:
+    def __init__(self, nome: str, path: str):
+        self.nome = nome
+        self.path = path
+        self.principal = path == HISTORICO_PATH.strip("/")
+        if self.principal:
+            self.historico, self.cache = historico_cache, previsao_cache
+        else:
+            self.historico = HistoricoCache(path, f"{HISTORICO_ARQUIVO}.{nome}" if HISTORICO_ARQUIVO else None)
+            self.cache = PrevisaoCache()
+
+    def registros(self, limite: int) -> HistoricoColunar:
+        if HISTORICO_MODO == "listener":
+            try:
+                return self.historico.registros(limite)
+            except RuntimeError:
+                pass
+        elif HISTORICO_MODO in ("janela", "compartilhado"):
+            # O snapshot compartilhado so publica o feed principal.
+            init_firebase()
+            return carregar_registros_janela(limite, path=self.path)
+        return carregar_registros(limite, self.path)
+
+    def previsao(self, parametros: ParametrosAnalise) -> Previsao:
+        if self.principal:
+            return obter_previsao(parametros=parametros)
+        avaliacao: Optional[Callable[[], Avaliacao]] = None
+        if HISTORICO_MODO == "listener" and self.historico.pronto and _regras_padrao(parametros):
+            with cronometrar("cache_janela"):
+                registros, versao = self.historico.janela(parametros.janela)
+            avaliacao = functools.partial(self.historico.avaliar_janela, registros, versao, parametros.janela)
+        else:
+            registros = self.registros(parametros.janela)
+        cache = self.cache if parametros == PARAMETROS_PADRAO else caches_previsao.de(("feed", self.nome, parametros))
+        return _previsao_em_cache(cache, registros, avaliacao, parametros)
+
+    def previsao_coalescida(self, parametros: ParametrosAnalise) -> Previsao:
+        # O principal voa junto com /bet/<limiar>-plus (mesma chave no single-flight).
+        chave = ("previsao", parametros) if self.principal else ("feed", self.nome, parametros)
+        return _coalescer(chave, lambda: self.previsao(parametros))
+
+
+feeds: Dict[str, Feed] = {nome: Feed(nome, path) for nome, path in _ler_feeds(FEEDS).items()}
+_pool_feeds: Optional[ThreadPoolExecutor] = None
+_pool_feeds_lock = threading.Lock()
+
+
+def _obter_pool_feeds() -> ThreadPoolExecutor:
+    global _pool_feeds
+    with _pool_feeds_lock:
+        if _pool_feeds is None:
+            _pool_feeds = ThreadPoolExecutor(max_workers=max(1, FEEDS_THREADS), thread_name_prefix="feed")
+        return _pool_feeds
+
+
+def _medir_feed(feed: Feed, parametros: ParametrosAnalise) -> Tuple[Previsao, float]:
+    inicio = time.perf_counter()
+    previsao = feed.previsao_coalescida(parametros)
+    duracao = time.perf_counter() - inicio
+    LATENCIA_FEED.observar(duracao, feed=feed.nome)
+    return previsao, duracao
+
+
+def previsoes_feeds(nomes: Iterable[str], parametros: ParametrosAnalise = PARAMETROS_PADRAO) -> dict:
+    # Todos os feeds pedidos vao para o pool de uma vez, com um prazo unico para a resposta;
+    # um feed lento ou com erro sai com "erro" e nao segura os outros. A copia do contexto
+    # leva a coleta do Server-Timing da requisicao para as threads do pool.
+    inicio = time.perf_counter()
+    pool = _obter_pool_feeds()
+    futuros: Dict[str, Future] = {
+        nome: pool.submit(contextvars.copy_context().run, _medir_feed, feeds[nome], parametros)
+        for nome in dict.fromkeys(nomes)
+    }
+    prazo = time.monotonic() + FEEDS_TIMEOUT_SEG
+    resultado: Dict[str, Any] = {}
+    for nome, futuro in futuros.items():
+        feed = feeds[nome]
+        meta: Dict[str, Any] = {"path": feed.path}
+        try:
+            previsao, duracao = futuro.result(timeout=max(0.0, prazo - time.monotonic()))
+        except FuturoTimeout:
+            # Ainda na fila: sai dela. Ja rodando: termina e deixa o cache quente.
+            futuro.cancel()
+            resultado[nome] = {"erro": f"sem resposta em {FEEDS_TIMEOUT_SEG:g}s", "meta": meta}
+            continue
+        except Exception as e:
+            resultado[nome] = {"erro": str(e), "meta": meta}
+            continue
+        REGRAS.incrementar(regra=previsao.corpo["regra"])
+        cursor = previsao.corpo.get("cursor")
+        if HISTORICO_MODO == "listener":
+            # False: a janela saiu da leitura completa enquanto o listener carrega.
+            meta["pronto"] = feed.historico.pronto
+        meta["duracao_ms"] = round(duracao * 1000, 2)
+        meta["rodadas"] = len(previsao.ts)
+        # Idade da rodada mais nova da janela, no relogio do jogo: feed parado aparece aqui.
+        meta["idade_seg"] = round((datetime.now() - _EPOCH).total_seconds() - cursor, 1) if cursor is not None else None
+        resultado[nome] = {**previsao.corpo, "meta": meta}
+    return {"feeds": resultado, "duracao_ms": round((time.perf_counter() - inicio) * 1000, 2)}
+
+
+# ================= INGESTAO =================
+_PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+# Codificacao das chaves de push() do Firebase: 8 chars de tempo em ms + 12 de sufixo
+# (indices 0..63 em _PUSH_CHARS), ordenaveis lexicograficamente por tempo.
+def chave_push(ms: int, aleatorio: Iterable[int]) -> str:
+    tempo = []
+    for _ in range(8):
+        tempo.append(_PUSH_CHARS[ms % 64])
+        ms //= 64
+    return "".join(reversed(tempo)) + "".join(_PUSH_CHARS[x] for x in aleatorio)
+
+
+# Chaves de push() geradas no servidor para o lote poder ir num unico update multi-path.
+# No mesmo ms o sufixo e incrementado, entao as chaves seguem cronologicas como as do
+# push() dos outros escritores.
+class GeradorChavePush:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ultimo_ms = 0
+        self._aleatorio = [0] * 12
+
+    def gerar(self) -> str:
+        with self._lock:
+            ms = max(int(time.time() * 1000), self._ultimo_ms)
+            if ms == self._ultimo_ms:
+                i = 11
+                while i >= 0 and self._aleatorio[i] == 63:
+                    self._aleatorio[i] = 0
+                    i -= 1
+                if i >= 0:
+                    self._aleatorio[i] += 1
+                else:
+                    ms += 1
+            else:
+                self._aleatorio = [b % 64 for b in os.urandom(12)]
+            self._ultimo_ms = ms
+            return chave_push(ms, self._aleatorio)
+
+
+class _Pendente(NamedTuple):
+    data: str
+    chave: str
+    txt: str
+    ts: int
+    mult: float
+
+
+# Write-behind: a requisicao so enfileira; uma thread junta ate INGESTAO_LOTE_MAX rodadas
+# (esperando no maximo INGESTAO_ESPERA_SEG por mais) e grava com um update multi-path.
+# Falha de gravacao repete com backoff exponencial ate INGESTAO_TENTATIVAS vezes; a fila
+# e limitada, entao Firebase lento vira 503 na ingestao em vez de memoria crescendo.
+class EscritorHistorico:
+    def __init__(self, path: str = HISTORICO_PATH) -> None:
+        self.path = path
+        self._cond = threading.Condition()
+        self._fila: Deque[_Pendente] = deque()
+        self._em_voo: List[_Pendente] = []
+        self._thread: Optional[threading.Thread] = None
+        self.gravadas = 0
+        self.lotes = 0
+        self.falhas = 0
+        self.descartadas = 0
+
+    def pendentes(self) -> int:
+        with self._cond:
+            return len(self._fila) + len(self._em_voo)
+
+    def rodadas_pendentes(self) -> List[Tuple[int, float]]:
+        with self._cond:
+            if not self._fila and not self._em_voo:
+                return []
+            return [(p.ts, p.mult) for p in itertools.chain(self._em_voo, self._fila)]
+
+    def enfileirar(self, itens: List[_Pendente]) -> bool:
+        with self._cond:
+            if len(self._fila) + len(self._em_voo) + len(itens) > INGESTAO_PENDENTES_MAX:
+                return False
+            self._fila.extend(itens)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="escritor-historico", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return True
+
+    def esvaziar(self, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._fila and not self._em_voo, timeout)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._fila)
+                limite = time.monotonic() + INGESTAO_ESPERA_SEG
+                while len(self._fila) < INGESTAO_LOTE_MAX:
+                    resta = limite - time.monotonic()
+                    if resta <= 0:
+                        break
+                    self._cond.wait(resta)
+                lote = [self._fila.popleft() for _ in range(min(len(self._fila), INGESTAO_LOTE_MAX))]
+                self._em_voo = lote
+            self._gravar(lote)
+            with self._cond:
+                self._em_voo = []
+                self._cond.notify_all()
+
+    def _gravar(self, lote: List[_Pendente]) -> None:
+        atualizacao = {f"{p.data}/{p.chave}": p.txt for p in lote}
+        for tentativa in range(1, INGESTAO_TENTATIVAS + 1):
+            try:
+                init_firebase()
+                with cronometrar("ingestao_gravar"):
+                    db.reference(self.path).update(atualizacao)
+                self.gravadas += len(lote)
+                self.lotes += 1
+                return
+            except Exception as e:
+                self.falhas += 1
+                app.logger.warning("ingestao: falha ao gravar %d rodadas (tentativa %d): %s", len(lote), tentativa, e)
+                if tentativa < INGESTAO_TENTATIVAS:
+                    time.sleep(min(0.5 * 2 ** (tentativa - 1), 30))
+        self.descartadas += len(lote)
+        app.logger.error("ingestao: %d rodadas descartadas apos %d tentativas", len(lote), INGESTAO_TENTATIVAS)
+
+
+chaves_push = GeradorChavePush()
+escritor_historico = EscritorHistorico()
+# Desligamento normal: da alguns segundos para o que ainda esta na fila chegar ao banco.
+atexit.register(escritor_historico.esvaziar, 5.0)
+
+
+# ================= STREAM (SSE) =================
+# Um unico publicador reavalia a previsao quando chega rodada nova ou quando a anterior
+# expira (valido_ate) e so numera um novo evento se o payload mudou; cada conexao SSE
+# apenas espera o proximo numero. O prefixo de boot evita retomar ids de outro processo.
+# Sem assinantes o publicador fica parado: nenhuma leitura do backend sem cliente ouvindo.
+class CanalPrevisao:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._boot = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._payload: Optional[dict] = None
+        self._assinatura: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self.assinantes = 0
+
+    def iniciar(self) -> None:
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="canal-previsao", daemon=True)
+                self._thread.start()
+
+    def assinar(self, maximo: int = 0) -> bool:
+        with self._cond:
+            if maximo and self.assinantes >= maximo:
+                return False
+            self.assinantes += 1
+            self._cond.notify_all()
+        self.iniciar()
+        return True
+
+    def cancelar(self) -> None:
+        with self._cond:
+            self.assinantes -= 1
+
+    def publicar(self, payload: dict) -> bool:
+        assinatura = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        with self._cond:
+            if assinatura == self._assinatura:
+                return False
+            self._seq += 1
+            self._payload = payload
+            self._assinatura = assinatura
+            self._cond.notify_all()
+            return True
+
+    def id_evento(self, seq: int) -> str:
+        return f"{self._boot}-{seq}"
+
+    def seq_de(self, id_evento: Optional[str]) -> int:
+        boot, _, seq = (id_evento or "").partition("-")
+        if boot != self._boot or not seq.isdigit():
+            return -1
+        return int(seq)
+
+    def aguardar(self, desde: int, timeout: float) -> Tuple[int, Optional[dict]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._payload is not None and self._seq != desde, timeout)
+            if self._payload is None or self._seq == desde:
+                return desde, None
+            return self._seq, self._payload
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                if not self.assinantes:
+                    # Parado o payload envelhece: descarta para o proximo assinante receber
+                    # a primeira avaliacao nova (com numero novo) em vez de uma antiga.
+                    self._payload = None
+                    self._assinatura = None
+                    self._cond.wait_for(lambda: self.assinantes > 0)
+            versao = historico_cache.versao
+            try:
+                self.publicar(previsao_coalescida(60).corpo)
+                espera = (previsao_cache.valido_ate - datetime.now()).total_seconds()
+            except Exception:
+                espera = STREAM_INTERVALO_SEG
+            # No modo listener a espera acaba antes se chegar rodada; nos demais modos o
+            # intervalo maximo define a frequencia de leitura do backend.
+            historico_cache.aguardar_mudanca(versao, min(max(espera, 0.05), STREAM_INTERVALO_SEG))
+
+
+canal_previsao = CanalPrevisao()
+
+
+# ================= COMPACTACAO =================
+_compactacao_agendada = False
+
+
+def _agendar_compactacao() -> None:
+    # Import tardio: compactacao importa este modulo. A tarefa so comeca na primeira
+    # requisicao para nao subir threads antes do fork nem em scripts que importam o app.
+    global _compactacao_agendada
+    _compactacao_agendada = True
+    import compactacao
+
+    compactacao.agendar(COMPACTACAO_MANTER_DIAS, COMPACTACAO_INTERVALO_SEG)
+
+
+# ================= METRICAS =================
+metricas.REGISTRO.funcao(
+    "predit_coalescencia_total",
+    "counter",
+    "Chamadas ao single-flight por desfecho.",
+    lambda: {
+        (("desfecho", "executada"),): coalescedor.execucoes,
+        (("desfecho", "coalescida"),): coalescedor.coalescidas,
+        (("desfecho", "fresca"),): coalescedor.frescas,
+    },
+)
+metricas.REGISTRO.funcao(
+    "predit_cache_previsao_total",
+    "counter",
+    "Consultas ao cache de previsao por desfecho.",
+    lambda: {(("desfecho", "acerto"),): previsao_cache.acertos, (("desfecho", "calculo"),): previsao_cache.calculos},
+)
+metricas.REGISTRO.funcao(
+    "predit_historico_versao", "gauge", "Eventos aplicados pelo listener do historico.", lambda: historico_cache.versao
+)
+metricas.REGISTRO.funcao(
+    "predit_ingestao_rodadas_total",
+    "counter",
+    "Rodadas ingeridas via POST /rodadas por desfecho da gravacao no Firebase.",
+    lambda: {
+        (("desfecho", "gravada"),): escritor_historico.gravadas,
+        (("desfecho", "descartada"),): escritor_historico.descartadas,
+    },
+)
+metricas.REGISTRO.funcao(
+    "predit_ingestao_falhas_total", "counter", "Tentativas de update no Firebase que falharam.", lambda: escritor_historico.falhas
+)
+metricas.REGISTRO.funcao(
+    "predit_ingestao_pendentes", "gauge", "Rodadas ingeridas ainda nao gravadas no Firebase.", escritor_historico.pendentes
+)
+metricas.REGISTRO.funcao(
+    "predit_historico_pronto", "gauge", "1 quando o historico em memoria terminou a carga inicial.", lambda: int(historico_cache.pronto)
+)
+
+
+@app.before_request
+def _inicio_requisicao() -> None:
+    g.inicio = time.perf_counter()
+    if COMPACTACAO_MANTER_DIAS > 0 and not _compactacao_agendada:
+        _agendar_compactacao()
+    if SERVER_TIMING or request.args.get("timing") == "1" or request.headers.get("X-Server-Timing") == "1":
+        metricas.iniciar_coleta_requisicao()
+
+
+@app.after_request
+def _fim_requisicao(resp: Response) -> Response:
+    tempos = metricas.encerrar_coleta_requisicao()
+    duracao = time.perf_counter() - g.inicio
+    if request.url_rule is not None:
+        LATENCIA_ROTA.observar(duracao, rota=request.url_rule.rule)
+    if tempos is not None:
+        tempos.append(("total", duracao))
+        resp.headers["Server-Timing"] = metricas.server_timing(tempos)
+    return resp
 
 
 # ================= API =================
@@ -212,24 +1935,288 @@ def health() -> Tuple[Any, int]:
     return jsonify({"status": "ok"}), 200
 
 
+# Readiness: 503 enquanto o worker ainda aquece. A primeira chamada ja dispara a carga
+# (sem esperar), entao o probe do orquestrador basta para aquecer o worker no deploy.
+@app.get("/ready")
+def ready() -> Tuple[Any, int]:
+    corpo: Dict[str, Any] = {"modo": HISTORICO_MODO}
+    if HISTORICO_MODO == "listener":
+        try:
+            historico_cache.iniciar(0)
+        except Exception as e:
+            corpo["erro"] = str(e)
+        corpo.update(historico_cache.estado())
+        # Feeds extras aquecem junto, mas nao seguram o readiness do feed principal.
+        extras = {}
+        for feed in feeds.values():
+            if feed.principal:
+                continue
+            try:
+                feed.historico.iniciar(0)
+            except Exception as e:
+                app.logger.warning("feeds: %s nao iniciou: %s", feed.nome, e)
+            extras[feed.nome] = feed.historico.pronto
+        if extras:
+            corpo["feeds"] = extras
+    elif HISTORICO_MODO == "compartilhado":
+        # Snapshot velho: as requisicoes caem na leitura direta do banco, mas o publicador
+        # precisa de atencao.
+        snap = leitor_snapshot.ler()
+        corpo["snapshot_idade_seg"] = round(leitor_snapshot.idade(snap), 1) if snap is not None else None
+        corpo["pronto"] = leitor_snapshot.ler_recente() is not None
+    else:
+        corpo["pronto"] = True
+    return jsonify(corpo), 200 if corpo["pronto"] else 503
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(metricas.REGISTRO.exportar(), mimetype="text/plain; version=0.0.4")
+
+
+def resposta_delta(previsao: Previsao, desde: int) -> dict:
+    # So as rodadas com epoch > desde. Se o cursor e mais antigo que a janela inteira o
+    # cliente pode ter perdido rodadas: manda a janela toda com completo=True.
+    i = bisect.bisect_right(previsao.ts, desde)
+    corpo = {k: v for k, v in previsao.corpo.items() if k != previsao.campo}
+    corpo["novos_multiplicadores"] = previsao.corpo[previsao.campo][i:]
+    corpo["completo"] = i == 0
+    serie = previsao.corpo.get("serie")
+    if serie is not None:
+        # ts/mult a partir do segundo do cursor (inclusive): rodadas que chegaram depois no
+        # mesmo segundo nao se perdem, e o cliente troca as suas com ts >= desde por estas.
+        # idx_altos e referencias continuam relativos a janela inteira de `tamanho` rodadas.
+        j = bisect.bisect_left(previsao.ts, desde)
+        corpo["serie"] = {
+            **serie,
+            "ts": serie["ts"][j:],
+            "mult": serie["mult"][j:],
+            "desde": desde,
+            "tamanho": len(serie["ts"]),
+        }
+    return corpo
+
+
+def resposta_condicional(dados: bytes, etag: str) -> Response:
+    resp = Response(dados, mimetype=app.json.mimetype)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    # If-None-Match igual ao estado atual: 304 sem corpo.
+    return resp.make_conditional(request)
+
+
+def _servir(previsao: Previsao, desde: Optional[int]) -> Response:
+    if desde is None:
+        return resposta_condicional(previsao.json, previsao.etag)
+    with cronometrar("json"):
+        dados, etag = serializar(resposta_delta(previsao, desde))
+    return resposta_condicional(dados, etag)
+
+
+def _ler_desde(args: Mapping[str, str]) -> Optional[int]:
+    desde = args.get("desde")
+    if desde is None:
+        return None
+    try:
+        return int(desde)
+    except ValueError:
+        raise ValueError("parametro desde deve ser o epoch (inteiro) do cursor") from None
+
+
+def _ler_parametros(limiar: str, janela: str, args: Mapping[str, str]) -> ParametrosAnalise:
+    try:
+        parametros = ParametrosAnalise(
+            limiar=float(limiar),
+            janela=int(janela),
+            espelho_seg=int(args.get("espelho_seg", PARAMETROS_PADRAO.espelho_seg)),
+            curta_seg=int(args.get("curta_seg", PARAMETROS_PADRAO.curta_seg)),
+            longa_seg=int(args.get("longa_seg", PARAMETROS_PADRAO.longa_seg)),
+        )
+    except ValueError:
+        raise ValueError("limiar deve ser numero; window, espelho_seg, curta_seg e longa_seg, inteiros") from None
+    if not math.isfinite(parametros.limiar) or parametros.limiar <= 1:
+        raise ValueError("limiar deve ser maior que 1")
+    if not 1 <= parametros.janela <= ANALISE_JANELA_MAX:
+        raise ValueError(f"window deve estar entre 1 e {ANALISE_JANELA_MAX}")
+    if parametros.espelho_seg < 1 or not 0 < parametros.curta_seg < parametros.longa_seg:
+        raise ValueError("espelho_seg deve ser positivo e 0 < curta_seg < longa_seg")
+    return parametros
+
+
+def _responder_previsao(limiar: str) -> Union[Response, Tuple[Any, int]]:
+    try:
+        desde = _ler_desde(request.args)
+        parametros = _ler_parametros(limiar, request.args.get("window", str(PARAMETROS_PADRAO.janela)), request.args)
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    previsao = previsao_coalescida(parametros=parametros)
+    REGRAS.incrementar(regra=previsao.corpo["regra"])
+    return _servir(previsao, desde)
+
+
 @app.get("/bet/10-plus")
-def bet_10_plus() -> Tuple[Any, int]:
-    init_firebase()
-    registros = carregar_registros(60)
-    analise = analisar(registros)
+def bet_10_plus() -> Union[Response, Tuple[Any, int]]:
+    return _responder_previsao("10")
+
 
+@app.get("/bet/<limiar>-plus")
+def bet_limiar_plus(limiar: str) -> Union[Response, Tuple[Any, int]]:
+    return _responder_previsao(limiar)
+
+
+# Lote: /bet/lote?limiar=2,5,10,50&window=30,60 -> todas as combinacoes limiar x window
+# calculadas a partir de uma carga e uma passada.
+@app.get("/bet/lote")
+def bet_lote() -> Union[Response, Tuple[Any, int]]:
+    limiares = [x for x in request.args.get("limiar", "10").split(",") if x.strip()]
+    janelas = [x for x in request.args.get("window", str(PARAMETROS_PADRAO.janela)).split(",") if x.strip()]
+    try:
+        desde = _ler_desde(request.args)
+        if not limiares or not janelas:
+            raise ValueError("informe ao menos um limiar e uma window")
+        if len(limiares) * len(janelas) > LOTE_MAX_COMBINACOES:
+            raise ValueError(f"no maximo {LOTE_MAX_COMBINACOES} combinacoes limiar x window por lote")
+        combinacoes = [_ler_parametros(lim, jan, request.args) for lim in limiares for jan in janelas]
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    previsao = lote_coalescido(combinacoes)
+    for item in previsao.corpo["previsoes"]:
+        REGRAS.incrementar(regra=item["regra"])
+    return _servir(previsao, desde)
+
+
+# Varios feeds numa resposta: /bet/feeds?feeds=aviator,spaceman&limiar=10&window=60 (sem
+# ?feeds= vem todos). Cada feed traz a previsao de /bet/<limiar>-plus e um bloco "meta"
+# com path, duracao_ms da carga + analise, rodadas na janela e idade_seg da ultima rodada.
+@app.get("/bet/feeds")
+def bet_feeds() -> Tuple[Any, int]:
+    nomes = [x.strip() for x in request.args.get("feeds", "").split(",") if x.strip()] or list(feeds)
+    try:
+        desconhecidos = [n for n in nomes if n not in feeds]
+        if desconhecidos:
+            raise ValueError(f"feeds desconhecidos: {', '.join(desconhecidos)}; disponiveis: {', '.join(feeds)}")
+        parametros = _ler_parametros(
+            request.args.get("limiar", "10"), request.args.get("window", str(PARAMETROS_PADRAO.janela)), request.args
+        )
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    return jsonify(previsoes_feeds(nomes, parametros)), 200
+
+
+# Ingestao: {"data": "AAAA-MM-DD", "rodadas": ["12.34x - 10:00:00", ...]} (ou "rodada"
+# com uma so, ou a lista direto). Sem data cada rodada vai para o dia que deixa o horario
+# mais perto do relogio do servidor. O lote inteiro e rejeitado se alguma linha nao passar
+# em parse_linha.
+@app.post("/rodadas")
+def ingerir_rodadas() -> Tuple[Any, int]:
+    if not INGESTAO_TOKEN:
+        return jsonify({"erro": "ingestao desabilitada; defina INGESTAO_TOKEN"}), 403
+    # Em bytes: compare_digest recusa (TypeError) str com caracteres fora do ASCII.
+    autorizacao = request.headers.get("Authorization", "").encode("utf-8")
+    if not hmac.compare_digest(autorizacao, f"Bearer {INGESTAO_TOKEN}".encode("utf-8")):
+        return jsonify({"erro": "token invalido"}), 401
+
+    corpo = request.get_json(silent=True)
+    data = None
+    rodadas: Any = corpo
+    if isinstance(corpo, dict):
+        data = corpo.get("data")
+        rodadas = corpo.get("rodadas", corpo.get("rodada"))
+    if isinstance(rodadas, str):
+        rodadas = [rodadas]
+    if not isinstance(rodadas, list) or not rodadas:
+        return jsonify({"erro": "envie rodadas como lista de \"Nx - HH:MM:SS\""}), 400
+    if len(rodadas) > INGESTAO_REQUISICAO_MAX:
+        return jsonify({"erro": f"no maximo {INGESTAO_REQUISICAO_MAX} rodadas por requisicao"}), 400
+    try:
+        if data is not None and not isinstance(data, str):
+            raise ValueError
+        if data is not None:
+            datetime.strptime(data, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"erro": "data deve ser AAAA-MM-DD"}), 400
+
+    agora = datetime.now()
+    itens: List[_Pendente] = []
+    invalidas: List[int] = []
+    for i, txt in enumerate(rodadas):
+        try:
+            r = parse_linha(txt, data or _data_provavel(txt, agora)) if isinstance(txt, str) else None
+        except ValueError:
+            r = None
+        if r is None:
+            invalidas.append(i)
+            continue
+        itens.append(_Pendente(r.dt.strftime("%Y-%m-%d"), chaves_push.gerar(), txt, para_epoch(r.dt), r.mult))
+    if invalidas:
+        return jsonify({"erro": "rodadas fora do formato \"Nx - HH:MM:SS\"", "indices": invalidas}), 400
+
+    if not escritor_historico.enfileirar(itens):
+        resp = jsonify({"erro": "fila de gravacao cheia", "pendentes": escritor_historico.pendentes()})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    por_dia: Dict[str, Dict[str, str]] = {}
+    for p in itens:
+        por_dia.setdefault(p.data, {})[p.chave] = p.txt
+    for dia, rodadas_dia in sorted(por_dia.items()):
+        historico_cache.aplicar_local(dia, rodadas_dia)
     return (
         jsonify(
             {
-                "mensagem": "Aguardar",
-                "decisao": analise["decisao"],
-                "regra": analise["regra"],
-                "analise_estatistica": analise,
-                "ultimos_60_multiplicadores": [r.raw for r in registros],
+                "aceitas": len(itens),
+                "data": itens[-1].data,
+                "chaves": [p.chave for p in itens],
+                "pendentes": escritor_historico.pendentes(),
             }
         ),
-        200,
+        202,
+    )
+
+
+def _data_provavel(txt: str, agora: datetime) -> str:
+    # Sem "data" no corpo: o dia que deixa o horario mais perto de agora. Uma rodada de
+    # 23:59:58 postada as 00:00:03 e de ontem, nao de hoje (e o contrario com o relogio atrasado).
+    hoje = agora.strftime("%Y-%m-%d")
+    r = parse_linha(txt, hoje)
+    if r is None:
+        return hoje
+    if r.dt - agora > timedelta(hours=12):
+        return (agora - timedelta(days=1)).strftime("%Y-%m-%d")
+    if agora - r.dt > timedelta(hours=12):
+        return (agora + timedelta(days=1)).strftime("%Y-%m-%d")
+    return hoje
+
+
+@app.get("/bet/10-plus/stream")
+def bet_10_plus_stream() -> Union[Response, Tuple[Any, int]]:
+    init_firebase()
+    if not canal_previsao.assinar(STREAM_MAX_CONEXOES):
+        resp = jsonify({"erro": "limite de streams deste processo atingido; use polling ou o servidor asgi.py"})
+        resp.headers["Retry-After"] = "30"
+        return resp, 503
+    desde = canal_previsao.seq_de(request.headers.get("Last-Event-ID") or request.args.get("ultimo_id"))
+
+    def eventos() -> Iterator[str]:
+        seq = desde
+        yield "retry: 3000\n\n"
+        while True:
+            novo_seq, payload = canal_previsao.aguardar(seq, STREAM_HEARTBEAT_SEG)
+            if payload is None:
+                yield ": heartbeat\n\n"
+                continue
+            seq = novo_seq
+            dados = json.dumps(payload, ensure_ascii=False)
+            yield f"id: {canal_previsao.id_evento(seq)}\nevent: previsao\ndata: {dados}\n\n"
+
+    resp = Response(
+        stream_with_context(eventos()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+    # O servidor fecha a resposta quando o cliente desconecta (mesmo antes do primeiro
+    # evento): so entao a vaga e a assinatura do canal sao devolvidas.
+    resp.call_on_close(canal_previsao.cancelar)
+    return resp
 
 
 # ================= MAIN =================
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import app
+import metricas
+
+# Entrada asyncio (ASGI) do mesmo servico: uvicorn asgi:aplicacao
+#
+# /health, /bet/10-plus, /bet/<limiar>-plus e o stream SSE sao atendidos direto no event
+# loop; a logica de previsao e a mesma do app.py (previsao_coalescida, resposta_delta,
+# serializar), chamada numa thread com asyncio.to_thread porque as leituras do Firebase
+# sao bloqueantes. Requisicoes iguais em voo esperam o mesmo Future, entao milhares de
+# conexoes abertas ocupam no maximo uma thread por chave de previsao. Os streams nao
+# ocupam thread nenhuma: uma unica tarefa faz a ponte com o CanalPrevisao e acorda todos.
+# As demais rotas (/ready, /metrics, /bet/lote, POST /rodadas) passam pelo Flask numa
+# thread, com o mesmo contrato do gunicorn.
+
+# ================= CONFIG =================
+# Threads para leituras do backend e para as rotas servidas pelo Flask.
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "32"))
+# Espera maxima da ponte no CanalPrevisao (limita a demora para encerrar o processo).
+ASGI_PONTE_SEG = float(os.getenv("ASGI_PONTE_SEG", "1"))
+
+Enviar = Callable[[dict], Awaitable[None]]
+Receber = Callable[[], Awaitable[dict]]
+
+
+# ================= SINGLE-FLIGHT ASYNC =================
+class SingleFlightAsync:
+    def __init__(self) -> None:
+        self._em_voo: Dict[Hashable, asyncio.Future] = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    async def executar(self, chave: Hashable, fn: Callable[[], Any]) -> Any:
+        futuro = self._em_voo.get(chave)
+        if futuro is None:
+            self.execucoes += 1
+            futuro = asyncio.ensure_future(asyncio.to_thread(fn))
+            self._em_voo[chave] = futuro
+            futuro.add_done_callback(lambda _: self._em_voo.pop(chave, None))
+        else:
+            self.coalescidas += 1
+        # shield: cliente que desconecta cancela so a propria espera, nao o calculo.
+        return await asyncio.shield(futuro)
+
+
+# ================= PONTE DO STREAM =================
+class PonteCanal:
+    def __init__(self) -> None:
+        self._seq = -1
+        self._payload: Optional[dict] = None
+        self._evento: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self.clientes = 0
+
+    def iniciar(self) -> None:
+        if self._tarefa is None or self._tarefa.done():
+            self._evento = asyncio.Event()
+            self._tarefa = asyncio.get_running_loop().create_task(self._loop())
+
+    async def _loop(self) -> None:
+        # A ponte e um unico assinante do CanalPrevisao enquanto houver stream aberto; sem
+        # clientes a tarefa termina (sem await depois do teste) e o canal para de ler o banco.
+        await asyncio.to_thread(app.init_firebase)
+        app.canal_previsao.assinar()
+        try:
+            seq = -1
+            while self.clientes:
+                seq_novo, payload = await asyncio.to_thread(app.canal_previsao.aguardar, seq, ASGI_PONTE_SEG)
+                if payload is None:
+                    continue
+                seq, self._seq, self._payload = seq_novo, seq_novo, payload
+                evento, self._evento = self._evento, asyncio.Event()
+                evento.set()
+        finally:
+            app.canal_previsao.cancelar()
+            self._seq, self._payload = -1, None
+
+    async def aguardar(self, desde: int, timeout: float) -> Tuple[int, Optional[dict]]:
+        if self._payload is not None and self._seq != desde:
+            return self._seq, self._payload
+        try:
+            await asyncio.wait_for(self._evento.wait(), timeout)
+        except asyncio.TimeoutError:
+            return desde, None
+        return self._seq, self._payload
+
+
+coalescedor_async = SingleFlightAsync()
+ponte_canal = PonteCanal()
+
+
+# ================= HTTP =================
+def _cabecalhos(scope: dict) -> Dict[str, str]:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+
+def _argumentos(scope: dict) -> Dict[str, str]:
+    # Mesma semantica de request.args.get: vale a primeira ocorrencia.
+    args: Dict[str, str] = {}
+    for k, v in parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True):
+        args.setdefault(k, v)
+    return args
+
+
+async def _responder(send: Enviar, status: int, corpo: bytes, cabecalhos: List[Tuple[bytes, bytes]]) -> None:
+    cabecalhos = cabecalhos + [(b"content-length", str(len(corpo)).encode())]
+    await send({"type": "http.response.start", "status": status, "headers": cabecalhos})
+    await send({"type": "http.response.body", "body": corpo})
+
+
+async def _json(send: Enviar, status: int, corpo: dict, cabecalhos: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    await _responder(send, status, app.serializar(corpo)[0], [(b"content-type", b"application/json")] + (cabecalhos or []))
+
+
+def _iniciar_timing(scope: dict, args: Dict[str, str]) -> None:
+    # Mesmo opt-in do Flask (before_request): SERVER_TIMING, ?timing=1 ou X-Server-Timing: 1.
+    if app.SERVER_TIMING or args.get("timing") == "1" or _cabecalhos(scope).get("x-server-timing") == "1":
+        metricas.iniciar_coleta_requisicao()
+
+
+def _fim_timing(inicio: float) -> List[Tuple[bytes, bytes]]:
+    tempos = metricas.encerrar_coleta_requisicao()
+    if tempos is None:
+        return []
+    tempos.append(("total", time.perf_counter() - inicio))
+    return [(b"server-timing", metricas.server_timing(tempos).encode("latin-1"))]
+
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for item in if_none_match.split(","):
+        item = item.strip()
+        if item == "*" or item.removeprefix("W/").strip('"') == etag:
+            return True
+    return False
+
+
+async def _servir_previsao(scope: dict, send: Enviar, limiar: str, inicio: float) -> None:
+    args = _argumentos(scope)
+    # A coleta fica no contexto desta requisicao; to_thread (e a tarefa do single-flight,
+    # criada aqui pelo lider) copia o contexto, entao os estagios do calculo entram nela.
+    _iniciar_timing(scope, args)
+    try:
+        desde = app._ler_desde(args)
+        parametros = app._ler_parametros(limiar, args.get("window", str(app.PARAMETROS_PADRAO.janela)), args)
+    except ValueError as e:
+        await _json(send, 400, {"erro": str(e)}, _fim_timing(inicio))
+        return
+    previsao = await coalescedor_async.executar(
+        ("previsao", parametros), lambda: app.previsao_coalescida(parametros=parametros)
+    )
+    app.REGRAS.incrementar(regra=previsao.corpo["regra"])
+    dados, etag = previsao.json, previsao.etag
+    if desde is not None:
+        dados, etag = app.serializar(app.resposta_delta(previsao, desde))
+    cabecalhos = [(b"etag", f'"{etag}"'.encode()), (b"cache-control", b"no-cache")] + _fim_timing(inicio)
+    if _etag_confere(_cabecalhos(scope).get("if-none-match"), etag):
+        await _responder(send, 304, b"", cabecalhos)
+        return
+    await _responder(send, 200, dados, [(b"content-type", b"application/json")] + cabecalhos)
+
+
+async def _esperar_desconexao(receive: Receber) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _servir_stream(scope: dict, receive: Receber, send: Enviar) -> None:
+    # Conta o cliente antes de a ponte rodar: ela encerra quando nao ve nenhum.
+    ponte_canal.clientes += 1
+    ponte_canal.iniciar()
+    desconexao = asyncio.ensure_future(_esperar_desconexao(receive))
+    try:
+        args = _argumentos(scope)
+        seq = app.canal_previsao.seq_de(_cabecalhos(scope).get("last-event-id") or args.get("ultimo_id"))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        while True:
+            espera = asyncio.ensure_future(ponte_canal.aguardar(seq, app.STREAM_HEARTBEAT_SEG))
+            await asyncio.wait((espera, desconexao), return_when=asyncio.FIRST_COMPLETED)
+            if desconexao.done():
+                espera.cancel()
+                return
+            seq_novo, payload = espera.result()
+            if payload is None:
+                evento = ": heartbeat\n\n"
+            else:
+                seq = seq_novo
+                dados = json.dumps(payload, ensure_ascii=False)
+                evento = f"id: {app.canal_previsao.id_evento(seq)}\nevent: previsao\ndata: {dados}\n\n"
+            await send({"type": "http.response.body", "body": evento.encode("utf-8"), "more_body": True})
+    except OSError:
+        # Conexao caiu no meio do envio.
+        return
+    finally:
+        ponte_canal.clientes -= 1
+        desconexao.cancel()
+
+
+# ================= FLASK (DEMAIS ROTAS) =================
+async def _ler_corpo(receive: Receber) -> bytes:
+    partes = []
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            break
+        partes.append(msg.get("body", b""))
+        if not msg.get("more_body"):
+            break
+    return b"".join(partes)
+
+
+def _environ(scope: dict, corpo: bytes) -> dict:
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(servidor[0]),
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": cliente[0],
+        "REMOTE_PORT": str(cliente[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(corpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(corpo)),
+    }
+    for nome, valor in scope.get("headers", []):
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = valor
+        elif nome != "CONTENT_LENGTH":
+            chave = f"HTTP_{nome}"
+            environ[chave] = f"{environ[chave]},{valor}" if chave in environ else valor
+    return environ
+
+
+async def _servir_flask(scope: dict, receive: Receber, send: Enviar) -> None:
+    environ = _environ(scope, await _ler_corpo(receive))
+    inicio: Dict[str, Any] = {}
+
+    def start_response(status: str, cabecalhos: List[Tuple[str, str]], exc_info: Any = None) -> Callable[[bytes], None]:
+        inicio["status"] = int(status.split(" ", 1)[0])
+        inicio["cabecalhos"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in cabecalhos]
+        return lambda _: None
+
+    def executar() -> bytes:
+        resultado = app.app(environ, start_response)
+        try:
+            return b"".join(resultado)
+        finally:
+            if hasattr(resultado, "close"):
+                resultado.close()
+
+    corpo = await asyncio.to_thread(executar)
+    await send({"type": "http.response.start", "status": inicio["status"], "headers": inicio["cabecalhos"]})
+    await send({"type": "http.response.body", "body": corpo})
+
+
+# ================= APLICACAO =================
+async def _lifespan(receive: Receber, send: Enviar) -> None:
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+            )
+            if app.COMPACTACAO_MANTER_DIAS > 0 and not app._compactacao_agendada:
+                app._agendar_compactacao()
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(app.escritor_historico.esvaziar, 5.0)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def aplicacao(scope: dict, receive: Receber, send: Enviar) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    caminho = scope["path"]
+    if scope["method"] != "GET":
+        await _servir_flask(scope, receive, send)
+        return
+    if caminho == "/bet/10-plus/stream":
+        await _servir_stream(scope, receive, send)
+        return
+
+    inicio = time.perf_counter()
+    if caminho == "/health":
+        rota = "/health"
+        await _json(send, 200, {"status": "ok"})
+    elif caminho.startswith("/bet/") and caminho.endswith("-plus") and "/" not in caminho[5:-5] and caminho[5:-5]:
+        rota = "/bet/10-plus" if caminho == "/bet/10-plus" else "/bet/<limiar>-plus"
+        await _servir_previsao(scope, send, caminho[5:-5], inicio)
+    else:
+        await _servir_flask(scope, receive, send)
+        return
+    app.LATENCIA_ROTA.observar(time.perf_counter() - inicio, rota=rota)
+
+
+# ================= MAIN =================
+def main() -> None:
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("uvicorn nao instalado: pip install uvicorn") from None
+    uvicorn.run(
+        "asgi:aplicacao",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "5000")),
+        log_level=os.getenv("LOG_LEVEL", "warning"),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_SEG", "75")),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import app
+import compactacao
+
+# Replay das regras de app.analisar sobre o historico inteiro: a cada rodada o
+# AnalisadorIncremental recebe a rodada, avalia a previsao com o relogio parado no
+# horario dela e a hora_prevista e comparada com o proximo 10+ que realmente saiu.
+
+
+# ================= CARGA =================
+def carregar_arvore(arvore: Any) -> app.HistoricoColunar:
+    col = app.HistoricoColunar()
+    if not isinstance(arvore, dict):
+        return col
+    for data, itens in arvore.items():
+        if not isinstance(itens, dict):
+            continue
+        app._anexar_dia_tolerante(col, itens, data)
+    col.ordenar()
+    return col
+
+
+def carregar_exportacao(caminho: str) -> app.HistoricoColunar:
+    with open(caminho, "r", encoding="utf-8") as fh:
+        raiz = json.load(fh)
+    # Aceita tanto a exportacao do no historico quanto a do banco inteiro; nesta ultima
+    # os dias ja compactados (ARQUIVO_PATH) entram tambem.
+    arvore = _descer(raiz, app.HISTORICO_PATH)
+    return _juntar(compactacao.ler_arvore(_descer(raiz, app.ARQUIVO_PATH)), carregar_arvore(arvore))
+
+
+def _descer(arvore: Any, path: str) -> Any:
+    for parte in path.split("/"):
+        if isinstance(arvore, dict) and parte in arvore and not _parece_dia(arvore):
+            arvore = arvore[parte]
+    return arvore
+
+
+def _parece_dia(arvore: dict) -> bool:
+    return any(len(k) == 10 and k[4] == "-" and k[7] == "-" for k in arvore)
+
+
+def _juntar(arquivo: app.HistoricoColunar, recente: app.HistoricoColunar) -> app.HistoricoColunar:
+    if not len(arquivo):
+        return recente
+    arquivo.ts.extend(recente.ts)
+    arquivo.mult.extend(recente.mult)
+    arquivo.ordenar()
+    return arquivo
+
+
+def carregar_firebase() -> app.HistoricoColunar:
+    app.init_firebase()
+    return _juntar(compactacao.carregar_arquivo(), carregar_arvore(app.db.reference(app.HISTORICO_PATH).get()))
+
+
+# ================= PLACAR =================
+class Placar:
+    def __init__(self, tolerancia: int = 30):
+        self.tolerancia = tolerancia
+        self.avaliadas = 0
+        self.sem_previsao = 0
+        self.por_regra: Dict[str, List[float]] = {}
+
+    def registrar(self, regra: str, erro: int) -> None:
+        # [previsoes, acertos, soma |erro|, soma erro]
+        s = self.por_regra.get(regra)
+        if s is None:
+            s = self.por_regra[regra] = [0, 0, 0, 0]
+        s[0] += 1
+        if abs(erro) <= self.tolerancia:
+            s[1] += 1
+        s[2] += abs(erro)
+        s[3] += erro
+
+    def somar(self, outro: "Placar") -> None:
+        self.avaliadas += outro.avaliadas
+        self.sem_previsao += outro.sem_previsao
+        for regra, s in outro.por_regra.items():
+            atual = self.por_regra.setdefault(regra, [0, 0, 0, 0])
+            for i, v in enumerate(s):
+                atual[i] += v
+
+    def resumo(self) -> dict:
+        regras = {}
+        total = [0, 0, 0, 0]
+        for regra, s in sorted(self.por_regra.items()):
+            regras[regra] = _metricas(s)
+            total = [a + b for a, b in zip(total, s)]
+        return {
+            "tolerancia_segundos": self.tolerancia,
+            "rodadas_avaliadas": self.avaliadas,
+            "sem_previsao": self.sem_previsao,
+            "geral": _metricas(total),
+            "por_regra": regras,
+        }
+
+
+def _metricas(s: List[float]) -> dict:
+    n = s[0]
+    return {
+        "previsoes": n,
+        "acertos": s[1],
+        "taxa_acerto": round(s[1] / n, 4) if n else 0.0,
+        "erro_medio_abs_seg": round(s[2] / n, 1) if n else 0.0,
+        "vies_seg": round(s[3] / n, 1) if n else 0.0,
+    }
+
+
+# ================= REPLAY =================
+def proximos_altos(ts: array, mult: array) -> array:
+    # proximo[i] = epoch do primeiro 10+ depois da rodada i (-1 se nao houver).
+    proximo = array("q", bytes(8 * len(ts)))
+    seguinte = -1
+    for i in range(len(ts) - 1, -1, -1):
+        proximo[i] = seguinte
+        if mult[i] >= 10:
+            seguinte = ts[i]
+    return proximo
+
+
+def replay_trecho(
+    ts: array, mult: array, proximo: array, inicio_pontuacao: int, janela: int, tolerancia: int
+) -> Placar:
+    placar = Placar(tolerancia)
+    analisador = app.AnalisadorIncremental(janela)
+    de_epoch, para_epoch = app.de_epoch, app.para_epoch
+    for i in range(len(ts)):
+        analisador.adicionar(ts[i], mult[i])
+        if i < inicio_pontuacao or proximo[i] < 0:
+            continue
+        placar.avaliadas += 1
+        av = analisador.avaliar(de_epoch(ts[i]))
+        if av.dt_prevista is None:
+            placar.sem_previsao += 1
+            continue
+        placar.registrar(av.resultado["regra"], proximo[i] - para_epoch(av.dt_prevista))
+    return placar
+
+
+def _trechos_por_dia(ts: array, alvo: int) -> List[Tuple[int, int]]:
+    n = len(ts)
+    if not n:
+        return []
+    inicios = [0] + [i for i in range(1, n) if ts[i] // 86400 != ts[i - 1] // 86400]
+    por_trecho = max(1, len(inicios) // max(alvo, 1))
+    cortes = inicios[::por_trecho] + [n]
+    return [(a, b) for a, b in zip(cortes, cortes[1:]) if b > a]
+
+
+def _executar_trecho(args: Tuple[bytes, bytes, bytes, int, int, int]) -> Placar:
+    ts_b, mult_b, prox_b, inicio, janela, tolerancia = args
+    ts, mult, prox = array("q"), array("d"), array("q")
+    ts.frombytes(ts_b)
+    mult.frombytes(mult_b)
+    prox.frombytes(prox_b)
+    return replay_trecho(ts, mult, prox, inicio, janela, tolerancia)
+
+
+def replay(col: app.HistoricoColunar, janela: int = 60, tolerancia: int = 30, processos: int = 0) -> Placar:
+    proximo = proximos_altos(col.ts, col.mult)
+    if processos <= 1:
+        return replay_trecho(col.ts, col.mult, proximo, 0, janela, tolerancia)
+
+    # Cada trecho (grupo de dias) recebe as `janela` rodadas anteriores como aquecimento,
+    # sem pontuar, para o analisador comecar no mesmo estado da execucao sequencial.
+    tarefas = []
+    for a, b in _trechos_por_dia(col.ts, processos * 4):
+        aq = max(0, a - janela)
+        tarefas.append(
+            (
+                col.ts[aq:b].tobytes(),
+                col.mult[aq:b].tobytes(),
+                proximo[aq:b].tobytes(),
+                a - aq,
+                janela,
+                tolerancia,
+            )
+        )
+    placar = Placar(tolerancia)
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        for parcial in pool.map(_executar_trecho, tarefas):
+            placar.somar(parcial)
+    return placar
+
+
+# ================= MAIN =================
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backtest das regras de previsao sobre o historico.")
+    fonte = parser.add_mutually_exclusive_group(required=True)
+    fonte.add_argument("--arquivo", help="Exportacao JSON de aviator/historico (ou do banco inteiro, com o arquivo).")
+    fonte.add_argument("--firebase", action="store_true", help="Le o historico direto do Firebase.")
+    parser.add_argument("--janela", type=int, default=60)
+    parser.add_argument("--tolerancia", type=int, default=30, help="Acerto se |erro| <= tolerancia (s).")
+    parser.add_argument("--processos", type=int, default=0, help="0/1 = sequencial; N = pool dividido por dia; -1 = todos os nucleos.")
+    parser.add_argument("--saida", help="Grava o resumo em JSON neste caminho.")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    col = carregar_firebase() if args.firebase else carregar_exportacao(args.arquivo)
+    t1 = time.perf_counter()
+    processos = args.processos if args.processos >= 0 else (os.cpu_count() or 1)
+    placar = replay(col, args.janela, args.tolerancia, processos)
+    t2 = time.perf_counter()
+
+    resumo = placar.resumo()
+    resumo["rodadas"] = len(col)
+    resumo["carga_seg"] = round(t1 - t0, 3)
+    resumo["replay_seg"] = round(t2 - t1, 3)
+    resumo["rodadas_por_seg"] = round(len(col) / (t2 - t1), 1) if t2 > t1 else 0.0
+
+    print(f"{len(col)} rodadas | carga {resumo['carga_seg']}s | replay {resumo['replay_seg']}s ({resumo['rodadas_por_seg']}/s)")
+    for regra, m in [("geral", resumo["geral"])] + list(resumo["por_regra"].items()):
+        print(
+            f"  {regra:<26} n={m['previsoes']:<8} acerto={m['taxa_acerto']:.2%}"
+            f"  |erro| medio={m['erro_medio_abs_seg']}s  vies={m['vies_seg']}s"
+        )
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as fh:
+            json.dump(resumo, fh, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import app
+import firebase_local
+
+DATA_PADRAO = "2026-01-15"
+PERFIS = {"dia": 1, "mes": 30, "ano": 365, "anos": 3 * 365}
+
+
+# ================= DADOS SINTETICOS =================
+def gerar_dia(data: str = DATA_PADRAO, rodadas: int = 4000, seed: int = 1) -> Dict[str, str]:
+    historico = firebase_local.gerar_historico(1, rodadas, inicio=data, seed=seed)
+    return historico.get(data, {})
+
+
+def _medir(fn: Callable[[], Any], repeticoes: int) -> Dict[str, float]:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {
+        "n": repeticoes,
+        "min_ms": tempos[0] * 1000,
+        "mediana_ms": statistics.median(tempos) * 1000,
+        "p95_ms": tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))] * 1000,
+    }
+
+
+def _zerar_estado(modo: str, arquivo: Optional[str] = None) -> None:
+    app.historico_cache.parar()
+    app.HISTORICO_MODO = modo
+    app.historico_cache = app.HistoricoCache(arquivo=arquivo)
+    app.previsao_cache = app.PrevisaoCache()
+    app.coalescedor = app.SingleFlight(0)
+
+
+# ================= PARSE =================
+def bench_parse(rodadas: int = 4000, repeticoes: int = 5) -> Dict[str, float]:
+    itens = gerar_dia(rodadas=rodadas)
+
+    def por_linha() -> None:
+        for v in itens.values():
+            app.parse_linha(v, DATA_PADRAO)
+
+    def em_lote() -> None:
+        app.parse_dia(itens, DATA_PADRAO)
+
+    t_linha = min(timeit.repeat(por_linha, number=1, repeat=repeticoes))
+    t_lote = min(timeit.repeat(em_lote, number=1, repeat=repeticoes))
+    return {
+        "linhas": len(itens),
+        "parse_linha_seg": t_linha,
+        "parse_dia_seg": t_lote,
+        "parse_linha_linhas_por_seg": len(itens) / t_linha,
+        "parse_dia_linhas_por_seg": len(itens) / t_lote,
+        "speedup": t_linha / t_lote,
+    }
+
+
+# ================= CARGA =================
+def bench_carga(historico: dict, repeticoes: int) -> Dict[str, Any]:
+    banco = firebase_local.BancoLocal({})
+    _colocar(banco, historico)
+    originais = firebase_local.instalar(app, banco)
+    res: Dict[str, Any] = {}
+    arquivo = os.path.join(tempfile.mkdtemp(prefix="predit_bench_"), "historico")
+    try:
+        # listener_arquivo: boot pela copia local (HISTORICO_ARQUIVO) ja gravada uma vez.
+        _zerar_estado("listener", arquivo)
+        app.historico_cache.iniciar()
+        app.historico_cache.persistir()
+        for nome, modo, arq in (
+            ("completo", "completo", None),
+            ("janela", "janela", None),
+            ("listener", "listener", None),
+            ("listener_arquivo", "listener", arquivo),
+        ):
+            # Fria: estado zerado a cada repeticao (primeira requisicao de um worker novo).
+            def fria() -> None:
+                _zerar_estado(modo, arq)
+                app.obter_previsao(60)
+
+            leituras = banco.leituras
+            fria_ms = _medir(fria, max(1, repeticoes // 5) if nome in ("completo", "listener") else repeticoes)
+            _zerar_estado(modo, arq)
+            app.obter_previsao(60)
+            leituras_antes = banco.leituras
+            # Quente: mesmo processo, caches preenchidos.
+            quente_ms = _medir(lambda: app.obter_previsao(60), repeticoes)
+            res[nome] = {
+                "fria": fria_ms,
+                "quente": quente_ms,
+                "leituras_por_requisicao_quente": (banco.leituras - leituras_antes) / repeticoes,
+                "leituras_total": banco.leituras - leituras,
+            }
+    finally:
+        _zerar_estado("listener")
+        firebase_local.restaurar(app, originais)
+    return res
+
+
+def _colocar(banco: firebase_local.BancoLocal, historico: dict) -> None:
+    no = banco.dados
+    partes = app.HISTORICO_PATH.split("/")
+    for p in partes[:-1]:
+        no = no.setdefault(p, {})
+    no[partes[-1]] = historico
+
+
+# ================= ANALISE POR REGRA =================
+def _janela_para_regra(regra: str) -> tuple:
+    base = datetime(2026, 1, 15, 12, 0, 0)
+    ts0 = app.para_epoch(base)
+    col = app.HistoricoColunar()
+    mults = [1.5, 2.1, 1.1, 3.4, 1.2] * 12
+    for i, m in enumerate(mults[:58]):
+        col.anexar(ts0 + i * 20, m)
+    fim = ts0 + 57 * 20
+    if regra == "espelho_intervalo_altos":
+        col.anexar(fim + 20, 12.0)
+        col.anexar(fim + 80, 15.0)
+        agora = app.de_epoch(fim + 90)
+    else:
+        col.anexar(fim + 20, 1.3)
+        col.anexar(fim + 40, 11.0)
+        atraso = {"regra_4_minutos": 60, "regra_5_minutos": 270, "estatistica_real": 400}[regra]
+        agora = app.de_epoch(fim + 40 + atraso)
+    return col, agora
+
+
+def bench_analise(repeticoes: int) -> Dict[str, Any]:
+    res: Dict[str, Any] = {}
+    for regra in ("espelho_intervalo_altos", "regra_4_minutos", "regra_5_minutos", "estatistica_real"):
+        col, agora = _janela_para_regra(regra)
+        obtida = app.avaliar(col, agora).resultado["regra"]
+        if obtida != regra:
+            raise RuntimeError(f"janela sintetica de {regra} caiu em {obtida}")
+        inc = app.AnalisadorIncremental(60)
+        inc.recarregar(col)
+        n = max(1, repeticoes * 20)
+        res[regra] = {
+            "avaliar_us": min(timeit.repeat(lambda: app.avaliar(col, agora), number=n, repeat=3)) / n * 1e6,
+            "incremental_us": min(timeit.repeat(lambda: inc.avaliar(agora), number=n, repeat=3)) / n * 1e6,
+        }
+    return res
+
+
+# ================= PONTA A PONTA =================
+def bench_endpoint(historico: dict, repeticoes: int) -> Dict[str, Any]:
+    banco = firebase_local.BancoLocal({})
+    _colocar(banco, historico)
+    originais = firebase_local.instalar(app, banco)
+    res: Dict[str, Any] = {}
+    try:
+        with app.app.test_client() as cliente:
+            for modo in ("completo", "janela", "listener"):
+                _zerar_estado(modo)
+                cliente.get("/bet/10-plus")
+
+                def chamar() -> None:
+                    r = cliente.get("/bet/10-plus")
+                    if r.status_code != 200:
+                        raise RuntimeError(f"/bet/10-plus respondeu {r.status_code}")
+
+                res[modo] = _medir(chamar, repeticoes)
+    finally:
+        _zerar_estado("listener")
+        firebase_local.restaurar(app, originais)
+    return res
+
+
+# ================= RELATORIO =================
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _achatar(d: Any, prefixo: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(d, dict):
+        for k, v in d.items():
+            out.update(_achatar(v, f"{prefixo}.{k}" if prefixo else k))
+    elif isinstance(d, (int, float)) and not isinstance(d, bool):
+        out[prefixo] = d
+    return out
+
+
+def comparar(atual: dict, anterior: dict) -> List[str]:
+    a = _achatar(atual["resultados"])
+    b = _achatar(anterior["resultados"])
+    linhas = []
+    for chave in sorted(a.keys() & b.keys()):
+        # So tempos (maior = pior); vazoes como *_por_seg ficam de fora.
+        if not chave.endswith(("_ms", "_us", "_seg")) or chave.endswith("_por_seg") or not b[chave]:
+            continue
+        razao = a[chave] / b[chave]
+        marca = "  <-- regressao" if razao > 1.2 else ""
+        linhas.append(f"{chave:<60} {b[chave]:>10.3f} -> {a[chave]:>10.3f} ({razao:.2f}x){marca}")
+    return linhas
+
+
+# ================= MAIN =================
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks do servidor Predit com Firebase local.")
+    parser.add_argument("--perfil", choices=sorted(PERFIS), default="mes", help="Tamanho do historico sintetico.")
+    parser.add_argument("--dias", type=int, help="Sobrescreve o perfil com um numero de dias.")
+    parser.add_argument("--rodadas", type=int, default=4000, help="Rodadas do dia usado no bench de parse.")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--so", nargs="*", choices=("parse", "carga", "analise", "endpoint"))
+    parser.add_argument("--saida", default="bench_output.json")
+    parser.add_argument("--comparar", help="Resultado anterior (JSON) para comparar.")
+    args = parser.parse_args()
+
+    dias = args.dias or PERFIS[args.perfil]
+    etapas = set(args.so or ("parse", "carga", "analise", "endpoint"))
+    inicio = time.perf_counter()
+    historico = firebase_local.gerar_historico(dias) if etapas & {"carga", "endpoint"} else {}
+    rodadas = sum(len(v) for v in historico.values())
+    print(f"historico sintetico: {dias} dia(s), {rodadas} rodadas ({time.perf_counter() - inicio:.1f}s)")
+
+    resultados: Dict[str, Any] = {}
+    if "parse" in etapas:
+        resultados["parse"] = bench_parse(args.rodadas, 5)
+        print(f"parse: {resultados['parse']['speedup']:.1f}x ({resultados['parse']['parse_dia_linhas_por_seg']:.0f} linhas/s)")
+    if "carga" in etapas:
+        resultados["carga"] = bench_carga(historico, args.repeticoes)
+        for modo, r in resultados["carga"].items():
+            print(f"carga {modo:<16} fria {r['fria']['mediana_ms']:9.2f} ms | quente {r['quente']['mediana_ms']:7.3f} ms")
+    if "analise" in etapas:
+        resultados["analise"] = bench_analise(args.repeticoes)
+        for regra, r in resultados["analise"].items():
+            print(f"analise {regra:<24} {r['avaliar_us']:7.1f} us | incremental {r['incremental_us']:6.1f} us")
+    if "endpoint" in etapas:
+        resultados["endpoint"] = bench_endpoint(historico, args.repeticoes)
+        for modo, r in resultados["endpoint"].items():
+            print(f"/bet/10-plus {modo:<9} mediana {r['mediana_ms']:7.3f} ms | p95 {r['p95_ms']:7.3f} ms")
+
+    saida = {
+        "commit": _commit(),
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "dias": dias,
+        "rodadas": rodadas,
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as fh:
+        json.dump(saida, fh, indent=2)
+    print(f"resultado gravado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as fh:
+            anterior = json.load(fh)
+        print(f"comparacao com {anterior.get('commit')}:")
+        for linha in comparar(saida, anterior):
+            print("  " + linha)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+import app
+
+log = logging.getLogger(__name__)
+
+# Retencao do historico: dias de HISTORICO_PATH mais antigos que N dias viram um no
+# compacto em ARQUIVO_PATH/<data> e saem do historico no mesmo update multi-path (o banco
+# aplica os dois caminhos atomicamente, entao nenhum leitor ve o dia sumido ou duplicado).
+# O caminho quente (listener, janela, completo) passa a ler so os dias recentes; o backtest
+# (backtest.carregar_firebase) e outras analises leem o arquivo com carregar_arquivo.
+#
+# No compacto (versao 1):
+#   ts        base64 de int32 little-endian: segundos desde 00:00:00 do dia, em ordem
+#   mult      base64 de float64 little-endian, alinhado com ts
+#   invalidas linhas que o parser rejeitou, preservadas como estavam ({chave: texto})
+#   agregados n, max, media, intervalo_medio_seg e, para o limiar padrao, idx_altos
+#             (indices em ts/mult) e intervalos_altos (segundos entre altos seguidos)
+VERSAO = 1
+
+
+# ================= CODIFICACAO =================
+def _empacotar(valores: array) -> str:
+    if sys.byteorder == "big":
+        valores = array(valores.typecode, valores)
+        valores.byteswap()
+    return base64.b64encode(valores.tobytes()).decode("ascii")
+
+
+def _desempacotar(typecode: str, texto: Any) -> array:
+    valores = array(typecode)
+    if isinstance(texto, str) and texto:
+        valores.frombytes(base64.b64decode(texto))
+        if sys.byteorder == "big":
+            valores.byteswap()
+    return valores
+
+
+def compactar_dia(data: str, itens: Dict[str, Any], limiar: float = app.PARAMETROS_PADRAO.limiar) -> dict:
+    base = app._base_epoch_dia(data)
+    linhas: List[Tuple[int, float]] = []
+    invalidas: Dict[str, Any] = {}
+    # Chaves push sao cronologicas: ordenar por chave e depois (estavel) por horario
+    # mantem a ordem original das rodadas no mesmo segundo.
+    for chave in sorted(itens):
+        txt = itens[chave]
+        try:
+            r = app.parse_linha(txt, data)
+        except ValueError:
+            r = None
+        if r is None:
+            invalidas[chave] = txt
+            continue
+        linhas.append((app.para_epoch(r.dt) - base, r.mult))
+    linhas.sort(key=lambda x: x[0])
+    return _no_compacto(array("i", (x[0] for x in linhas)), array("d", (x[1] for x in linhas)), invalidas, limiar)
+
+
+def _no_compacto(segundos: array, mult: array, invalidas: Dict[str, Any], limiar: float) -> dict:
+    n = len(segundos)
+    idx_altos = [i for i in range(n) if mult[i] >= limiar]
+    no: Dict[str, Any] = {
+        "versao": VERSAO,
+        "ts": _empacotar(segundos),
+        "mult": _empacotar(mult),
+        "agregados": {
+            "n": n,
+            "max": max(mult) if n else 0.0,
+            "media": round(sum(mult) / n, 4) if n else 0.0,
+            "intervalo_medio_seg": round((segundos[-1] - segundos[0]) / (n - 1), 2) if n > 1 else 0.0,
+            "limiar": limiar,
+            "idx_altos": idx_altos,
+            "intervalos_altos": [segundos[b] - segundos[a] for a, b in zip(idx_altos, idx_altos[1:])],
+        },
+    }
+    if invalidas:
+        no["invalidas"] = invalidas
+    return no
+
+
+def ler_dia(data: str, no: Any) -> app.HistoricoColunar:
+    if not isinstance(no, dict) or no.get("versao") != VERSAO:
+        return app.HistoricoColunar()
+    base = app._base_epoch_dia(data)
+    segundos = _desempacotar("i", no.get("ts"))
+    mult = _desempacotar("d", no.get("mult"))
+    n = min(len(segundos), len(mult))
+    return app.HistoricoColunar(array("q", (base + s for s in segundos[:n])), mult[:n])
+
+
+def _mesclar(data: str, existente: Any, novo: dict, limiar: float) -> dict:
+    # Sobras de um dia ja arquivado (rodada gravada atrasada no dia antigo): junta as
+    # rodadas dos dois e recalcula os agregados.
+    antigo = ler_dia(data, existente)
+    if not len(antigo):
+        return novo
+    base = app._base_epoch_dia(data)
+    atual = ler_dia(data, novo)
+    linhas = sorted(
+        [(t - base, m) for t, m in zip(antigo.ts, antigo.mult)] + [(t - base, m) for t, m in zip(atual.ts, atual.mult)],
+        key=lambda x: x[0],
+    )
+    invalidas = dict(existente.get("invalidas") or {})
+    invalidas.update(novo.get("invalidas") or {})
+    return _no_compacto(array("i", (x[0] for x in linhas)), array("d", (x[1] for x in linhas)), invalidas, limiar)
+
+
+# ================= LEITURA =================
+def carregar_arquivo(desde: Optional[str] = None, ate: Optional[str] = None) -> app.HistoricoColunar:
+    app.init_firebase()
+    consulta = app.db.reference(app.ARQUIVO_PATH).order_by_key()
+    if desde:
+        consulta = consulta.start_at(desde)
+    if ate:
+        consulta = consulta.end_at(ate)
+    return ler_arvore(consulta.get())
+
+
+def ler_arvore(arvore: Any) -> app.HistoricoColunar:
+    col = app.HistoricoColunar()
+    if not isinstance(arvore, dict):
+        return col
+    for data in sorted(arvore):
+        dia = ler_dia(data, arvore[data])
+        col.ts.extend(dia.ts)
+        col.mult.extend(dia.mult)
+    return col
+
+
+# ================= COMPACTACAO =================
+def dias_para_compactar(manter_dias: int, hoje: Optional[str] = None) -> List[str]:
+    if manter_dias < 1:
+        raise ValueError("manter_dias deve ser >= 1 (o dia atual nunca e compactado)")
+    referencia = datetime.strptime(hoje, "%Y-%m-%d") if hoje else datetime.now()
+    corte = (referencia - timedelta(days=manter_dias - 1)).strftime("%Y-%m-%d")
+    app.init_firebase()
+    datas = app.db.reference(app.HISTORICO_PATH).get(shallow=True)
+    if not isinstance(datas, dict):
+        return []
+    return sorted(d for d in datas if d < corte and _data_valida(d))
+
+
+def _data_valida(data: str) -> bool:
+    try:
+        datetime.strptime(data, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def compactar(
+    manter_dias: int, hoje: Optional[str] = None, simular: bool = False, max_dias: Optional[int] = None
+) -> List[dict]:
+    limiar = app.PARAMETROS_PADRAO.limiar
+    feitos = []
+    for data in dias_para_compactar(manter_dias, hoje)[:max_dias]:
+        with app.cronometrar("fetch"):
+            itens = app.db.reference(app.HISTORICO_PATH).child(data).get()
+        if not isinstance(itens, dict):
+            continue
+        no = compactar_dia(data, itens, limiar)
+        if not simular:
+            existente = app.db.reference(app.ARQUIVO_PATH).child(data).get()
+            if existente is not None:
+                no = _mesclar(data, existente, no, limiar)
+            # Um dia por update: o pacote fica na casa de dezenas de KB e uma falha no meio
+            # deixa os dias ja feitos consistentes.
+            with app.cronometrar("compactar"):
+                app.db.reference("/").update({f"{app.ARQUIVO_PATH}/{data}": no, f"{app.HISTORICO_PATH}/{data}": None})
+        feitos.append(
+            {
+                "data": data,
+                "rodadas": no["agregados"]["n"],
+                "invalidas": len(no.get("invalidas", {})),
+                "bytes_antes": sum(len(k) + len(str(v)) for k, v in itens.items()),
+                "bytes_depois": len(no["ts"]) + len(no["mult"]),
+            }
+        )
+    return feitos
+
+
+# ================= AGENDAMENTO =================
+_agendador: Optional[threading.Thread] = None
+_agendador_lock = threading.Lock()
+_trava: Optional[int] = None
+
+
+def _segurar_trava() -> bool:
+    # Varios workers na mesma maquina: so quem pega a trava roda a tarefa (a compactacao
+    # e idempotente, mas nao ha por que repetir as leituras em cada processo).
+    global _trava
+    if _trava is not None or fcntl is None:
+        return True
+    fd = os.open(os.path.join(tempfile.gettempdir(), "predit_compactacao.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _trava = fd
+    return True
+
+
+def _rodar_agendado(manter_dias: int, intervalo_seg: float) -> None:
+    while True:
+        if _segurar_trava():
+            try:
+                for dia in compactar(manter_dias):
+                    log.info("compactacao: %s: %d rodadas arquivadas", dia["data"], dia["rodadas"])
+            except Exception as e:
+                log.warning("compactacao: falhou: %s", e)
+        time.sleep(intervalo_seg)
+
+
+def agendar(manter_dias: int, intervalo_seg: float) -> None:
+    global _agendador
+    with _agendador_lock:
+        if _agendador is not None and _agendador.is_alive():
+            return
+        _agendador = threading.Thread(
+            target=_rodar_agendado, args=(manter_dias, max(intervalo_seg, 60.0)), name="compactacao", daemon=True
+        )
+        _agendador.start()
+
+
+# ================= MAIN =================
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compacta dias antigos de aviator/historico em aviator/arquivo.")
+    parser.add_argument("--manter", type=int, default=app.COMPACTACAO_MANTER_DIAS or 7, help="Dias mantidos no historico (inclui hoje).")
+    parser.add_argument("--hoje", help="Data de referencia AAAA-MM-DD (padrao: hoje).")
+    parser.add_argument("--max-dias", type=int, help="Compacta no maximo N dias nesta execucao.")
+    parser.add_argument("--simular", action="store_true", help="So mostra o que seria compactado.")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    feitos = compactar(args.manter, args.hoje, args.simular, args.max_dias)
+    antes = sum(d["bytes_antes"] for d in feitos)
+    depois = sum(d["bytes_depois"] for d in feitos)
+    for d in feitos:
+        extra = f" ({d['invalidas']} invalidas preservadas)" if d["invalidas"] else ""
+        print(f"  {d['data']}: {d['rodadas']} rodadas, {d['bytes_antes']} -> {d['bytes_depois']} bytes{extra}")
+    acao = "seriam compactados" if args.simular else "compactados"
+    print(f"{len(feitos)} dia(s) {acao} em {time.perf_counter() - t0:.1f}s | ~{antes} -> ~{depois} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import copy
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import app
+
+# Substituto em processo do modulo firebase_admin.db, com o subconjunto que o servidor
+# usa (get/shallow, order_by_key + limit/start/end, listen, update/set/delete), e um
+# gerador de historico sintetico no formato "12.34x - HH:MM:SS". Serve para benchmarks
+# e experimentos sem o banco real; conta leituras e escritas para comparar modos.
+
+
+# ================= GERADOR DE HISTORICO =================
+def sortear_multiplicador(rnd: random.Random) -> float:
+    # Distribuicao de crash game: P(m >= x) ~ 0.97 / x, com piso em 1.00x.
+    u = rnd.random()
+    return max(1.0, int(97 / (100 * (1.0 - u)) * 100) / 100)
+
+
+def gerar_historico(
+    dias: int = 1, rodadas_por_dia: Optional[int] = None, inicio: str = "2026-01-01", seed: int = 1
+) -> Dict[str, Dict[str, str]]:
+    rnd = random.Random(seed)
+    t = datetime.strptime(inicio, "%Y-%m-%d")
+    fim = t + timedelta(days=dias)
+    historico: Dict[str, Dict[str, str]] = {}
+    contagem: Dict[str, int] = {}
+    while t < fim:
+        mult = sortear_multiplicador(rnd)
+        data = t.strftime("%Y-%m-%d")
+        if rodadas_por_dia is None or contagem.get(data, 0) < rodadas_por_dia:
+            ms = int((t - datetime(1970, 1, 1)).total_seconds() * 1000)
+            historico.setdefault(data, {})[app.chave_push(ms, [rnd.randrange(64) for _ in range(12)])] = f"{mult:.2f}x - {t.strftime('%H:%M:%S')}"
+            contagem[data] = contagem.get(data, 0) + 1
+        # Intervalo entre rodadas: espera fixa + voo que cresce com o multiplicador.
+        t += timedelta(seconds=rnd.randint(7, 11) + min(60, int(6 * mult ** 0.5)))
+    return historico
+
+
+# ================= BANCO LOCAL =================
+class Evento:
+    def __init__(self, event_type: str, path: str, data: Any):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class RegistroEscuta:
+    def __init__(self, banco: "BancoLocal", segmentos: List[str], callback: Callable[[Evento], None]):
+        self._banco = banco
+        self.segmentos = segmentos
+        self.callback = callback
+        # Mesmo atributo do ListenerRegistration do SDK, usado para checar se o stream vive;
+        # como no SDK, close() encerra a thread e espera por ela.
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._parar.wait, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._banco._remover_escuta(self)
+        self._parar.set()
+        self._thread.join()
+
+
+class BancoLocal:
+    def __init__(self, dados: Optional[dict] = None, latencia_seg: float = 0.0):
+        self.dados: dict = dados if dados is not None else {}
+        self.latencia_seg = latencia_seg
+        self.leituras = 0
+        self.escritas = 0
+        self._lock = threading.RLock()
+        self._escutas: List[RegistroEscuta] = []
+
+    def reference(self, path: str = "/") -> "ReferenciaLocal":
+        return ReferenciaLocal(self, [p for p in path.split("/") if p])
+
+    def _no(self, segmentos: List[str]) -> Any:
+        no = self.dados
+        for p in segmentos:
+            if not isinstance(no, dict) or p not in no:
+                return None
+            no = no[p]
+        return no
+
+    def _ler(self, segmentos: List[str]) -> Any:
+        if self.latencia_seg:
+            time.sleep(self.latencia_seg)
+        with self._lock:
+            self.leituras += 1
+            return copy.deepcopy(self._no(segmentos))
+
+    def _gravar(self, segmentos: List[str], valor: Any) -> None:
+        with self._lock:
+            no = self.dados
+            for p in segmentos[:-1]:
+                prox = no.get(p)
+                if not isinstance(prox, dict):
+                    prox = no[p] = {}
+                no = prox
+            if valor is None:
+                no.pop(segmentos[-1], None)
+            else:
+                no[segmentos[-1]] = copy.deepcopy(valor)
+            escutas = list(self._escutas)
+        for escuta in escutas:
+            n = len(escuta.segmentos)
+            if segmentos[:n] == escuta.segmentos:
+                escuta.callback(Evento("put", "/" + "/".join(segmentos[n:]), copy.deepcopy(valor)))
+
+    def _remover_escuta(self, escuta: RegistroEscuta) -> None:
+        with self._lock:
+            if escuta in self._escutas:
+                self._escutas.remove(escuta)
+
+
+class ConsultaLocal:
+    def __init__(self, banco: BancoLocal, segmentos: List[str]):
+        self._banco = banco
+        self._segmentos = segmentos
+        self._primeiros: Optional[int] = None
+        self._ultimos: Optional[int] = None
+        self._inicio: Optional[str] = None
+        self._fim: Optional[str] = None
+
+    def limit_to_first(self, n: int) -> "ConsultaLocal":
+        self._primeiros = n
+        return self
+
+    def limit_to_last(self, n: int) -> "ConsultaLocal":
+        self._ultimos = n
+        return self
+
+    def start_at(self, chave: str) -> "ConsultaLocal":
+        self._inicio = chave
+        return self
+
+    def end_at(self, chave: str) -> "ConsultaLocal":
+        self._fim = chave
+        return self
+
+    def get(self) -> Any:
+        if self._banco.latencia_seg:
+            time.sleep(self._banco.latencia_seg)
+        with self._banco._lock:
+            self._banco.leituras += 1
+            no = self._banco._no(self._segmentos)
+            if not isinstance(no, dict):
+                return copy.deepcopy(no)
+            chaves = sorted(no)
+            if self._inicio is not None:
+                chaves = [k for k in chaves if k >= self._inicio]
+            if self._fim is not None:
+                chaves = [k for k in chaves if k <= self._fim]
+            if self._primeiros is not None:
+                chaves = chaves[: self._primeiros]
+            if self._ultimos is not None:
+                chaves = chaves[-self._ultimos :] if self._ultimos else []
+            return {k: copy.deepcopy(no[k]) for k in chaves}
+
+
+class ReferenciaLocal:
+    def __init__(self, banco: BancoLocal, segmentos: List[str]):
+        self._banco = banco
+        self._segmentos = segmentos
+
+    @property
+    def key(self) -> Optional[str]:
+        return self._segmentos[-1] if self._segmentos else None
+
+    def child(self, path: str) -> "ReferenciaLocal":
+        return ReferenciaLocal(self._banco, self._segmentos + [p for p in path.split("/") if p])
+
+    def get(self, etag: bool = False, shallow: bool = False) -> Any:
+        valor = self._banco._ler(self._segmentos)
+        if shallow and isinstance(valor, dict):
+            return {k: True for k in valor}
+        return valor
+
+    def order_by_key(self) -> ConsultaLocal:
+        return ConsultaLocal(self._banco, self._segmentos)
+
+    def set(self, valor: Any) -> None:
+        self._banco.escritas += 1
+        self._banco._gravar(self._segmentos, valor)
+
+    def delete(self) -> None:
+        self.set(None)
+
+    def update(self, valores: Dict[str, Any]) -> None:
+        if not valores or not isinstance(valores, dict):
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        self._banco.escritas += 1
+        for caminho, valor in valores.items():
+            self._banco._gravar(self._segmentos + [p for p in caminho.split("/") if p], valor)
+
+    def listen(self, callback: Callable[[Evento], None]) -> RegistroEscuta:
+        escuta = RegistroEscuta(self._banco, self._segmentos, callback)
+        with self._banco._lock:
+            self._banco._escutas.append(escuta)
+            self._banco.leituras += 1
+            inicial = copy.deepcopy(self._banco._no(self._segmentos))
+        callback(Evento("put", "/", inicial))
+        return escuta
+
+
+def instalar(modulo_app: Any, banco: BancoLocal) -> Tuple[Any, Any]:
+    # Troca db/init_firebase do app pelo banco local; devolve os originais para restaurar.
+    originais = (modulo_app.db, modulo_app.init_firebase)
+    modulo_app.db = banco
+    modulo_app.init_firebase = lambda: None
+    return originais
+
+
+def restaurar(modulo_app: Any, originais: Tuple[Any, Any]) -> None:
+    modulo_app.db, modulo_app.init_firebase = originais
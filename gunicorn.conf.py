@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import threading
+
+# Cada stream SSE (/bet/10-plus/stream) prende uma thread enquanto o painel fica aberto.
+# Com o worker sync padrao um unico painel travaria as demais rotas e o arbiter mataria o
+# worker no timeout; com gthread o heartbeat do worker nao depende das threads de
+# requisicao, e o app recusa (503) streams alem de metade das threads, que ficam livres
+# para o polling. Para muitos paineis em stream use asgi.py (uvicorn asgi:aplicacao).
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+os.environ.setdefault("STREAM_MAX_CONEXOES", str(max(threads // 2, 1)))
+
+# Com HISTORICO_MODO=compartilhado um unico processo publicador (snapshot_compartilhado.py)
+# fala com o Firebase e grava a janela/previsao no snapshot mmap; os workers so leem.
+# O publicador e um processo separado para o master nao carregar o app (conexoes, threads
+# do listener) antes do fork. No master fica so uma thread de vigia, que dorme e confere
+# o processo a cada SNAPSHOT_VIGIA_SEG: se o publicador sair, sobe outro.
+SNAPSHOT_VIGIA_SEG = float(os.getenv("SNAPSHOT_VIGIA_SEG", "5"))
+_publicador = None
+_publicador_lock = threading.Lock()
+_encerrando = threading.Event()
+
+
+def _iniciar_publicador(server):
+    global _publicador
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    _publicador = subprocess.Popen([sys.executable, os.path.join(raiz, "snapshot_compartilhado.py")], cwd=raiz)
+    server.log.info("Publicador de snapshot iniciado (pid %s)", _publicador.pid)
+
+
+def _vigiar_publicador(server):
+    espera = SNAPSHOT_VIGIA_SEG
+    while not _encerrando.wait(espera):
+        with _publicador_lock:
+            # poll() tambem ve o processo que o proprio arbiter ja recolheu com waitpid(-1).
+            if _encerrando.is_set() or _publicador.poll() is None:
+                espera = SNAPSHOT_VIGIA_SEG
+                continue
+            server.log.warning("Publicador de snapshot (pid %s) saiu; reiniciando", _publicador.pid)
+            _iniciar_publicador(server)
+        # Publicador que cai logo ao subir (credencial, banco fora) espera cada vez mais.
+        espera = min(espera * 2, 60.0)
+
+
+def on_starting(server):
+    if os.getenv("HISTORICO_MODO", "").strip().lower() != "compartilhado":
+        return
+    if os.getenv("SNAPSHOT_PUBLICADOR", "gunicorn").strip().lower() != "gunicorn":
+        return
+    _iniciar_publicador(server)
+
+
+def when_ready(server):
+    if _publicador is not None:
+        threading.Thread(target=_vigiar_publicador, args=(server,), name="vigia-publicador", daemon=True).start()
+
+
+def on_exit(server):
+    _encerrando.set()
+    with _publicador_lock:
+        if _publicador is not None and _publicador.poll() is None:
+            _publicador.terminate()
+            try:
+                _publicador.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                _publicador.kill()
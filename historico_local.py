@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+from array import array
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Copia local do historico ja parseado, para o worker nao baixar tudo do Firebase a cada
+# boot. Duas colunas append-only, uma por arquivo: <base>.ts (epoch int64) e <base>.mult
+# (float64), cada uma com 8 bytes de magic e depois os valores em ordem de bytes nativa
+# (o arquivo e local da maquina). Com o cabecalho de 8 bytes os dados ficam alinhados e
+# podem ser lidos direto com array.fromfile ou mapeados com mmap + memoryview.cast.
+_MAGIC_TS = b"PREDHTS1"
+_MAGIC_MULT = b"PREDHMU1"
+_CABECALHO = 8
+_ITEM = 8
+
+# Varios workers podem apontar para o mesmo arquivo: todos leem no boot, mas so quem
+# segura a trava <base>.lock grava. Se esse processo morrer a trava e liberada e o
+# proximo worker que tentar persistir assume.
+class ArquivoHistorico:
+    def __init__(self, base: str):
+        self.base = base
+        self._colunas = ((base + ".ts", _MAGIC_TS, "q"), (base + ".mult", _MAGIC_MULT, "d"))
+        self.linhas = 0
+        self._trava: Optional[int] = None
+
+    def _escritor(self) -> bool:
+        if self._trava is not None or fcntl is None:
+            return True
+        fd = os.open(self.base + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._trava = fd
+        # Outro processo pode ter gravado ate agora: parte do que esta no disco.
+        self.linhas = self._linhas_no_disco()
+        return True
+
+    def _linhas_no_disco(self) -> int:
+        try:
+            return max(0, min((os.path.getsize(c) - _CABECALHO) // _ITEM for c, _, _ in self._colunas))
+        except OSError:
+            return 0
+
+    def carregar(self) -> Tuple[array, array]:
+        ts, mult = array("q"), array("d")
+        self.linhas = 0
+        try:
+            with open(self._colunas[0][0], "rb") as fts, open(self._colunas[1][0], "rb") as fmult:
+                if fts.read(_CABECALHO) != _MAGIC_TS or fmult.read(_CABECALHO) != _MAGIC_MULT:
+                    return ts, mult
+                # Gravacao interrompida no meio: vale so o prefixo presente nas duas colunas.
+                n = min(
+                    (os.fstat(fts.fileno()).st_size - _CABECALHO) // _ITEM,
+                    (os.fstat(fmult.fileno()).st_size - _CABECALHO) // _ITEM,
+                )
+                ts.fromfile(fts, n)
+                mult.fromfile(fmult, n)
+        except (OSError, EOFError):
+            return array("q"), array("d")
+        self.linhas = n
+        return ts, mult
+
+    def gravar(self, inicio: int, ts: array, mult: array) -> bool:
+        # Mantem as `inicio` primeiras linhas e anexa o resto. As duas colunas sao cortadas
+        # antes de qualquer anexo para um crash nunca parear ts novo com mult antigo.
+        # Devolve False se outro processo e o escritor.
+        if not self._escritor():
+            return False
+        if inicio > self.linhas:
+            raise ValueError(f"arquivo tem {self.linhas} linhas, nao da para gravar a partir de {inicio}")
+        if len(ts) != len(mult):
+            raise ValueError("colunas ts e mult com tamanhos diferentes")
+        arquivos = []
+        try:
+            for caminho, magic, _ in self._colunas:
+                fh = open(caminho, "r+b" if os.path.exists(caminho) else "w+b")
+                arquivos.append(fh)
+                if fh.read(_CABECALHO) != magic:
+                    if inicio:
+                        raise ValueError(f"cabecalho invalido em {caminho}")
+                    fh.seek(0)
+                    fh.write(magic)
+                fh.truncate(_CABECALHO + inicio * _ITEM)
+            for fh, coluna in zip(arquivos, (ts, mult)):
+                fh.seek(_CABECALHO + inicio * _ITEM)
+                coluna.tofile(fh)
+                fh.flush()
+                os.fsync(fh.fileno())
+        finally:
+            for fh in arquivos:
+                fh.close()
+        self.linhas = inicio + len(ts)
+        return True
+
+    def fechar(self) -> None:
+        if self._trava is not None:
+            os.close(self._trava)
+            self._trava = None
+
+    def apagar(self) -> None:
+        for caminho, _, _ in self._colunas:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+        self.linhas = 0
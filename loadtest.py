@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Teste de carga sem dependencias: cliente HTTP/1.1 keep-alive em asyncio, com N conexoes
+# fazendo polling de /bet/10-plus e M streams SSE abertos ao mesmo tempo (o padrao de uso
+# do painel). Serve para comparar a mesma carga contra o gunicorn e contra o asgi.py:
+#
+#   gunicorn -c gunicorn.conf.py -b :8000 app:app
+#   uvicorn asgi:aplicacao --port 8001
+#   python loadtest.py --alvo gunicorn=http://127.0.0.1:8000 --alvo asgi=http://127.0.0.1:8001 \
+#       --conexoes 200 --streams 1000 --duracao 20
+
+
+# ================= CLIENTE =================
+class Resultado:
+    def __init__(self) -> None:
+        self.latencias: List[float] = []
+        self.status: Dict[int, int] = {}
+        self.erros: Dict[str, int] = {}
+        self.streams_abertos = 0
+        self.streams_vivos_no_fim = 0
+        self.eventos = 0
+        self.primeiro_evento: List[float] = []
+
+    def erro(self, e: BaseException) -> None:
+        nome = type(e).__name__
+        self.erros[nome] = self.erros.get(nome, 0) + 1
+
+
+async def _ler_resposta(leitor: asyncio.StreamReader) -> Tuple[int, Dict[str, str], bytes]:
+    linha = await leitor.readline()
+    if not linha:
+        raise ConnectionResetError("conexao fechada pelo servidor")
+    status = int(linha.split(b" ", 2)[1])
+    cabecalhos: Dict[str, str] = {}
+    while True:
+        linha = await leitor.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    if "content-length" in cabecalhos:
+        corpo = await leitor.readexactly(int(cabecalhos["content-length"]))
+    elif cabecalhos.get("transfer-encoding", "").lower() == "chunked":
+        partes = []
+        while True:
+            tamanho = int((await leitor.readline()).split(b";")[0], 16)
+            partes.append(await leitor.readexactly(tamanho + 2))
+            if tamanho == 0:
+                break
+        corpo = b"".join(p[:-2] for p in partes)
+    elif status in (204, 304):
+        corpo = b""
+    else:
+        corpo = await leitor.read()
+    return status, cabecalhos, corpo
+
+
+async def polling(host: str, porta: int, caminho: str, fim: float, condicional: bool, res: Resultado) -> None:
+    etag: Optional[str] = None
+    conexao: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+    while time.monotonic() < fim:
+        try:
+            if conexao is None:
+                conexao = await asyncio.open_connection(host, porta)
+            leitor, escritor = conexao
+            extra = f"If-None-Match: {etag}\r\n" if condicional and etag else ""
+            inicio = time.perf_counter()
+            escritor.write(f"GET {caminho} HTTP/1.1\r\nHost: {host}\r\n{extra}Connection: keep-alive\r\n\r\n".encode())
+            await escritor.drain()
+            status, cabecalhos, _ = await _ler_resposta(leitor)
+            res.latencias.append(time.perf_counter() - inicio)
+            res.status[status] = res.status.get(status, 0) + 1
+            etag = cabecalhos.get("etag", etag)
+            if cabecalhos.get("connection", "").lower() == "close":
+                escritor.close()
+                conexao = None
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            res.erro(e)
+            if conexao is not None:
+                conexao[1].close()
+                conexao = None
+            await asyncio.sleep(0.05)
+
+
+async def stream(host: str, porta: int, caminho: str, fim: float, res: Resultado) -> None:
+    inicio = time.perf_counter()
+    try:
+        leitor, escritor = await asyncio.open_connection(host, porta)
+        escritor.write(f"GET {caminho} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await escritor.drain()
+        linha = await leitor.readline()
+        if b" 200 " not in linha:
+            raise ConnectionError(f"stream respondeu {linha.strip()!r}")
+    except (OSError, asyncio.IncompleteReadError) as e:
+        res.erro(e)
+        return
+    res.streams_abertos += 1
+    primeiro = True
+    try:
+        while True:
+            resta = fim - time.monotonic()
+            if resta <= 0:
+                res.streams_vivos_no_fim += 1
+                return
+            try:
+                linha = await asyncio.wait_for(leitor.readline(), resta)
+            except asyncio.TimeoutError:
+                continue
+            if not linha:
+                return
+            if linha.startswith(b"event: previsao"):
+                if primeiro:
+                    res.primeiro_evento.append(time.perf_counter() - inicio)
+                    primeiro = False
+                res.eventos += 1
+    except OSError as e:
+        res.erro(e)
+    finally:
+        escritor.close()
+
+
+# ================= EXECUCAO =================
+def _subir_limite_arquivos(necessarios: int) -> None:
+    if resource is None:
+        return
+    atual, maximo = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if atual < necessarios:
+        novo = necessarios if maximo == resource.RLIM_INFINITY else min(necessarios, maximo)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (novo, maximo))
+
+
+async def executar(url: str, caminho: str, conexoes: int, streams: int, duracao: float, condicional: bool) -> dict:
+    partes = urlsplit(url)
+    host, porta = partes.hostname or "127.0.0.1", partes.port or 80
+    res = Resultado()
+    # Streams abrem primeiro, para o polling medir latencia com eles ja pendurados.
+    fim_streams = time.monotonic() + duracao + 5
+    tarefas_stream = [asyncio.ensure_future(stream(host, porta, "/bet/10-plus/stream", fim_streams, res)) for _ in range(streams)]
+    if streams:
+        await asyncio.sleep(min(5.0, 0.5 + streams / 1000))
+    fim = time.monotonic() + duracao
+    await asyncio.gather(*(polling(host, porta, caminho, fim, condicional, res) for _ in range(conexoes)))
+    await asyncio.gather(*tarefas_stream)
+
+    lat = sorted(res.latencias)
+
+    def pct(p: float) -> float:
+        return lat[min(len(lat) - 1, int(len(lat) * p))] * 1000 if lat else 0.0
+
+    return {
+        "url": url + caminho,
+        "conexoes": conexoes,
+        "duracao_seg": duracao,
+        "requisicoes": len(lat),
+        "requisicoes_por_seg": round(len(lat) / duracao, 1),
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+        "status": {str(k): v for k, v in sorted(res.status.items())},
+        "erros": res.erros,
+        "streams_pedidos": streams,
+        "streams_abertos": res.streams_abertos,
+        "streams_vivos_no_fim": res.streams_vivos_no_fim,
+        "eventos_recebidos": res.eventos,
+        "primeiro_evento_mediana_ms": round(statistics.median(res.primeiro_evento) * 1000, 1) if res.primeiro_evento else None,
+    }
+
+
+def _imprimir(nome: str, r: dict) -> None:
+    print(
+        f"{nome:<10} {r['requisicoes_por_seg']:>9.1f} req/s | p50 {r['p50_ms']:7.2f} ms | p95 {r['p95_ms']:7.2f} ms"
+        f" | p99 {r['p99_ms']:8.2f} ms | streams {r['streams_vivos_no_fim']}/{r['streams_pedidos']}"
+        f" | erros {sum(r['erros'].values())}"
+    )
+
+
+# ================= MAIN =================
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Teste de carga de /bet/10-plus com streams SSE abertos.")
+    parser.add_argument("--alvo", action="append", required=True, help="nome=url, ex.: asgi=http://127.0.0.1:8001 (repetivel).")
+    parser.add_argument("--caminho", default="/bet/10-plus")
+    parser.add_argument("--conexoes", type=int, default=100, help="Conexoes keep-alive fazendo polling.")
+    parser.add_argument("--streams", type=int, default=0, help="Streams SSE abertos durante o teste.")
+    parser.add_argument("--duracao", type=float, default=15.0)
+    parser.add_argument("--condicional", action="store_true", help="Envia If-None-Match como o painel.")
+    parser.add_argument("--saida", help="Grava os resultados em JSON.")
+    args = parser.parse_args(argv)
+
+    _subir_limite_arquivos(args.conexoes + args.streams + 256)
+    resultados: Dict[str, Any] = {}
+    for alvo in args.alvo:
+        nome, _, url = alvo.partition("=")
+        if not url:
+            nome, url = urlsplit(alvo).netloc, alvo
+        resultados[nome] = asyncio.run(
+            executar(url.rstrip("/"), args.caminho, args.conexoes, args.streams, args.duracao, args.condicional)
+        )
+        _imprimir(nome, resultados[nome])
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as fh:
+            json.dump({"gerado_em": datetime.now().isoformat(timespec="seconds"), "resultados": resultados}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, Union
+
+# Limites (segundos) dos histogramas de latencia: de 100 us a 10 s.
+BUCKETS_PADRAO = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+M = TypeVar("M", "Contador", "Histograma", "MetricaFuncao")
+
+
+def _rotulos(kwargs: Dict[str, str]) -> Rotulos:
+    return tuple(sorted((k, str(v)) for k, v in kwargs.items()))
+
+
+def _escapar(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+    itens = list(rotulos) + ([extra] if extra else [])
+    if not itens:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in itens) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# ================= TIPOS =================
+class Contador:
+    def __init__(self, nome: str, ajuda: str):
+        self.nome = nome
+        self.ajuda = ajuda
+        self._lock = threading.Lock()
+        self._valores: Dict[Rotulos, float] = {}
+
+    def incrementar(self, valor: float = 1, **rotulos: str) -> None:
+        chave = _rotulos(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos: str) -> float:
+        return self._valores.get(_rotulos(rotulos), 0)
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        linhas.extend(f"{self.nome}{_fmt_rotulos(r)} {_fmt_num(v)}" for r, v in itens)
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, buckets: Tuple[float, ...] = BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # rotulos -> [contagem por bucket (nao cumulativa) + overflow, soma]
+        self._series: Dict[Rotulos, Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, **rotulos: str) -> None:
+        chave = _rotulos(rotulos)
+        i = 0
+        for limite in self.buckets:
+            if valor <= limite:
+                break
+            i += 1
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][i] += 1
+            serie[1][0] += valor
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            itens = sorted((r, (list(c), s[0])) for r, (c, s) in self._series.items())
+        for rotulos, (contagens, soma) in itens:
+            acumulado = 0
+            for limite, c in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += c
+                linhas.append(f"{self.nome}_bucket{_fmt_rotulos(rotulos, ('le', _fmt_num(limite)))} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_fmt_rotulos(rotulos)} {_fmt_num(soma)}")
+            linhas.append(f"{self.nome}_count{_fmt_rotulos(rotulos)} {acumulado}")
+        return linhas
+
+
+# Valor lido na hora da coleta (contadores ja mantidos por outros objetos, tamanhos, etc.).
+class MetricaFuncao:
+    def __init__(self, nome: str, tipo: str, ajuda: str, fn: Callable[[], Union[float, Dict[Rotulos, float]]]):
+        self.nome = nome
+        self.tipo = tipo
+        self.ajuda = ajuda
+        self.fn = fn
+
+    def exportar(self) -> List[str]:
+        valor = self.fn()
+        itens = sorted(valor.items()) if isinstance(valor, dict) else [((), valor)]
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        linhas.extend(f"{self.nome}{_fmt_rotulos(r)} {_fmt_num(v)}" for r, v in itens)
+        return linhas
+
+
+class RegistroMetricas:
+    def __init__(self) -> None:
+        self._metricas: List[Union[Contador, Histograma, MetricaFuncao]] = []
+
+    def registrar(self, metrica: M) -> M:
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str) -> Contador:
+        return self.registrar(Contador(nome, ajuda))
+
+    def histograma(self, nome: str, ajuda: str, buckets: Tuple[float, ...] = BUCKETS_PADRAO) -> Histograma:
+        return self.registrar(Histograma(nome, ajuda, buckets))
+
+    def funcao(self, nome: str, tipo: str, ajuda: str, fn: Callable[[], Union[float, Dict[Rotulos, float]]]) -> MetricaFuncao:
+        return self.registrar(MetricaFuncao(nome, tipo, ajuda, fn))
+
+    def exportar(self) -> str:
+        linhas: List[str] = []
+        for m in self._metricas:
+            linhas.extend(m.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+# ================= CRONOMETRO POR ESTAGIO =================
+REGISTRO = RegistroMetricas()
+LATENCIA_ESTAGIO = REGISTRO.histograma(
+    "predit_estagio_duracao_segundos", "Duracao de cada estagio do calculo da previsao."
+)
+
+# Tempos da requisicao atual para o header Server-Timing (None = nao coletar).
+_tempos_requisicao: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("tempos_requisicao", default=None)
+
+
+def iniciar_coleta_requisicao() -> None:
+    _tempos_requisicao.set([])
+
+
+def encerrar_coleta_requisicao() -> Optional[List[Tuple[str, float]]]:
+    tempos = _tempos_requisicao.get()
+    _tempos_requisicao.set(None)
+    return tempos
+
+
+def server_timing(tempos: List[Tuple[str, float]]) -> str:
+    return ", ".join(f"{nome};dur={seg * 1000:.3f}" for nome, seg in tempos)
+
+
+def observar_estagio(estagio: str, segundos: float) -> None:
+    LATENCIA_ESTAGIO.observar(segundos, estagio=estagio)
+    tempos = _tempos_requisicao.get()
+    if tempos is not None:
+        tempos.append((estagio, segundos))
+
+
+@contextmanager
+def cronometrar(estagio: str) -> Iterator[None]:
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar_estagio(estagio, time.perf_counter() - inicio)
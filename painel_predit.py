@@ -1,13 +1,129 @@
+import http.client
 import json
 import threading
 import tkinter as tk
 import tkinter.font as tkfont
 from datetime import datetime, timedelta
 from tkinter import ttk
-import urllib.error
+import urllib.parse
 import urllib.request
 
 DEFAULT_API = "https://server-preditor.onrender.com/bet/10-plus"
+STREAM_TIMEOUT_SEG = 45
+STREAM_RETRY_SEG = 30
+EPOCH = datetime(1970, 1, 1)
+FETCH_TIMEOUT_SEG = 10
+# Polling adaptativo: a cada POLL_MIN_SEG perto da hora prevista ou de uma troca de regra,
+# no maximo o intervalo escolhido longe delas; erros seguidos dobram a espera ate BACKOFF_MAX_SEG.
+POLL_MIN_SEG = 1.0
+POLL_PERTO_SEG = 15
+POLL_DEPOIS_SEG = 10
+BACKOFF_BASE_SEG = 2.0
+BACKOFF_MAX_SEG = 120.0
+
+
+# Janela ja parseada, mantida a partir do bloco "serie" do servidor. ts sao epochs do
+# relogio do jogo (datetime ingenuo contado como UTC), entao as diferencas de horario
+# saem exatas, inclusive na virada do dia.
+class ModeloSerie:
+    def __init__(self) -> None:
+        self.ts: list[int] = []
+        self.mult: list[float] = []
+        self.idx_altos: list[int] = []
+        self.referencias: list[int] = []
+        self.valido = False
+
+    @property
+    def cursor(self) -> int | None:
+        return self.ts[-1] if self.valido and self.ts else None
+
+    def aplicar(self, data: dict) -> bool:
+        # Resposta completa troca a janela; resposta delta (?desde=) troca as rodadas com
+        # ts >= desde pelas recebidas e corta para o tamanho informado. Sem "serie"
+        # (servidor antigo) o modelo fica invalido e o painel volta a ler as strings.
+        serie = data.get("serie") if isinstance(data, dict) else None
+        if not isinstance(serie, dict) or "idx_altos" not in serie:
+            self.valido = False
+            return False
+        if "tamanho" in serie and not data.get("completo"):
+            if not self.valido:
+                return False
+            desde = int(serie.get("desde", self.ts[-1] + 1 if self.ts else 0))
+            while self.ts and self.ts[-1] >= desde:
+                self.ts.pop()
+                self.mult.pop()
+            self.ts.extend(serie["ts"])
+            self.mult.extend(serie["mult"])
+            corte = len(self.ts) - int(serie["tamanho"])
+            if corte > 0:
+                del self.ts[:corte]
+                del self.mult[:corte]
+        else:
+            self.ts = list(serie["ts"])
+            self.mult = list(serie["mult"])
+        self.idx_altos = list(serie["idx_altos"])
+        self.referencias = list(serie.get("referencias", []))
+        self.valido = len(self.ts) == len(self.mult)
+        return self.valido
+
+    def _rodada(self, i: int) -> tuple[float, datetime]:
+        return self.mult[i], EPOCH + timedelta(seconds=self.ts[i])
+
+    def altos(self) -> list[tuple[float, datetime]]:
+        return [self._rodada(i) for i in self.idx_altos if 0 <= i < len(self.ts)]
+
+    def rodadas_referencia(self) -> list[tuple[float, datetime]]:
+        return [self._rodada(i) for i in self.referencias if 0 <= i < len(self.ts)]
+
+    @staticmethod
+    def segundos_desde(h: datetime) -> int:
+        return int((datetime.now() - h).total_seconds())
+
+
+# Uma conexao HTTP keep-alive reaproveitada entre as consultas. Se o servidor fechou a
+# conexao ociosa, o GET (idempotente) e repetido uma vez numa conexao nova.
+class ConexaoHTTP:
+    def __init__(self, timeout: float = FETCH_TIMEOUT_SEG) -> None:
+        self.timeout = timeout
+        self._conn: http.client.HTTPConnection | None = None
+        self._destino: tuple[str, str] = ("", "")
+        self._lock = threading.Lock()
+
+    def fechar(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _abrir(self, esquema: str, host: str) -> http.client.HTTPConnection:
+        if self._conn is None or self._destino != (esquema, host):
+            self.fechar()
+            classe = http.client.HTTPSConnection if esquema == "https" else http.client.HTTPConnection
+            self._conn = classe(host, timeout=self.timeout)
+            self._destino = (esquema, host)
+        return self._conn
+
+    def get(self, url: str, headers: dict[str, str]) -> tuple[int, dict[str, str], bytes]:
+        partes = urllib.parse.urlsplit(url)
+        caminho = (partes.path or "/") + (f"?{partes.query}" if partes.query else "")
+        with self._lock:
+            for tentativa in range(2):
+                conn = self._abrir(partes.scheme, partes.netloc)
+                try:
+                    conn.request("GET", caminho, headers=headers)
+                    resp = conn.getresponse()
+                    corpo = resp.read()
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError):
+                    self.fechar()
+                    if tentativa:
+                        raise
+                    continue
+                except Exception:
+                    self.fechar()
+                    raise
+                if resp.will_close:
+                    self.fechar()
+                return resp.status, {k.lower(): v for k, v in resp.getheaders()}, corpo
+        raise ConnectionError("sem resposta")
 
 
 class PainelPredit:
@@ -19,7 +135,8 @@ class PainelPredit:
 
         self.url_var = tk.StringVar(value=DEFAULT_API)
         self.auto_update_var = tk.BooleanVar(value=True)
-        self.interval_var = tk.StringVar(value="5")
+        self.stream_var = tk.BooleanVar(value=False)
+        self.interval_var = tk.StringVar(value="30")
         self.status_var = tk.StringVar(value="Pronto")
         self.hora_var = tk.StringVar(value="--:--:--")
         self.regra_var = tk.StringVar(value="-")
@@ -27,13 +144,27 @@ class PainelPredit:
         self.detalhe_var = tk.StringVar(value="")
 
         self._fetching = False
+        self._auto_job: str | None = None
+        self._stream_ativo = False
+        self._stream_thread: threading.Thread | None = None
+        self._stream_last_id = ""
         self._last_width = 0
+        self.modelo = ModeloSerie()
+        self._url_modelo = ""
+        self.conexao = ConexaoHTTP()
+        # (url, etag, corpo) da ultima resposta 200: vira If-None-Match na mesma URL.
+        self._ultima_consulta: tuple[str, str, bytes] = ("", "", b"")
+        self._falhas = 0
+        self._eventos: list[float] = []
+        self._exibido: tuple[str, ...] = ()
         self.time_font = tkfont.Font(family="Consolas", size=42, weight="bold")
         self.rule_font = tkfont.Font(family="Segoe UI", size=15, weight="bold")
         self.rule_sub_font = tkfont.Font(family="Segoe UI", size=10)
 
         self._setup_style()
         self._build_ui()
+        self.url_var.trace_add("write", lambda *_: self._atualizar_toggle_stream())
+        self._atualizar_toggle_stream()
         self.root.bind("<Configure>", self._on_resize)
 
     def _setup_style(self) -> None:
@@ -80,7 +211,7 @@ class PainelPredit:
             variable=self.auto_update_var,
             command=self._on_toggle_auto,
         ).pack(side="left")
-        ttk.Label(auto_bar, text="Intervalo (s):").pack(side="left", padx=(12, 6))
+        ttk.Label(auto_bar, text="Intervalo max (s):").pack(side="left", padx=(12, 6))
         self.interval_combo = ttk.Combobox(
             auto_bar,
             textvariable=self.interval_var,
@@ -89,6 +220,13 @@ class PainelPredit:
             state="readonly",
         )
         self.interval_combo.pack(side="left")
+        self.stream_check = ttk.Checkbutton(
+            auto_bar,
+            text="Stream (SSE)",
+            variable=self.stream_var,
+            command=self._on_toggle_stream,
+        )
+        self.stream_check.pack(side="left", padx=(12, 0))
 
         cards = ttk.Frame(main, style="Main.TFrame")
         cards.pack(fill="x", pady=(2, 6))
@@ -132,26 +270,36 @@ class PainelPredit:
         except Exception:
             return None
 
-    def _build_detalhe(self, data: dict, analise: dict, regra_raw: str) -> str:
+    def _rodadas_regra(self, data: dict) -> tuple[list[tuple[float, datetime]], list[tuple[float, datetime]]]:
+        # (altos, referencias da regra). Com o modelo tipado nao ha parse de string; sem
+        # ele (servidor antigo) le as strings e as referencias saem dos ultimos altos.
+        if self.modelo.valido:
+            return self.modelo.altos(), self.modelo.rodadas_referencia()
         mults = data.get("ultimos_60_multiplicadores", []) if isinstance(data, dict) else []
         parsed = [self._parse_mult_line(x) for x in mults if isinstance(x, str)]
         parsed = [p for p in parsed if p is not None]
-        altos = [p for p in parsed if p[0] >= 10.0]
+        return [p for p in parsed if p[0] >= 10.0], []
+
+    @staticmethod
+    def _intervalo(t1: datetime, t2: datetime) -> int:
+        diff = int((t2 - t1).total_seconds())
+        # Horarios sem data (parse legado): virada do dia entre os dois altos.
+        if diff < 0:
+            diff += 24 * 3600
+        return diff
 
+    def _build_detalhe(self, data: dict, analise: dict, regra_raw: str) -> str:
+        altos, refs = self._rodadas_regra(data)
         regra_norm = (regra_raw or "").lower()
 
-        if ("espelho" in regra_norm) and len(altos) >= 2:
-            m1, t1 = altos[-2]
-            m2, t2 = altos[-1]
-            diff = int((t2 - t1).total_seconds())
-            if diff < 0:
-                diff += 24 * 3600
+        if ("espelho" in regra_norm) and (len(refs) >= 2 or len(altos) >= 2):
+            (m1, t1), (m2, t2) = refs[-2:] if len(refs) >= 2 else altos[-2:]
             inter = analise.get("intervalo_usado_segundos")
-            intervalo = int(inter) if isinstance(inter, (int, float)) else diff
+            intervalo = int(inter) if isinstance(inter, (int, float)) else self._intervalo(t1, t2)
             return f"{m1:.2f}x | {m2:.2f}x\nintervalo: {intervalo}s"
 
-        if regra_norm in {"regra_4_minutos", "regra_5_minutos"} and len(altos) >= 1:
-            m, _ = altos[-1]
+        if regra_norm in {"regra_4_minutos", "regra_5_minutos"} and (refs or altos):
+            m, _ = (refs or altos)[-1]
             plus = "+4m" if regra_norm == "regra_4_minutos" else "+5m"
             return f"base: {m:.2f}x {plus}"
 
@@ -168,27 +316,20 @@ class PainelPredit:
         return d
 
     def _build_regra_display(self, data: dict, analise: dict, regra_raw: str) -> tuple[str, str]:
-        mults = data.get("ultimos_60_multiplicadores", []) if isinstance(data, dict) else []
-        parsed = [self._parse_mult_line(x) for x in mults if isinstance(x, str)]
-        parsed = [p for p in parsed if p is not None]
-        altos = [p for p in parsed if p[0] >= 10.0]
+        altos, refs = self._rodadas_regra(data)
         regra_norm = (regra_raw or "").lower()
 
-        if "espelho" in regra_norm and len(altos) >= 2:
-            m1, t1 = altos[-2]
-            m2, t2 = altos[-1]
-            diff = int((t2 - t1).total_seconds())
-            if diff < 0:
-                diff += 24 * 3600
+        if "espelho" in regra_norm and (len(refs) >= 2 or len(altos) >= 2):
+            (m1, t1), (m2, t2) = refs[-2:] if len(refs) >= 2 else altos[-2:]
             inter = analise.get("intervalo_usado_segundos")
-            intervalo = int(inter) if isinstance(inter, (int, float)) else diff
+            intervalo = int(inter) if isinstance(inter, (int, float)) else self._intervalo(t1, t2)
             return (
                 f"Intervalo {intervalo}s",
                 f"{m1:.2f}x ({t1.strftime('%H:%M:%S')}) - {m2:.2f}x ({t2.strftime('%H:%M:%S')})",
             )
 
-        if regra_norm in {"regra_4_minutos", "regra_5_minutos"} and len(altos) >= 1:
-            m, t = altos[-1]
+        if regra_norm in {"regra_4_minutos", "regra_5_minutos"} and (refs or altos):
+            m, t = (refs or altos)[-1]
             if regra_norm == "regra_4_minutos":
                 return ("4 Minutos", f"Referencia: {m:.2f}x ({t.strftime('%H:%M:%S')})")
             return ("5 Minutos", f"Referencia: {m:.2f}x ({t.strftime('%H:%M:%S')})")
@@ -196,7 +337,8 @@ class PainelPredit:
         if "estatistica" in regra_norm:
             if altos:
                 _, last_t = altos[-1]
-                sem_altos_5m = self._seconds_since_time(last_t) > 300
+                desde = self.modelo.segundos_desde(last_t) if self.modelo.valido else self._seconds_since_time(last_t)
+                sem_altos_5m = desde > 300
             else:
                 sem_altos_5m = True
 
@@ -213,38 +355,103 @@ class PainelPredit:
         self._fetching = True
         threading.Thread(target=self._fetch, daemon=True).start()
 
+    def _url_consulta(self, url: str) -> str:
+        # Com o modelo em dia pede so as rodadas depois do cursor (?desde=).
+        cursor = self.modelo.cursor
+        # URL trocada (outro limiar/janela): o modelo e de outra serie, pede tudo de novo.
+        if cursor is None or url != self._url_modelo:
+            return url
+        partes = urllib.parse.urlsplit(url)
+        query = [(k, v) for k, v in urllib.parse.parse_qsl(partes.query) if k != "desde"] + [("desde", str(cursor))]
+        return urllib.parse.urlunsplit(partes._replace(query=urllib.parse.urlencode(query)))
+
     def _fetch(self) -> None:
-        url = self.url_var.get().strip()
-        req = urllib.request.Request(url=url, method="GET")
+        base = self.url_var.get().strip()
+        url = self._url_consulta(base)
+        headers = {"Accept": "application/json"}
+        url_anterior, etag, corpo_anterior = self._ultima_consulta
+        if etag and url == url_anterior:
+            headers["If-None-Match"] = etag
 
         try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                body = resp.read().decode("utf-8")
-                data = json.loads(body)
-                self.root.after(0, self._render_success, data)
-        except urllib.error.HTTPError as e:
-            body = e.read().decode("utf-8", errors="replace")
-            self.root.after(0, self._render_error, f"HTTP {e.code}: {body}")
+            status, cabecalhos, corpo = self.conexao.get(url, headers)
+            # 304 ou o mesmo corpo na mesma URL: nada mudou, a tela fica como esta.
+            if status == 304 or (status == 200 and url == url_anterior and corpo == corpo_anterior):
+                self.root.after(0, self._render_sem_mudanca)
+                return
+            if status != 200:
+                self.root.after(0, self._render_error, f"HTTP {status}: {corpo.decode('utf-8', errors='replace')}")
+                return
+            data = json.loads(corpo.decode("utf-8"))
+            self._ultima_consulta = (url, cabecalhos.get("etag", ""), corpo)
+            self.root.after(0, self._render_success, data, base)
         except Exception as e:
             self.root.after(0, self._render_error, str(e))
 
-    def _render_success(self, data: dict) -> None:
+    def _apply_data(self, data: dict, url_base: str) -> None:
+        if self.modelo.aplicar(data):
+            self._url_modelo = url_base
         analise = data.get("analise_estatistica", {}) if isinstance(data, dict) else {}
         hora = analise.get("hora_prevista") or data.get("hora_prevista") or "--:--:--"
         regra_raw = data.get("regra") or analise.get("regra") or data.get("regra_previsao") or "-"
 
-        self.hora_var.set(str(hora))
         regra_main, regra_sub = self._build_regra_display(data, analise, str(regra_raw))
+        self._eventos = self._proximos_eventos(data, str(hora), str(regra_raw))
+        exibido = (str(hora), regra_main, regra_sub)
+        if exibido == self._exibido:
+            return
+        self._exibido = exibido
+        self.hora_var.set(str(hora))
         self.regra_var.set(regra_main)
         self.regra_sub_var.set(regra_sub)
         self.detalhe_var.set("")
 
-        self.status_var.set("Atualizado")
+    def _proximos_eventos(self, data: dict, hora: str, regra_raw: str) -> list[float]:
+        # Instantes (epoch do relogio do jogo) em que a previsao deve mudar mesmo sem rodada
+        # nova: a hora prevista e as trocas espelho -> 4 min -> 5 min -> estatistica.
+        eventos: list[float] = []
+        agora = datetime.now()
+        try:
+            h = datetime.strptime(hora, "%H:%M:%S")
+        except ValueError:
+            h = None
+        if h is not None:
+            alvo = agora.replace(hour=h.hour, minute=h.minute, second=h.second, microsecond=0)
+            # Horario sem data: o mais perto de agora (virada do dia).
+            if (alvo - agora).total_seconds() > 12 * 3600:
+                alvo -= timedelta(days=1)
+            elif (agora - alvo).total_seconds() > 12 * 3600:
+                alvo += timedelta(days=1)
+            eventos.append((alvo - EPOCH).total_seconds())
+
+        if self.modelo.valido:
+            refs = [self.modelo.ts[i] for i in self.modelo.referencias if 0 <= i < len(self.modelo.ts)]
+            if refs:
+                parametros = data.get("parametros") or {}
+                eventos.append(refs[-1] + float(parametros.get("curta_seg", 240)))
+                eventos.append(refs[-1] + float(parametros.get("longa_seg", 300)))
+                if "espelho" in regra_raw.lower() and len(refs) >= 2:
+                    eventos.append(2 * refs[-1] - refs[-2])
+        return eventos
+
+    def _render_success(self, data: dict, url_base: str) -> None:
+        self._apply_data(data, url_base)
+
+        self._falhas = 0
+        self.status_var.set(f"Atualizado {datetime.now().strftime('%H:%M:%S')}")
+        self.btn_predict.config(state="normal")
+        self._fetching = False
+        self._schedule_auto()
+
+    def _render_sem_mudanca(self) -> None:
+        self._falhas = 0
+        self.status_var.set(f"Sem mudancas {datetime.now().strftime('%H:%M:%S')}")
         self.btn_predict.config(state="normal")
         self._fetching = False
         self._schedule_auto()
 
     def _render_error(self, msg: str) -> None:
+        self._falhas += 1
         self.status_var.set(f"Erro: {msg}")
         self.btn_predict.config(state="normal")
         self._fetching = False
@@ -257,15 +464,129 @@ class PainelPredit:
         else:
             self.status_var.set("Auto desligado")
 
+    # ---------- stream (SSE) ----------
+    def _stream_url(self) -> str | None:
+        # O servidor so publica stream da serie padrao (/bet/10-plus sem parametros); para
+        # outro limiar, janela ou parametro o painel fica no polling.
+        partes = urllib.parse.urlsplit(self.url_var.get().strip())
+        caminho = partes.path.rstrip("/")
+        if not caminho.endswith("/bet/10-plus") or any(k != "desde" for k, _ in urllib.parse.parse_qsl(partes.query)):
+            return None
+        return urllib.parse.urlunsplit(partes._replace(path=caminho + "/stream", query="", fragment=""))
+
+    def _atualizar_toggle_stream(self) -> None:
+        disponivel = self._stream_url() is not None
+        self.stream_check.config(state="normal" if disponivel else "disabled")
+        if not disponivel and self.stream_var.get():
+            self.stream_var.set(False)
+            self._on_toggle_stream()
+
+    def _on_toggle_stream(self) -> None:
+        if self.stream_var.get():
+            self._start_stream()
+        else:
+            self._stream_ativo = False
+            self.status_var.set("Stream desligado")
+            self._schedule_auto(initial=True)
+
+    def _start_stream(self) -> None:
+        if self._stream_thread is not None and self._stream_thread.is_alive():
+            return
+        url = self._stream_url()
+        if url is None:
+            self.stream_var.set(False)
+            self.status_var.set("Stream so existe para /bet/10-plus; usando polling")
+            self._schedule_auto(initial=True)
+            return
+        self.status_var.set("Conectando stream...")
+        self._stream_thread = threading.Thread(target=self._stream_loop, args=(url,), daemon=True)
+        self._stream_thread.start()
+
+    def _stream_loop(self, url: str) -> None:
+        headers = {"Accept": "text/event-stream"}
+        if self._stream_last_id:
+            headers["Last-Event-ID"] = self._stream_last_id
+        req = urllib.request.Request(url=url, headers=headers, method="GET")
+        try:
+            with urllib.request.urlopen(req, timeout=STREAM_TIMEOUT_SEG) as resp:
+                self._stream_ativo = True
+                self.root.after(0, self.status_var.set, "Stream conectado")
+                event_id, data_lines = "", []
+                for raw in resp:
+                    if not self.stream_var.get():
+                        break
+                    line = raw.decode("utf-8").rstrip("\r\n")
+                    if line.startswith(":"):
+                        continue
+                    if line:
+                        field, _, value = line.partition(":")
+                        value = value[1:] if value.startswith(" ") else value
+                        if field == "id":
+                            event_id = value
+                        elif field == "data":
+                            data_lines.append(value)
+                        continue
+                    if data_lines:
+                        data = json.loads("\n".join(data_lines))
+                        if event_id:
+                            self._stream_last_id = event_id
+                        self.root.after(0, self._render_stream, data)
+                    event_id, data_lines = "", []
+        except Exception as e:
+            self.root.after(0, self._on_stream_lost, str(e))
+            return
+        finally:
+            self._stream_ativo = False
+        self.root.after(0, self._on_stream_lost, "conexao encerrada")
+
+    def _render_stream(self, data: dict) -> None:
+        self._apply_data(data, self.url_var.get().strip())
+        self.status_var.set(f"Stream: atualizado {datetime.now().strftime('%H:%M:%S')}")
+
+    def _on_stream_lost(self, msg: str) -> None:
+        if not self.stream_var.get():
+            return
+        # Sem stream: volta ao polling e tenta reconectar mais tarde.
+        self.status_var.set(f"Stream indisponivel ({msg}); usando polling")
+        self._schedule_auto(initial=True)
+        self.root.after(STREAM_RETRY_SEG * 1000, self._retry_stream)
+
+    def _retry_stream(self) -> None:
+        if self.stream_var.get():
+            self._start_stream()
+
     def _schedule_auto(self, initial: bool = False) -> None:
-        if not self.auto_update_var.get() or self._fetching:
+        if not self.auto_update_var.get() or self._fetching or self._stream_ativo:
             return
+        delay_ms = 300 if initial else int(self._proximo_atraso() * 1000)
+        # Um unico agendamento pendente: religar auto/stream nao duplica a cadeia de polling.
+        if self._auto_job is not None:
+            self.root.after_cancel(self._auto_job)
+        self._auto_job = self.root.after(delay_ms, self._run_auto)
+
+    def _proximo_atraso(self) -> float:
+        if self._falhas:
+            return min(BACKOFF_MAX_SEG, BACKOFF_BASE_SEG * 2 ** (self._falhas - 1))
         try:
-            interval = max(2, int(self.interval_var.get()))
+            teto = max(2.0, float(self.interval_var.get()))
         except ValueError:
-            interval = 5
-        delay_ms = 300 if initial else interval * 1000
-        self.root.after(delay_ms, self.on_predict)
+            teto = 30.0
+        agora = (datetime.now() - EPOCH).total_seconds()
+        atraso = teto
+        for evento in self._eventos:
+            falta = evento - agora
+            if -POLL_DEPOIS_SEG <= falta <= POLL_PERTO_SEG:
+                return POLL_MIN_SEG
+            if falta > POLL_PERTO_SEG:
+                # Acorda quando o evento entra na janela de perto.
+                atraso = min(atraso, falta - POLL_PERTO_SEG)
+        return max(POLL_MIN_SEG, atraso)
+
+    def _run_auto(self) -> None:
+        self._auto_job = None
+        if self._stream_ativo:
+            return
+        self.on_predict()
 
     def _on_resize(self, _event: tk.Event) -> None:
         width = self.root.winfo_width()
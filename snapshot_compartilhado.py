@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import signal
+import struct
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+# ================= CONFIG =================
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "predit_snapshot.bin"))
+SNAPSHOT_TAMANHO = int(os.getenv("SNAPSHOT_TAMANHO", str(1 << 20)))
+# Fonte real do processo publicador: "listener", "janela" ou "completo".
+SNAPSHOT_FONTE = os.getenv("SNAPSHOT_FONTE", "listener").strip().lower()
+SNAPSHOT_INTERVALO_SEG = float(os.getenv("SNAPSHOT_INTERVALO_SEG", "2"))
+# Snapshot mais velho que isso vale como ausente nos workers (publicador morto ou travado);
+# sem mudanca o publicador regrava o mesmo conteudo a cada terco desse tempo.
+SNAPSHOT_MAX_IDADE_SEG = float(os.getenv("SNAPSHOT_MAX_IDADE_SEG", "30"))
+
+# Cabecalho: magic (8) | seq (u64) | tamanho do payload (u64) | reservado (8).
+_MAGIC = b"PREDSNP1"
+_CABECALHO = struct.Struct("<8sQQ8x")
+_SEQ = struct.Struct("<Q")
+_TAM = struct.Struct("<Q")
+
+log = logging.getLogger(__name__)
+
+
+# ================= MMAP COM SEQLOCK =================
+# Um unico escritor, varios leitores sem lock: o escritor deixa seq impar enquanto grava
+# e par ao terminar; o leitor repete a leitura se viu seq impar ou se seq mudou no meio.
+class SnapshotMmap:
+    def __init__(self, caminho: str = SNAPSHOT_PATH, tamanho: int = SNAPSHOT_TAMANHO, escrita: bool = False):
+        self.caminho = caminho
+        if escrita:
+            fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != tamanho:
+                    os.ftruncate(fd, tamanho)
+                self._mm = mmap.mmap(fd, tamanho, access=mmap.ACCESS_WRITE)
+            finally:
+                os.close(fd)
+            if self._mm[:8] != _MAGIC:
+                self._mm[: _CABECALHO.size] = _CABECALHO.pack(_MAGIC, 0, 0)
+        else:
+            fd = os.open(caminho, os.O_RDONLY)
+            try:
+                self._mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+            if self._mm[:8] != _MAGIC:
+                raise ValueError(f"arquivo de snapshot invalido: {caminho}")
+        self.capacidade = len(self._mm) - _CABECALHO.size
+
+    def seq(self) -> int:
+        return _SEQ.unpack_from(self._mm, 8)[0]
+
+    def escrever(self, dados: bytes) -> int:
+        if len(dados) > self.capacidade:
+            raise ValueError(f"snapshot com {len(dados)} bytes excede a capacidade de {self.capacidade}")
+        seq = self.seq()
+        seq += 1 if seq % 2 == 0 else 0
+        _SEQ.pack_into(self._mm, 8, seq)
+        _TAM.pack_into(self._mm, 16, len(dados))
+        self._mm[_CABECALHO.size : _CABECALHO.size + len(dados)] = dados
+        _SEQ.pack_into(self._mm, 8, seq + 1)
+        return seq + 1
+
+    def ler(self, tentativas: int = 1000) -> Optional[Tuple[int, bytes]]:
+        for _ in range(tentativas):
+            antes = self.seq()
+            if antes % 2:
+                time.sleep(0)
+                continue
+            tam = _TAM.unpack_from(self._mm, 16)[0]
+            dados = self._mm[_CABECALHO.size : _CABECALHO.size + min(tam, self.capacidade)]
+            if self.seq() == antes:
+                return (antes, dados) if antes else None
+        return None
+
+    def fechar(self) -> None:
+        self._mm.close()
+
+
+class LeitorSnapshot:
+    def __init__(self, caminho: str = SNAPSHOT_PATH, max_idade: float = SNAPSHOT_MAX_IDADE_SEG):
+        self.caminho = caminho
+        self.max_idade = max_idade
+        self._mm: Optional[SnapshotMmap] = None
+        self._ultimo: Tuple[int, Optional[dict]] = (0, None)
+
+    def ler(self) -> Optional[dict]:
+        if self._mm is None:
+            try:
+                self._mm = SnapshotMmap(self.caminho)
+            except (OSError, ValueError):
+                return None
+        seq, dados = self._ultimo
+        # Mesmo seq: reaproveita o payload ja decodificado sem tocar nos dados.
+        if self._mm.seq() == seq:
+            return dados
+        lido = self._mm.ler()
+        if lido is None:
+            return dados
+        dados = json.loads(lido[1])
+        self._ultimo = (lido[0], dados)
+        return dados
+
+    def ler_recente(self) -> Optional[dict]:
+        # O arquivo sobrevive ao publicador: sem regravacao recente a janela esta congelada.
+        dados = self.ler()
+        if dados is None or self.idade(dados) > self.max_idade:
+            return None
+        return dados
+
+    @staticmethod
+    def idade(dados: dict) -> float:
+        return time.time() - dados.get("gerado_em", 0.0)
+
+
+# ================= PUBLICADOR =================
+def _epoch_ou_none(dt: datetime) -> Optional[float]:
+    if dt == datetime.max:
+        return None
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+def montar_snapshot(limite: int = 60, fonte: str = SNAPSHOT_FONTE) -> Tuple[dict, datetime]:
+    import app
+
+    if fonte == "listener":
+        registros, av = app.historico_cache.janela_avaliada(limite)
+    elif fonte == "janela":
+        registros, av = app.carregar_registros_janela(limite), None
+    else:
+        registros, av = app.carregar_registros(limite), None
+    corpo, valido_ate = app.montar_previsao(registros, av)
+    snapshot = {
+        "limite": limite,
+        "gerado_em": time.time(),
+        "ts": registros.ts.tolist(),
+        "mult": registros.mult.tolist(),
+        "previsao": corpo,
+        "valido_ate": _epoch_ou_none(valido_ate),
+    }
+    return snapshot, valido_ate
+
+
+def executar_publicador(caminho: str = SNAPSHOT_PATH, fonte: str = SNAPSHOT_FONTE) -> None:
+    import app
+
+    app.init_firebase()
+    destino = SnapshotMmap(caminho, escrita=True)
+    ultimo: Optional[bytes] = None
+    gravado_em = 0.0
+    while True:
+        versao = app.historico_cache.versao
+        try:
+            snapshot, valido_ate = montar_snapshot(60, fonte)
+            chave = json.dumps({k: snapshot[k] for k in ("ts", "mult", "previsao")}, sort_keys=True).encode()
+            # Mesmo conteudo tambem e regravado de tempos em tempos: gerado_em e o sinal de
+            # vida que os workers conferem.
+            if chave != ultimo or snapshot["gerado_em"] - gravado_em >= SNAPSHOT_MAX_IDADE_SEG / 3:
+                destino.escrever(json.dumps(snapshot, ensure_ascii=False).encode("utf-8"))
+                ultimo, gravado_em = chave, snapshot["gerado_em"]
+            espera = (valido_ate - datetime.now()).total_seconds()
+        except Exception as e:
+            log.warning("snapshot: falha ao publicar: %s", e)
+            espera = SNAPSHOT_INTERVALO_SEG
+        # Com listener a espera termina assim que chega rodada nova.
+        app.historico_cache.aguardar_mudanca(versao, min(max(espera, 0.05), SNAPSHOT_INTERVALO_SEG))
+
+
+# ================= MAIN =================
+def main() -> None:
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    log.info("snapshot: publicando em %s (fonte: %s)", SNAPSHOT_PATH, SNAPSHOT_FONTE)
+    executar_publicador()
+
+
+if __name__ == "__main__":
+    main()
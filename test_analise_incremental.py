@@ -0,0 +1,104 @@
+import random
+import statistics
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+
+# Equivalencia do analisador incremental com a analise da janela inteira: historicos
+# aleatorios (com semente) rodada a rodada, comparando o resultado a cada passo.
+BASE = app.para_epoch(datetime(2024, 1, 1, 12, 0, 0))
+
+
+def _historico(rnd: random.Random, n: int, prob_alto: float = 0.12, prob_mesmo_segundo: float = 0.15) -> app.HistoricoColunar:
+    col = app.HistoricoColunar()
+    ts = BASE
+    for _ in range(n):
+        if rnd.random() >= prob_mesmo_segundo:
+            ts += rnd.randint(1, 90)
+        sorteio = rnd.random()
+        if sorteio < prob_alto:
+            mult = round(rnd.uniform(10, 80), 2)
+        elif sorteio < 0.5:
+            mult = round(rnd.uniform(1.0, 1.3), 2)
+        else:
+            mult = round(rnd.uniform(1.31, 9.99), 2)
+        col.anexar(ts, mult)
+    return col
+
+
+def _comparar(col: app.HistoricoColunar, janela: int, rnd: random.Random) -> int:
+    inc = app.AnalisadorIncremental(janela)
+    comparados = 0
+    for i in range(len(col)):
+        inc.adicionar(col.ts[i], col.mult[i])
+        parcial = app.HistoricoColunar(col.ts[: i + 1], col.mult[: i + 1])
+        # agora antes, durante e depois das janelas do espelho e dos 4/5 minutos.
+        agora = app.de_epoch(col.ts[i]) + timedelta(seconds=rnd.choice([0, 1, 45, 160, 250, 310, 900]))
+        esperado = app.avaliar(parcial.ultimos(janela), agora).resultado
+        assert inc.avaliar(agora).resultado == esperado, (janela, i)
+        comparados += 1
+    return comparados
+
+
+@pytest.mark.parametrize("janela", list(range(1, 61)))
+def test_equivale_a_avaliar_em_todas_as_janelas(janela: int) -> None:
+    rnd = random.Random(janela)
+    assert _comparar(_historico(rnd, janela * 2 + 30), janela, rnd) > 0
+
+
+@pytest.mark.parametrize("semente", range(10))
+def test_rodadas_no_mesmo_segundo(semente: int) -> None:
+    rnd = random.Random(1000 + semente)
+    _comparar(_historico(rnd, 150, prob_mesmo_segundo=0.6), 60, rnd)
+
+
+@pytest.mark.parametrize("semente", range(10))
+def test_alto_saindo_da_janela(semente: int) -> None:
+    # Poucos altos e janela curta: o alto mais antigo sai pela _descartar_mais_antiga
+    # varias vezes, inclusive o unico alto da janela.
+    rnd = random.Random(2000 + semente)
+    col = _historico(rnd, 200, prob_alto=0.05)
+    janela = rnd.randint(5, 25)
+    inc = app.AnalisadorIncremental(janela)
+    saidas = 0
+    for i in range(len(col)):
+        altos_antes = len(inc._altos)
+        inc.adicionar(col.ts[i], col.mult[i])
+        novo_alto = col.mult[i] >= app.PARAMETROS_PADRAO.limiar
+        if i >= janela and len(inc._altos) < altos_antes + novo_alto:
+            saidas += 1
+        parcial = app.HistoricoColunar(col.ts[: i + 1], col.mult[: i + 1])
+        agora = app.de_epoch(col.ts[i]) + timedelta(seconds=rnd.choice([0, 200, 400]))
+        assert inc.avaliar(agora).resultado == app.avaliar(parcial.ultimos(janela), agora).resultado, i
+    assert saidas > 0
+
+
+def test_recarregar_equivale_a_adicionar() -> None:
+    rnd = random.Random(7)
+    col = _historico(rnd, 300)
+    inc = app.AnalisadorIncremental(60)
+    inc.recarregar(col)
+    agora = app.de_epoch(col.ts[-1]) + timedelta(seconds=20)
+    assert inc.avaliar(agora).resultado == app.avaliar(col.ultimos(60), agora).resultado
+
+
+@pytest.mark.parametrize("semente", range(20))
+def test_mediana_deslizante_com_remocoes(semente: int) -> None:
+    rnd = random.Random(3000 + semente)
+    mediana = app.MedianaDeslizante()
+    valores: list = []
+    for _ in range(400):
+        if valores and rnd.random() < 0.45:
+            x = rnd.choice(valores)
+            valores.remove(x)
+            mediana.remover(x)
+        else:
+            # Faixa pequena: muitos repetidos, removidos pela poda preguicosa.
+            x = rnd.randint(1, 12)
+            valores.append(x)
+            mediana.adicionar(x)
+        assert len(mediana) == len(valores)
+        if valores:
+            assert mediana.mediana() == statistics.median(valores)
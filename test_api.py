@@ -0,0 +1,195 @@
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import pytest
+
+import app
+import firebase_local
+import snapshot_compartilhado
+
+
+@pytest.fixture
+def cliente(monkeypatch: pytest.MonkeyPatch) -> Iterator:
+    ontem = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(1, inicio=ontem)}})
+    originais = firebase_local.instalar(app, banco)
+    monkeypatch.setattr(app, "HISTORICO_MODO", "completo")
+    monkeypatch.setattr(app, "previsao_cache", app.PrevisaoCache())
+    with app.app.test_client() as cliente:
+        yield cliente
+    firebase_local.restaurar(app, originais)
+
+
+@pytest.mark.parametrize("desde", ["--5", "²", "abc", "1.5", ""])
+def test_desde_invalido_e_400(cliente, desde: str) -> None:
+    resp = cliente.get("/bet/10-plus", query_string={"desde": desde})
+    assert resp.status_code == 400
+    assert "desde" in resp.get_json()["erro"]
+
+
+def test_desde_valido_devolve_delta(cliente) -> None:
+    cursor = cliente.get("/bet/10-plus").get_json()["cursor"]
+    corpo = cliente.get("/bet/10-plus", query_string={"desde": str(cursor)}).get_json()
+    assert corpo["novos_multiplicadores"] == []
+    assert corpo["serie"]["desde"] == cursor
+
+
+@pytest.mark.parametrize("autorizacao", ["Bearer é", "Bearer errado", ""])
+def test_ingestao_recusa_token_invalido(cliente, monkeypatch: pytest.MonkeyPatch, autorizacao: str) -> None:
+    monkeypatch.setattr(app, "INGESTAO_TOKEN", "segredo")
+    resp = cliente.post("/rodadas", json=["2.00x - 10:00:00"], headers={"Authorization": autorizacao})
+    assert resp.status_code == 401
+
+
+def test_data_provavel_na_virada_do_dia() -> None:
+    agora = datetime(2026, 3, 2, 0, 0, 3)
+    assert app._data_provavel("2.00x - 23:59:58", agora) == "2026-03-01"
+    assert app._data_provavel("2.00x - 00:00:01", agora) == "2026-03-02"
+    assert app._data_provavel("2.00x - 00:00:05", datetime(2026, 3, 1, 23, 59, 59)) == "2026-03-02"
+
+
+def test_ingestao_em_dia_congelado_entra_na_janela(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    # Cache com copia local: dias anteriores ao escutado ficam em _base e sem stream.
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(2, inicio="2026-03-01")}})
+    originais = firebase_local.instalar(app, banco)
+    cache = app.HistoricoCache(arquivo=str(tmp_path / "historico"))
+    monkeypatch.setattr(app, "historico_cache", cache)
+    monkeypatch.setattr(app, "INGESTAO_TOKEN", "segredo")
+    try:
+        assert cache.iniciar(5)
+        assert cache.estado()["dia_escutado"] == "2026-03-02"
+        antes = cache.estado()["rodadas"]
+        with app.app.test_client() as cliente:
+            resp = cliente.post(
+                "/rodadas",
+                json={"data": "2026-03-01", "rodadas": ["77.70x - 23:59:59"]},
+                headers={"Authorization": "Bearer segredo"},
+            )
+        assert resp.status_code == 202
+        assert cache.estado()["rodadas"] == antes + 1
+        hist = cache.registros(10**6)
+        i = hist.ts.index(app.para_epoch(datetime(2026, 3, 1, 23, 59, 59)))
+        assert 77.7 in hist.mult[i : i + 3]
+        # Sobrevive a uma reconstrucao completa a partir de _base + dias escutados.
+        with cache._lock:
+            cache._reconstruir()
+        assert len(cache.registros(10**6)) == antes + 1
+        assert app.escritor_historico.esvaziar(5)
+        assert "77.70x - 23:59:59" in banco.reference("aviator/historico/2026-03-01").get().values()
+    finally:
+        # A fila de gravacao e global: esvazia antes de devolver o banco real.
+        app.escritor_historico.esvaziar(5)
+        cache.parar()
+        firebase_local.restaurar(app, originais)
+
+
+def test_listener_conta_linhas_parseadas(monkeypatch: pytest.MonkeyPatch) -> None:
+    historico = firebase_local.gerar_historico(1, inicio="2026-03-01")
+    historico["2026-03-01"]["-invalida"] = "sem formato"
+    banco = firebase_local.BancoLocal({"aviator": {"historico": historico}})
+    originais = firebase_local.instalar(app, banco)
+    cache = app.HistoricoCache(arquivo=None)
+    linhas = len(historico["2026-03-01"])
+    lidos, falhas = app.REGISTROS_LIDOS.valor(), app.FALHAS_PARSE.valor()
+    try:
+        assert len(cache.registros(10**6)) == linhas - 1
+        assert app.REGISTROS_LIDOS.valor() - lidos == linhas
+        assert app.FALHAS_PARSE.valor() - falhas == 1
+        # Rodada nova pelo stream: uma linha a mais, sem reparsear o dia.
+        banco.reference("aviator/historico/2026-03-01/-nova").set("3.00x - 23:59:59")
+        assert app.REGISTROS_LIDOS.valor() - lidos == linhas + 1
+    finally:
+        cache.parar()
+        firebase_local.restaurar(app, originais)
+
+
+def test_backtest_nao_mexe_nos_contadores() -> None:
+    import backtest
+
+    historico = firebase_local.gerar_historico(1, inicio="2026-03-01")
+    historico["2026-03-01"]["-invalida"] = "sem formato"
+    lidos, falhas = app.REGISTROS_LIDOS.valor(), app.FALHAS_PARSE.valor()
+    assert len(backtest.carregar_arvore(historico)) == len(historico["2026-03-01"]) - 1
+    assert (app.REGISTROS_LIDOS.valor(), app.FALHAS_PARSE.valor()) == (lidos, falhas)
+
+
+def test_contadores_de_parse_aparecem_em_metrics(cliente) -> None:
+    texto = cliente.get("/metrics").get_data(as_text=True)
+    assert "\npredit_registros_lidos_total " in texto
+    assert "\npredit_falhas_parse_total " in texto
+
+
+def test_listener_so_avalia_em_falta_no_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    ontem = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(1, inicio=ontem)}})
+    originais = firebase_local.instalar(app, banco)
+    cache = app.HistoricoCache(arquivo=None)
+    monkeypatch.setattr(app, "historico_cache", cache)
+    monkeypatch.setattr(app, "HISTORICO_MODO", "listener")
+    monkeypatch.setattr(app, "previsao_cache", app.PrevisaoCache())
+    avaliacoes = []
+    original = app.AnalisadorIncremental.avaliar
+    monkeypatch.setattr(app.AnalisadorIncremental, "avaliar", lambda self, *a: avaliacoes.append(1) or original(self, *a))
+    try:
+        cache.iniciar(5)
+        primeira = app.obter_previsao()
+        for _ in range(5):
+            assert app.obter_previsao() is primeira
+        assert len(avaliacoes) == 1
+        assert primeira.corpo["regra"] == app.avaliar(cache.registros(60)).resultado["regra"]
+    finally:
+        cache.parar()
+        firebase_local.restaurar(app, originais)
+
+
+def test_canal_so_le_o_banco_com_assinante(cliente, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app, "STREAM_INTERVALO_SEG", 0.05)
+    monkeypatch.setattr(app, "canal_previsao", app.CanalPrevisao())
+    resp = cliente.get("/bet/10-plus/stream", buffered=False)
+    eventos = iter(resp.response)
+    assert next(eventos).startswith(b"retry:")
+    assert b"event: previsao" in next(eventos)
+    assert app.canal_previsao.assinantes == 1
+    resp.close()
+    assert app.canal_previsao.assinantes == 0
+    # O publicador termina a volta em curso e para; depois disso nenhuma leitura nova.
+    time.sleep(0.2)
+    leituras = app.db.leituras
+    time.sleep(0.5)
+    assert app.db.leituras == leituras
+
+
+def test_stream_acima_do_limite_e_503(cliente, monkeypatch: pytest.MonkeyPatch) -> None:
+    canal = app.CanalPrevisao()
+    monkeypatch.setattr(app, "canal_previsao", canal)
+    monkeypatch.setattr(app, "STREAM_MAX_CONEXOES", 2)
+    # Duas vagas ocupadas por streams de outras threads do servidor.
+    assert canal.assinar(2) and canal.assinar(2)
+    assert not canal.assinar(2)
+    recusado = cliente.get("/bet/10-plus/stream")
+    assert recusado.status_code == 503 and recusado.headers["Retry-After"]
+    assert canal.assinantes == 2
+    canal.cancelar()
+    resp = cliente.get("/bet/10-plus/stream", buffered=False)
+    assert resp.status_code == 200 and canal.assinantes == 2
+    # Fechar sem ler nenhum evento tambem devolve a vaga.
+    resp.close()
+    assert canal.assinantes == 1
+
+
+@pytest.mark.parametrize("idade_seg, do_snapshot", [(1, True), (3600, False)])
+def test_snapshot_velho_cai_no_banco(cliente, monkeypatch: pytest.MonkeyPatch, tmp_path, idade_seg: int, do_snapshot: bool) -> None:
+    caminho = str(tmp_path / "snapshot.bin")
+    snapshot, _ = snapshot_compartilhado.montar_snapshot(60, "completo")
+    snapshot["gerado_em"] -= idade_seg
+    snapshot_compartilhado.SnapshotMmap(caminho, tamanho=1 << 16, escrita=True).escrever(json.dumps(snapshot).encode())
+    monkeypatch.setattr(app, "leitor_snapshot", snapshot_compartilhado.LeitorSnapshot(caminho, max_idade=30))
+    monkeypatch.setattr(app, "HISTORICO_MODO", "compartilhado")
+    leituras = app.db.leituras
+    assert cliente.get("/bet/10-plus").status_code == 200
+    assert (app.db.leituras == leituras) is do_snapshot
+    pronto = cliente.get("/ready")
+    assert pronto.status_code == (200 if do_snapshot else 503)
+    assert pronto.get_json()["snapshot_idade_seg"] >= idade_seg
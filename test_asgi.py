@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+import app
+import asgi
+import firebase_local
+
+
+@pytest.fixture(autouse=True)
+def banco(monkeypatch: pytest.MonkeyPatch) -> Iterator[firebase_local.BancoLocal]:
+    ontem = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(1, inicio=ontem)}})
+    originais = firebase_local.instalar(app, banco)
+    monkeypatch.setattr(app, "HISTORICO_MODO", "completo")
+    monkeypatch.setattr(app, "previsao_cache", app.PrevisaoCache())
+    yield banco
+    firebase_local.restaurar(app, originais)
+
+
+def _get(caminho: str, query: bytes = b"", cabecalhos: Optional[List[Tuple[bytes, bytes]]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    enviados: list = []
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(msg: dict) -> None:
+        enviados.append(msg)
+
+    scope = {"type": "http", "method": "GET", "path": caminho, "query_string": query, "headers": cabecalhos or []}
+    asyncio.run(asgi.aplicacao(scope, receive, send))
+    inicio = enviados[0]
+    headers = {k.decode(): v.decode() for k, v in inicio["headers"]}
+    return inicio["status"], headers, b"".join(m.get("body", b"") for m in enviados[1:])
+
+
+@pytest.mark.parametrize("desde", [b"--5", "²".encode(), b"x"])
+def test_desde_invalido_e_400(desde: bytes) -> None:
+    status, _, _ = _get("/bet/10-plus", b"desde=" + desde)
+    assert status == 400
+
+
+def test_server_timing_opcional() -> None:
+    _, headers, _ = _get("/bet/10-plus")
+    assert "server-timing" not in headers
+
+    _, headers, _ = _get("/bet/10-plus", b"timing=1")
+    estagios = [parte.split(";")[0] for parte in headers["server-timing"].split(", ")]
+    # Estagios do calculo (feitos na thread do single-flight) e o total, como no Flask.
+    assert "fetch" in estagios and estagios[-1] == "total"
+
+    _, headers, _ = _get("/bet/15-plus", cabecalhos=[(b"x-server-timing", b"1")])
+    assert "total;dur=" in headers["server-timing"]
+
+
+def test_etag_e_304() -> None:
+    status, headers, corpo = _get("/bet/10-plus")
+    assert status == 200 and corpo
+    status, _, corpo = _get("/bet/10-plus", cabecalhos=[(b"if-none-match", headers["etag"].encode())])
+    assert status == 304 and corpo == b""
+
+
+def test_stream_libera_o_canal_ao_desconectar(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app, "canal_previsao", app.CanalPrevisao())
+    monkeypatch.setattr(asgi, "ponte_canal", asgi.PonteCanal())
+
+    async def cenario() -> None:
+        desconectar = asyncio.Event()
+        corpos: List[bytes] = []
+
+        async def receive() -> dict:
+            await desconectar.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(msg: dict) -> None:
+            corpos.append(msg.get("body", b""))
+            if b"event: previsao" in corpos[-1]:
+                desconectar.set()
+
+        scope = {"type": "http", "method": "GET", "path": "/bet/10-plus/stream", "query_string": b"", "headers": []}
+        await asgi.aplicacao(scope, receive, send)
+        assert any(b"event: previsao" in c for c in corpos)
+        # Sem clientes a ponte encerra e devolve a assinatura do canal.
+        await asyncio.wait_for(asgi.ponte_canal._tarefa, 5)
+        assert asgi.ponte_canal.clientes == 0
+        assert app.canal_previsao.assinantes == 0
+
+    asyncio.run(cenario())
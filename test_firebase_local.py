@@ -0,0 +1,18 @@
+import threading
+
+import app
+import firebase_local
+
+
+def test_close_encerra_a_thread_da_escuta() -> None:
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(1)}})
+    ref = banco.reference("aviator/historico")
+    antes = threading.active_count()
+    for _ in range(50):
+        escuta = ref.listen(lambda evento: None)
+        assert app.HistoricoCache._escuta_ativa(escuta)
+        escuta.close()
+        # Escuta fechada aparece morta, como no SDK: o cache consegue reabrir.
+        assert not app.HistoricoCache._escuta_ativa(escuta)
+    assert threading.active_count() == antes
+    assert not banco._escutas
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+BASE = app.para_epoch(datetime(2024, 1, 1, 10, 0, 0))
+
+
+@pytest.mark.parametrize(
+    "mult, texto",
+    [(9.999, "9.999x"), (12.3, "12.30x"), (10.0, "10.00x"), (1.005, "1.005x"), (2.5, "2.50x")],
+)
+def test_raw_nao_arredonda(mult: float, texto: str) -> None:
+    col = app.HistoricoColunar()
+    col.anexar(BASE, mult)
+    assert col.raw(0) == f"{texto} - 10:00:00"
+    # Volta pelo parser com o mesmo valor.
+    assert app.parse_linha(col.raw(0), "2024-01-01").mult == mult
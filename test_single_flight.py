@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import pytest
+
+import app
+import firebase_local
+
+N = 30
+
+
+@pytest.fixture
+def banco(monkeypatch: pytest.MonkeyPatch) -> Iterator[firebase_local.BancoLocal]:
+    # Banco local lento o bastante para todas as requisicoes chegarem com a leitura em voo.
+    ontem = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    banco = firebase_local.BancoLocal({"aviator": {"historico": firebase_local.gerar_historico(1, inicio=ontem)}}, 0.3)
+    originais = firebase_local.instalar(app, banco)
+    monkeypatch.setattr(app, "HISTORICO_MODO", "completo")
+    monkeypatch.setattr(app, "coalescedor", app.SingleFlight(0))
+    monkeypatch.setattr(app, "previsao_cache", app.PrevisaoCache())
+    yield banco
+    firebase_local.restaurar(app, originais)
+
+
+def test_requisicoes_simultaneas_fazem_uma_leitura(banco: firebase_local.BancoLocal) -> None:
+    barreira = threading.Barrier(N)
+    resultados: list = []
+    erros: list = []
+
+    def requisicao() -> None:
+        barreira.wait()
+        try:
+            resultados.append(app.previsao_coalescida())
+        except BaseException as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=requisicao) for _ in range(N)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not erros
+    assert banco.leituras == 1
+    assert app.coalescedor.execucoes == 1
+    assert app.coalescedor.coalescidas == N - 1
+    assert all(r is resultados[0] for r in resultados)
+
+
+def test_erro_do_lider_vai_para_todas() -> None:
+    voo = app.SingleFlight(0)
+    barreira = threading.Barrier(5)
+    liberar = threading.Event()
+    erros: list = []
+
+    def falhar() -> None:
+        liberar.wait(5)
+        raise RuntimeError("banco fora")
+
+    def requisicao() -> None:
+        barreira.wait()
+        try:
+            voo.executar("chave", falhar)
+        except RuntimeError as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=requisicao) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while voo.chamadas < 5:
+        time.sleep(0.01)
+    liberar.set()
+    for t in threads:
+        t.join()
+    assert len(erros) == 5
+    assert voo.execucoes == 1
+
+
+def test_recentes_vencidos_saem(monkeypatch: pytest.MonkeyPatch) -> None:
+    relogio = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: relogio[0])
+    voo = app.SingleFlight(janela_seg=1.0)
+    for i in range(50):
+        voo.executar(("parametros", i), lambda: i)
+    assert len(voo._recentes) == 50
+    assert voo.executar(("parametros", 3), lambda: -1) == 3
+
+    relogio[0] += 2.0
+    voo.executar(("parametros", "novo"), lambda: 0)
+    assert list(voo._recentes) == [("parametros", "novo")]